@@ -0,0 +1,517 @@
+"""
+Benchmark Suite for the ReAct Agent
+
+This script measures the latency and memory of the filesystem tools and the tool call parser on generated
+trees of any size, together with the size of the observations the agent would receive. The results are
+written as a JSON report, so runs on different commits can be compared.
+
+Suites:
+1. tools: The tools and the tool call parser on a generated tree.
+2. parser: The tool call parser against the original regex and ast.literal_eval parser on large mappings.
+3. importtime: The startup time of the command line entry points and the heaviest imports, with -X importtime.
+4. invoke: The p50 and p99 latency and the failures of LLM calls against a stub backend with a slow tail and
+   errors, called directly, with retries and with retries and hedging.
+
+Usage:
+    python benchmark.py --files 1000 10000 100000
+    python benchmark.py --suite parser --files 10000 100000
+    python benchmark.py --suite importtime --repeat 5
+    python benchmark.py --suite invoke --files 1000
+    python benchmark.py --files 1000000 --depth 3 --fan-out 20 --output reports/1m.json
+    python benchmark.py --files 10000 --output after.json --compare before.json
+"""
+import os
+import re
+import ast
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils import generate_directory_tree, extract_tool, estimate_tokens, ToolCallStreamParser
+from src.encoding import encoding_token_counts
+from src.index import RACY_SECONDS
+from src.backends import ScriptedBackend
+from src.resilience import InvocationPolicy, ResilientBackend
+from src.tools import get_working_directory, create_directory, move_files, use_working_directory, set_directory_index
+
+# Number of directories created by the create_directory benchmark
+CREATED_DIRECTORIES = 100
+
+# Largest move_files mapping benchmarked, bigger trees only move this many files
+MAX_MOVED_FILES = 50000
+
+
+def measure_time(function: Callable, repeat: int = 1):
+    """
+    Run a function and measure its wall time.
+
+    Args:
+        function: The function to run, without arguments.
+        repeat: Number of runs, the fastest one is reported.
+
+    Returns:
+        tuple: The result of the last run and the fastest wall time in seconds.
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def measure_memory(function: Callable):
+    """
+    Run a function once under tracemalloc and measure its peak of allocated memory.
+
+    Args:
+        function: The function to run, without arguments.
+
+    Returns:
+        tuple: The result and the peak memory in bytes.
+    """
+    tracemalloc.start()
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def record(benchmark: str, files: int, seconds: float, peak_memory: int, observation=None) -> dict:
+    """Build one result of the report, with the size of the observation the agent would receive."""
+    result = {
+        "benchmark": benchmark,
+        "files": files,
+        "seconds": round(seconds, 6),
+        "peak_memory_bytes": peak_memory
+    }
+    if observation is not None:
+        text = f"Observation: {observation}"
+        result["observation_bytes"] = len(text.encode())
+        result["observation_tokens"] = estimate_tokens(text)
+        # Tokens of the same result in the compact encoding and as JSON, for comparison
+        result["encoding_tokens"] = encoding_token_counts(observation)
+    print(f"  {benchmark:<32} {seconds * 1000:>12.2f} ms {peak_memory / 1024 / 1024:>10.2f} MiB {result.get('observation_bytes', 0):>12} B")
+    return result
+
+
+def list_files(tree: dict) -> list[str]:
+    """Return the agent paths of all files of a get_working_directory result."""
+    return [
+        f"{directory}/{name}"
+        for directory, contents in tree.items() if directory.startswith("root")
+        for name in contents if f"{directory}/{name}" not in tree
+    ]
+
+
+def run_tools_suite(file_count: int, depth: int, fan_out: int, repeat: int) -> list[dict]:
+    """
+    Benchmark the tools and the tool call parser on a generated tree.
+
+    Args:
+        file_count: Number of files of the generated tree.
+        depth: Number of directory levels of the generated tree.
+        fan_out: Number of subdirectories per directory of the generated tree.
+        repeat: Number of runs of the read-only benchmarks.
+
+    Returns:
+        list: The results of the suite.
+    """
+    results = []
+    base_directory = tempfile.mkdtemp(prefix="react_agent_benchmark_")
+    tree_directory = os.path.join(base_directory, "tree")
+
+    try:
+        _, seconds = measure_time(lambda: generate_directory_tree(tree_directory, file_count, depth, fan_out))
+        print(f"\n{file_count} files, depth {depth}, fan-out {fan_out} (generated in {seconds:.1f} s)")
+
+        with use_working_directory(tree_directory):
+            # Full snapshot and the first page the agent gets by default
+            tree, seconds = measure_time(lambda: get_working_directory(limit=None), repeat)
+            _, peak = measure_memory(lambda: get_working_directory(limit=None))
+            results.append(record("get_working_directory_full", file_count, seconds, peak, tree))
+
+            page, seconds = measure_time(get_working_directory, repeat)
+            _, peak = measure_memory(get_working_directory)
+            results.append(record("get_working_directory_page", file_count, seconds, peak, page))
+
+            # The persistent index is built once, later listings only stat the directories
+            set_directory_index(True)
+            try:
+                _, seconds = measure_time(lambda: get_working_directory(limit=None))
+                results.append(record("index_build", file_count, seconds, 0))
+
+                # Directories modified this recently are rescanned on every refresh, wait until they are settled
+                time.sleep(RACY_SECONDS)
+                get_working_directory(limit=None)
+
+                _, seconds = measure_time(lambda: get_working_directory(limit=None), repeat)
+                _, peak = measure_memory(lambda: get_working_directory(limit=None))
+                results.append(record("get_working_directory_indexed_full", file_count, seconds, peak))
+
+                _, seconds = measure_time(get_working_directory, repeat)
+                _, peak = measure_memory(get_working_directory)
+                results.append(record("get_working_directory_indexed_page", file_count, seconds, peak))
+            finally:
+                set_directory_index(False)
+
+            # Create directories, the memory is measured on a second batch of the same size
+            created = [f"root/benchmark_{index}" for index in range(CREATED_DIRECTORIES)]
+            observation, seconds = measure_time(lambda: create_directory(created))
+            _, peak = measure_memory(lambda: create_directory([f"root/benchmark_extra_{index}" for index in range(CREATED_DIRECTORIES)]))
+            results.append(record("create_directory", file_count, seconds, peak, observation))
+
+            # Move files into the new directories, the memory is measured on moving them back
+            files = list_files(tree)[:MAX_MOVED_FILES]
+            forward = {path: created[index % len(created)] for index, path in enumerate(files)}
+            backward = {f"{created[index % len(created)]}/{path.rsplit('/', 1)[1]}": path.rsplit("/", 1)[0] for index, path in enumerate(files)}
+            observation, seconds = measure_time(lambda: move_files(forward))
+            _, peak = measure_memory(lambda: move_files(backward))
+            results.append(record("move_files", len(files), seconds, peak, observation))
+
+            # Parse the tool call of the same mapping
+            response = f"Think: I will move the files.\nTool: move_files({json.dumps(forward)})\nPAUSE"
+            _, seconds = measure_time(lambda: extract_tool(response), repeat)
+            _, peak = measure_memory(lambda: extract_tool(response))
+            results.append(record("extract_tool", len(files), seconds, peak))
+
+    finally:
+        shutil.rmtree(base_directory, ignore_errors=True)
+
+    return results
+
+
+def legacy_extract_tool(llm_response: str) -> dict:
+    """The original tool call parser: a non-greedy regex compiled on every call and ast.literal_eval."""
+    match = re.search(r'Tool:\s*(\w+)\((.*?)\)', llm_response, re.DOTALL)
+    if not match:
+        return {"tool": None, "args": None}
+    tool_args = match.group(2).strip()
+    if not tool_args:
+        return {"tool": match.group(1), "args": None}
+    try:
+        return {"tool": match.group(1), "args": ast.literal_eval(tool_args)}
+    except (ValueError, SyntaxError):
+        return {"tool": match.group(1), "args": None}
+
+
+def stream_tool_call(llm_response: str, chunk_size: int = 16) -> dict | None:
+    """Feed a response to the streaming parser in chunks of a few tokens, like a streamed completion."""
+    parser = ToolCallStreamParser()
+    for start in range(0, len(llm_response), chunk_size):
+        parser.feed(llm_response[start:start + chunk_size])
+    return parser.tool_call
+
+
+def run_parser_suite(file_count: int, depth: int, fan_out: int, repeat: int) -> list[dict]:
+    """
+    Benchmark the tool call parsers on a move_files call with one entry per file.
+
+    Args:
+        file_count: Number of entries of the mapping.
+        depth: Number of directory levels of the paths.
+        fan_out: Number of destination folders.
+        repeat: Number of runs of every parser.
+
+    Returns:
+        list: The results of the suite, "parsed" tells if the parser returned the whole mapping.
+    """
+    results = []
+    print(f"\n{file_count} entry move_files mapping")
+
+    # Plain names, and names with parentheses that end the original regex early
+    plain = {
+        "/".join(["root"] + [f"folder_{level}" for level in range(depth)] + [f"file_{index}.pdf"]): f"root/documents_{index % fan_out}"
+        for index in range(file_count)
+    }
+    parenthesized = {f"root/file ({index}).pdf": destination for index, destination in enumerate(plain.values())}
+
+    cases = [
+        ("json", f"Think: I will move the files.\nTool: move_files({json.dumps(plain)})\nPAUSE", plain),
+        ("python", f"Think: I will move the files.\nTool: move_files({plain!r})\nPAUSE", plain),
+        ("parentheses", f"Think: I will move the files.\nTool: move_files({json.dumps(parenthesized)})\nPAUSE", parenthesized),
+    ]
+    parsers = [("extract_tool", extract_tool), ("legacy_extract_tool", legacy_extract_tool), ("stream_parser", stream_tool_call)]
+
+    for case, response, expected in cases:
+        for name, parser in parsers:
+            tool_call, seconds = measure_time(lambda: parser(response), repeat)
+            _, peak = measure_memory(lambda: parser(response))
+            result = record(f"{name}_{case}", file_count, seconds, peak)
+            result["parsed"] = bool(tool_call) and tool_call["args"] == expected
+            results.append(result)
+
+    return results
+
+
+# Modules whose import is timed, the entry points and the modules worker processes start from
+IMPORT_TARGETS = ["demo", "setup_test_directory", "benchmark", "src.agent_loop", "src.tools"]
+
+# Number of the slowest imports listed per target
+HEAVIEST_IMPORTS = 5
+
+
+def parse_importtime(output: str, target: str) -> tuple[int, dict[str, int]]:
+    """
+    Read the import time of a module and of the modules it imports from the stderr of python -X importtime.
+
+    Args:
+        output: The stderr of the interpreter, lines like "import time:  self [us] | cumulative | package".
+        target: The module imported by the interpreter.
+
+    Returns:
+        tuple: The cumulative microseconds of the target and of each module the target imports directly.
+    """
+    children = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+
+        # The column starts with one space, two more per level of nesting, an import is listed after its imports
+        module = fields[2][1:].rstrip()
+        level = (len(module) - len(module.lstrip(" "))) // 2
+        if level == 1:
+            children[module.strip()] = int(fields[1])
+        elif level == 0:
+            if module == target:
+                return int(fields[1]), children
+            children = {}
+    return 0, {}
+
+
+def run_importtime_suite(file_count: int, depth: int, fan_out: int, repeat: int) -> list[dict]:
+    """
+    Benchmark the startup of the entry points, each imported in a fresh interpreter.
+
+    Args:
+        file_count: Unused, the suite does not depend on the size of a tree.
+        depth: Unused.
+        fan_out: Unused.
+        repeat: Number of fresh interpreters per target, the fastest run is reported.
+
+    Returns:
+        list: The results of the suite, with the import time of the target and its heaviest imports.
+    """
+    results = []
+    repository = os.path.dirname(os.path.abspath(__file__))
+    print("\nImport time of the entry points (fastest of each)")
+
+    for target in IMPORT_TARGETS:
+        runs = []
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                cwd=repository, capture_output=True, text=True
+            )
+            seconds = time.perf_counter() - started
+            runs.append((seconds, process))
+
+        seconds, process = min(runs, key=lambda run: run[0])
+        result = record(f"import_{target}", 0, seconds, 0)
+        if process.returncode != 0:
+            result["error"] = process.stderr.strip().splitlines()[-1]
+            results.append(result)
+            continue
+
+        microseconds, children = parse_importtime(process.stderr, target)
+        result["import_microseconds"] = microseconds
+        result["heaviest_imports"] = dict(sorted(children.items(), key=lambda item: -item[1])[:HEAVIEST_IMPORTS])
+        results.append(result)
+
+    return results
+
+
+# Stub backend of the invoke suite: 20 ms per call, 2% of the calls 400 ms slower and 5% of them failing
+INVOKE_LATENCY = 0.02
+INVOKE_JITTER = 0.01
+INVOKE_SLOW_RATE = 0.02
+INVOKE_SLOW_LATENCY = 0.4
+INVOKE_ERROR_RATE = 0.05
+
+# Number of LLM calls of the invoke suite running at the same time
+INVOKE_CONCURRENCY = 16
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Return the q-quantile of a list of values by the nearest rank."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_invoke_suite(file_count: int, depth: int, fan_out: int, repeat: int) -> list[dict]:
+    """
+    Benchmark the latency of LLM calls with and without the invocation policies of src/resilience.py.
+
+    Every variant makes the same number of calls against a stub backend with injected latency, a slow tail
+    and errors. A failed call counts as failed at the time it failed, a retried call at the time it succeeded.
+
+    Args:
+        file_count: Number of calls per variant, 1000 if 0.
+        depth: Unused.
+        fan_out: Unused.
+        repeat: Unused, the percentiles are taken over the calls.
+
+    Returns:
+        list: The results of the suite, with the p50, p99 and maximum latency and the number of failed calls.
+    """
+    calls = file_count or 1000
+    messages = [{"role": "user", "content": "Please organize my directory."}]
+    variants = {
+        "invoke_direct": None,
+        "invoke_retry": InvocationPolicy(timeout=1.0, backoff_base=0.01),
+        "invoke_retry_hedge": InvocationPolicy(timeout=1.0, backoff_base=0.01, hedge=True),
+    }
+    results = []
+    # Every injected error would log a retry warning
+    logging.getLogger("src.resilience").setLevel(logging.ERROR)
+    print(f"\n{calls} LLM calls, {INVOKE_CONCURRENCY} at a time (p50 / p99 / max ms, failures)")
+
+    for benchmark, policy in variants.items():
+        stub = ScriptedBackend(
+            latency=INVOKE_LATENCY, jitter=INVOKE_JITTER, seed=7,
+            slow_rate=INVOKE_SLOW_RATE, slow_latency=INVOKE_SLOW_LATENCY, error_rate=INVOKE_ERROR_RATE
+        )
+        backend = ResilientBackend(stub, policy, max_workers=4 * INVOKE_CONCURRENCY, seed=7) if policy else stub
+
+        def call(_) -> tuple[float, bool]:
+            started = time.perf_counter()
+            try:
+                backend.complete(messages, model="stub", temperature=0)
+                return time.perf_counter() - started, True
+            except Exception:
+                return time.perf_counter() - started, False
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=INVOKE_CONCURRENCY) as executor:
+            outcomes = list(executor.map(call, range(calls)))
+        seconds = time.perf_counter() - started
+        if policy:
+            backend.close()
+
+        latencies = [latency for latency, _ in outcomes]
+        result = record(benchmark, calls, seconds, 0)
+        result.update({
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "max_ms": round(max(latencies) * 1000, 3),
+            "failures": sum(not ok for _, ok in outcomes),
+            "backend_responses": stub.calls
+        })
+        print(f"    p50 {result['p50_ms']:.1f} / p99 {result['p99_ms']:.1f} / max {result['max_ms']:.1f}, {result['failures']} failed, {result['backend_responses']} responses")
+        results.append(result)
+
+    return results
+
+
+# Benchmark suites by name, every suite takes the size of the tree and returns its results
+SUITES = {
+    "tools": run_tools_suite,
+    "parser": run_parser_suite,
+    "importtime": run_importtime_suite,
+    "invoke": run_invoke_suite,
+}
+
+
+def current_commit() -> str | None:
+    """Return the short hash of the checked out commit, None outside a git repository."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_reports(baseline: dict, report: dict) -> None:
+    """
+    Print how every result of a report changed against a baseline report.
+
+    Args:
+        baseline: The report to compare against, e.g. of the previous commit.
+        report: The new report.
+    """
+    previous = {(result["benchmark"], result["files"]): result for result in baseline["results"]}
+
+    print(f"\nCompared to {baseline['meta'].get('commit')} (ratio new / old, lower is better)")
+    for result in report["results"]:
+        old = previous.get((result["benchmark"], result["files"]))
+        if old is None:
+            continue
+        ratios = []
+        for metric in ("seconds", "peak_memory_bytes", "observation_bytes", "import_microseconds", "p50_ms", "p99_ms"):
+            if old.get(metric) and metric in result:
+                ratios.append(f"{metric} x{result[metric] / old[metric]:.2f}")
+        print(f"  {result['benchmark']:<32} {result['files']:>9}  {', '.join(ratios)}")
+
+
+def main():
+    """Main function to run the benchmarks."""
+    parser = argparse.ArgumentParser(description="Benchmark the ReAct agent tools on generated trees")
+    parser.add_argument(
+        "--suite",
+        choices=sorted(SUITES),
+        default="tools",
+        help="Benchmark suite to run (default: tools)"
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        nargs="+",
+        default=[1000, 10000],
+        help="Number of files of the generated trees, one run per value (default: 1000 10000)"
+    )
+    parser.add_argument("--depth", type=int, default=2, help="Directory levels of the generated trees (default: 2)")
+    parser.add_argument("--fan-out", type=int, default=10, help="Subdirectories per directory (default: 10)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the read-only benchmarks (default: 3)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Compare the results with this earlier JSON report")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "suite": args.suite,
+            "commit": current_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "depth": args.depth,
+            "fan_out": args.fan_out
+        },
+        "results": []
+    }
+
+    # The import times do not depend on the size of a tree, they are measured once
+    sizes = [0] if args.suite == "importtime" else args.files
+    for file_count in sizes:
+        report["results"].extend(SUITES[args.suite](file_count, args.depth, args.fan_out, args.repeat))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare_reports(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
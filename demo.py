@@ -6,81 +6,411 @@ Run this script to see the agent in action with a pre-configured test directory.
 
 Usage:
     python demo.py
+    python demo.py --directories dir1 dir2 dir3 --max-concurrency 2
+    python demo.py --stream
+    python demo.py --token-budget 8000
+    python demo.py --cache-dir .llm_cache
+    python demo.py --offline --latency 0.5 --jitter 0.2
+    python demo.py --offline --latency 0.5 --error-rate 0.2 --timeout 5 --hedge
+    python demo.py --route --max-cost 0.05 --max-seconds 120
+    python demo.py --checkpoint
+    python demo.py --resume
+    python demo.py --dry-run
+    python demo.py --virtual
+    python demo.py --offline --transcript transcript.json
+    python demo.py --rules rules.json
+    python demo.py --shard-size 500 --max-concurrency 16
+    python demo.py --plan
+    python demo.py --trace trace.jsonl --metrics metrics.prom
+    python demo.py --index
+    python demo.py --sniff
 """
+import asyncio
 import argparse
-from openai import OpenAI
+from typing import Callable
 
-from src.react_agent import Agent
-from src.config.config import config
-from src.utils import extract_tool
+from src.cache import ResponseCache
+from src.memory import ConversationMemory
+from src.classifier import FileClassifier
+from src.react_agent import Agent, AsyncAgent
+from src.backends import OpenAIBackend, AsyncOpenAIBackend, ScriptedBackend, AsyncScriptedBackend, create_openai_client
+from src.agent_loop import AgentSession, run_agent_loop, run_sessions, run_plan_mode, resume_agent_loop
+from src.checkpoint import SessionCheckpoint
+from src.sharding import run_sharded
+from src.resilience import InvocationPolicy, ResilientBackend, AsyncResilientBackend
+from src.routing import ModelRouter, RoutingBudget
 from src.config.logging_config import get_logger
-from src.prompts import chain_of_thought_system_message
-from src.tools import get_working_directory, create_directory, move_files
+from src.vfs import VirtualFileSystem
+from src.tools import (
+    WORKING_DIRECTORY, set_directory_index, set_content_features, use_virtual_filesystem, preview_changes, commit_changes
+)
+from src.tracing import Tracer, use_tracer
+from src.encoding import OBSERVATION_ENCODINGS, set_observation_encoding
+from src.prompts import chain_of_thought_system_message, shard_system_message, plan_system_message, compact_encoding_note, content_features_note
 
 logger = get_logger(__name__)
 
-# Tool registry mapping tool names to their functions
-tool_registry = {
-    "get_working_directory": get_working_directory,
-    "create_directory": create_directory,
-    "move_files": move_files
-}
 
+def run_concurrent_sessions(
+    directories: list[str],
+    user_message: str,
+    max_concurrency: int,
+    agent_factory: Callable[[], AsyncAgent],
+    classifier: FileClassifier | None = None
+) -> None:
+    """
+    Organize several directories concurrently in one event loop.
 
-def run_agent_loop(agent: Agent, user_message: str) -> None:
+    Args:
+        directories: The directories to organize.
+        user_message: The user message sent to every session.
+        max_concurrency: Maximum number of sessions running at the same time.
+        agent_factory: Creates the AsyncAgent of each session.
+        classifier: Places the obvious files of every directory before its agent runs, None to skip.
     """
-    Run the agent loop: send message, extract tool calls, execute tools, repeat.
+    sessions = [AgentSession(directory, user_message) for directory in directories]
+    results = asyncio.run(run_sessions(sessions, agent_factory=agent_factory, max_concurrency=max_concurrency, classifier=classifier))
+
+    for session, result in zip(sessions, results):
+        print("=" * 40, session.working_directory, "=" * 40)
+        print(result)
+        print()
+
+
+def main():
+    """Main function to run the demo."""
+    parser = argparse.ArgumentParser(description="Run the ReAct agent on a messy directory")
+    parser.add_argument(
+        "--directories",
+        nargs="+",
+        help="Organize these directories concurrently instead of working_directory"
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=50,
+        help="Maximum number of sessions, or sub-agents with --shard-size, running at the same time (default: 50)"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions, stop them at PAUSE and start each tool as soon as its call is parsed"
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        help="Compact old observations to keep the message history under this many tokens"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Cache LLM responses in this directory and reuse them for repeated message histories"
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Use the local scripted backend instead of the OpenAI API"
+    )
+    parser.add_argument(
+        "--transcript",
+        help="With --offline, replay the assistant messages of this recorded transcript (JSON message list)"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="With --offline, seconds of latency injected into every response"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="With --offline, up to this many seconds added to the latency at random"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="With --offline, share of the requests that fail with a connection error"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="Abandon and retry LLM calls that take longer than this many seconds"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        help="Retry failed LLM calls this many times with jittered exponential backoff (default with --timeout or --hedge: 3)"
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate LLM request when the first is slower than the recent p95, the first answer wins"
+    )
+    parser.add_argument(
+        "--route",
+        action="store_true",
+        help="Pick the model of every step: a fast model for the easy steps, a strong one for the taxonomy decisions"
+    )
+    parser.add_argument(
+        "--max-cost",
+        type=float,
+        help="With --route, dollars the LLM calls of a session may cost before it only uses the fast model"
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        help="With --route, seconds the LLM calls of a session may take before it only uses the fast model"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Save the history and the applied operations after every step, so a run that dies can be resumed"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume the run that a crash or Ctrl+C stopped from its checkpoint, or start a new checkpointed one"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Run the agent against an in-memory copy of the directory and print the changes without applying them"
+    )
+    parser.add_argument(
+        "--virtual",
+        action="store_true",
+        help="Run the agent against an in-memory copy of the directory and apply the final changes in one pass"
+    )
+    parser.add_argument(
+        "--rules",
+        help="Move files with an obvious type by rules before the agent runs, learning the rules into this JSON file"
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        help="Organize huge directories in parallel shards of at most this many files, applied in one batch"
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Organize with one plan from a single LLM call, falling back to the step by step loop if it is invalid"
+    )
+    parser.add_argument(
+        "--encoding",
+        choices=OBSERVATION_ENCODINGS,
+        default="repr",
+        help="Encoding of directory trees in observations, compact lists each directory once (default: repr)"
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="List the tree from a persistent index next to the directory, refreshed only where it changed"
+    )
+    parser.add_argument(
+        "--sniff",
+        action="store_true",
+        help="Describe the content of the listed files, the real type and the first line of text, to the model"
+    )
+    parser.add_argument(
+        "--trace",
+        help="Record a span per LLM call and tool call and write them to this JSONL file"
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Write the totals of the spans to this file in the Prometheus text format"
+    )
+    args = parser.parse_args()
+    if (args.dry_run or args.virtual) and (args.directories or args.checkpoint or args.resume):
+        parser.error("--dry-run and --virtual run a single directory in memory, without --directories or checkpoints")
+
+    # Tracing is only on when its output is asked for, the summary table is printed at the end
+    tracer = Tracer() if args.trace or args.metrics else None
+
+    # The tools only touch the in-memory tree, the disk is changed at the end if at all
+    filesystem = VirtualFileSystem(WORKING_DIRECTORY) if args.dry_run or args.virtual else None
+    with use_tracer(tracer), use_virtual_filesystem(filesystem):
+        organize(args)
+        if filesystem:
+            report_changes(apply=args.virtual)
+
+    if tracer:
+        print(f"\n{tracer.summary()}")
+        if args.trace:
+            tracer.export_jsonl(args.trace)
+        if args.metrics:
+            tracer.export_prometheus(args.metrics)
+
+
+def invocation_policy(args: argparse.Namespace) -> InvocationPolicy | None:
+    """
+    Build the invocation policy of the LLM calls selected on the command line.
 
     Args:
-        agent: The ReAct agent instance.
-        user_message: The initial user message to the agent.
+        args: The parsed command line arguments.
+
+    Returns:
+        InvocationPolicy | None: The policy, None to call the backend directly.
     """
-    response = agent(user_message)
-    print("=" * 40, "AI Message", "=" * 40)
-    print(response)
-    print()
+    if args.timeout is None and args.retries is None and not args.hedge:
+        return None
+    policy = InvocationPolicy(timeout=args.timeout, hedge=args.hedge)
+    if args.retries is not None:
+        policy.max_retries = args.retries
+    return policy
 
-    # Continue loop while agent requests tool execution
-    while response.endswith("PAUSE"):
-        tool_call = extract_tool(response)
 
-        if tool_call["tool"] not in tool_registry:
-            logger.error(f"Tool {tool_call['tool']} not found in tool registry.")
-            break
+def make_router(args: argparse.Namespace) -> ModelRouter | None:
+    """
+    Build the model router of a session selected on the command line.
 
-        tool_function = tool_registry[tool_call["tool"]]
+    Args:
+        args: The parsed command line arguments.
 
-        # Execute tool with or without arguments
-        if tool_call["args"]:
-            tool_result = tool_function(tool_call["args"])
-        else:
-            tool_result = tool_function()
+    Returns:
+        ModelRouter | None: A router with the budget of one session, None to use the default model everywhere.
+    """
+    if not args.route:
+        return None
+    return ModelRouter(budget=RoutingBudget(max_cost=args.max_cost, max_seconds=args.max_seconds))
 
-        print("=" * 40, "Tool Result", "=" * 40)
-        print(tool_result)
-        print()
 
-        # Send tool result back to the agent
-        response = agent(f"Observation: {tool_result}")
-        print("=" * 40, "AI Message", "=" * 40)
-        print(response)
-        print()
+def report_changes(apply: bool) -> None:
+    """
+    Print the changes of a run against the in-memory tree, and apply them to disk.
 
+    Args:
+        apply: True to apply the changes in one pass, False for a dry run.
+    """
+    changes = commit_changes() if apply else preview_changes()
+    if "msg" in changes:
+        print(f"\nUnfortunately, I couldn't apply the changes: {changes['msg']}")
+        return
+
+    print(f"\n{'Applied' if apply else 'Dry run, would apply'}: {len(changes['created'])} new directories, {len(changes['moved'])} moves")
+    for directory in changes["created"]:
+        print(f"  + {directory}")
+    for source, destination in changes["moved"].items():
+        print(f"  {source} -> {destination}")
+
+
+def organize(args: argparse.Namespace) -> None:
+    """
+    Organize the directories with the mode selected on the command line.
+
+    Args:
+        args: The parsed command line arguments.
+    """
+    # The system messages explain the compact encoding and the content features to the model
+    system_message, planner_message = chain_of_thought_system_message, plan_system_message
+    set_observation_encoding(args.encoding)
+    set_directory_index(args.index)
+    if args.encoding == "compact":
+        system_message = f"{system_message}\n\n{compact_encoding_note}"
+        planner_message = f"{planner_message}\n\n{compact_encoding_note}"
+    set_content_features(args.sniff)
+    if args.sniff:
+        system_message = f"{system_message}\n\n{content_features_note}"
+        planner_message = f"{planner_message}\n\n{content_features_note}"
 
-def main():
-    """Main function to run the demo."""
     user_message = "Please organize my directory and make it more clear and professional."
 
-    # Initialize OpenAI client and agent
-    client = OpenAI(api_key=config.openai_api_key.get_secret_value())
+    def make_memory() -> ConversationMemory | None:
+        return ConversationMemory(token_budget=args.token_budget) if args.token_budget else None
+
+    # One cache is shared by every agent of the run
+    cache = ResponseCache(directory=args.cache_dir) if args.cache_dir else None
+
+    # Deadlines, retries and hedging wrap whichever backend is used
+    policy = invocation_policy(args)
+
+    # One classifier is shared as well, the rules it learns are saved after the run
+    classifier = FileClassifier(args.rules) if args.rules else None
+
+    if args.directories:
+        if args.offline:
+            async_backend = AsyncScriptedBackend(args.transcript, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+        else:
+            async_backend = AsyncOpenAIBackend(create_openai_client(asynchronous=True))
+        if policy:
+            async_backend = AsyncResilientBackend(async_backend, policy)
+        print(f"User Message: {user_message}\n")
+        run_concurrent_sessions(
+            args.directories,
+            user_message,
+            args.max_concurrency,
+            agent_factory=lambda: AsyncAgent(
+                system_message=system_message,
+                backend=async_backend,
+                streaming=args.stream,
+                memory=make_memory(),
+                cache=cache,
+                router=make_router(args)
+            ),
+            classifier=classifier
+        )
+        if classifier:
+            classifier.save()
+        if cache:
+            print(f"Cache: {cache.stats()}")
+        return
+
+    # Initialize the backend and agent
+    if args.offline:
+        backend = ScriptedBackend(args.transcript, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    else:
+        backend = OpenAIBackend(create_openai_client())
+    if policy:
+        backend = ResilientBackend(backend, policy)
+
+    # The agents of one session share the router, so they share its budget
+    router = make_router(args)
+    checkpoint = SessionCheckpoint(WORKING_DIRECTORY) if args.checkpoint or args.resume else None
+
+    if args.shard_size:
+        print(f"User Message: {user_message}\n")
+        result = run_sharded(
+            agent_factory=lambda: Agent(system_message=shard_system_message, backend=backend, cache=cache, router=router),
+            shard_size=args.shard_size,
+            max_workers=args.max_concurrency
+        )
+        if "msg" in result:
+            print(f"Unfortunately, I couldn't organize your directory due to an error: {result['msg']}")
+        else:
+            print(
+                f"Organized {len(result['moved'])} files in {result['shards']} shards, "
+                f"{len(result['created'])} directories created, {len(result['rejected'])} entries rejected"
+            )
+        return
+
     agent = Agent(
-        system_message=chain_of_thought_system_message,
-        openai_client=client
+        system_message=system_message,
+        backend=backend,
+        streaming=args.stream,
+        memory=make_memory(),
+        cache=cache,
+        router=router
     )
 
     # Run the agent
     print(f"User Message: {user_message}\n")
-    run_agent_loop(agent, user_message)
+    if args.plan:
+        planner = Agent(system_message=planner_message, backend=backend, cache=cache, router=router)
+        print(run_plan_mode(planner, agent, user_message, classifier))
+    elif args.resume and checkpoint.exists:
+        resume_agent_loop(agent, checkpoint, classifier)
+    else:
+        run_agent_loop(agent, user_message, classifier, checkpoint)
+
+    if classifier:
+        classifier.save()
+
+    if cache:
+        print(f"\nCache: {cache.stats()}")
+    if router:
+        print(f"\nRouting: {router.stats()}")
+    if agent.memory:
+        print(f"\nMemory: {agent.memory.total_tokens_saved} prompt tokens saved over {len(agent.memory.calls)} calls")
 
     print("\nDemo completed! Check the /working_directory folder to see the organized files: cd working_directory && ls")
 
@@ -0,0 +1,122 @@
+"""
+Agent Server
+
+This script runs the agent as a long-running server, so many short organization requests share one warm
+process instead of each paying for a new interpreter, configuration, OpenAI client and TLS handshake.
+
+Usage:
+    python server.py --socket /tmp/react-agent.sock
+    python server.py --port 8765 --workers 8 --queue-size 128
+    python server.py --offline --root ./sandboxes --trace
+
+    curl --unix-socket /tmp/react-agent.sock -X POST http://localhost/jobs -d '{"directory": "working_directory"}'
+    curl --unix-socket /tmp/react-agent.sock "http://localhost/jobs/<id>?wait=30"
+"""
+import argparse
+
+from src.tools import set_directory_index, set_content_features
+from src.tracing import Tracer
+from src.cache import ResponseCache
+from src.server import AgentServer, DEFAULT_WORKERS, DEFAULT_QUEUE_SIZE
+from src.classifier import FileClassifier
+from src.react_agent import Agent
+from src.backends import OpenAIBackend, ScriptedBackend, create_openai_client
+from src.resilience import InvocationPolicy, ResilientBackend
+from src.routing import ModelRouter, RoutingBudget
+from src.config.logging_config import get_logger
+from src.encoding import OBSERVATION_ENCODINGS, set_observation_encoding
+from src.prompts import chain_of_thought_system_message, plan_system_message, compact_encoding_note, content_features_note
+
+logger = get_logger(__name__)
+
+
+def main():
+    """Main function to run the server."""
+    parser = argparse.ArgumentParser(description="Serve organization jobs from a warm agent process")
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of a TCP port")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Number of jobs running at the same time (default: {DEFAULT_WORKERS})"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=f"Number of waiting jobs before new jobs are refused with 503 (default: {DEFAULT_QUEUE_SIZE})"
+    )
+    parser.add_argument("--root", help="Only organize directories inside this directory")
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Use the local scripted backend instead of the OpenAI API"
+    )
+    parser.add_argument("--cache-dir", help="Cache LLM responses in this directory, shared by every job")
+    parser.add_argument("--rules", help="Move files with an obvious type by rules, learning the rules into this JSON file")
+    parser.add_argument(
+        "--encoding",
+        choices=OBSERVATION_ENCODINGS,
+        default="repr",
+        help="Encoding of directory trees in observations (default: repr)"
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="List trees from persistent indexes, kept warm across jobs and refreshed only where they changed"
+    )
+    parser.add_argument(
+        "--sniff",
+        action="store_true",
+        help="Describe the content of the listed files to the model, cached across jobs"
+    )
+    parser.add_argument("--timeout", type=float, default=60.0, help="Abandon and retry LLM calls that take longer than this many seconds (default: 60)")
+    parser.add_argument("--hedge", action="store_true", help="Send a duplicate LLM request when the first is slower than the recent p95")
+    parser.add_argument("--route", action="store_true", help="Pick the model of every step, a strong model only for the taxonomy decisions")
+    parser.add_argument("--max-cost", type=float, help="With --route, dollars the LLM calls of a job may cost before it only uses the fast model")
+    parser.add_argument("--trace", action="store_true", help="Trace the jobs and serve the metrics on /metrics")
+    args = parser.parse_args()
+
+    system_message, planner_message = chain_of_thought_system_message, plan_system_message
+    set_observation_encoding(args.encoding)
+    set_directory_index(args.index)
+    if args.encoding == "compact":
+        system_message = f"{system_message}\n\n{compact_encoding_note}"
+        planner_message = f"{planner_message}\n\n{compact_encoding_note}"
+    set_content_features(args.sniff)
+    if args.sniff:
+        system_message = f"{system_message}\n\n{content_features_note}"
+        planner_message = f"{planner_message}\n\n{content_features_note}"
+
+    # Created once and shared by every job: the client keeps its connections alive between requests, and a
+    # stalled request must not hold a worker forever
+    backend = ScriptedBackend() if args.offline else OpenAIBackend(create_openai_client())
+    backend = ResilientBackend(backend, InvocationPolicy(timeout=args.timeout, hedge=args.hedge), max_workers=2 * args.workers)
+    cache = ResponseCache(directory=args.cache_dir) if args.cache_dir else None
+
+    def make_router() -> ModelRouter | None:
+        return ModelRouter(budget=RoutingBudget(max_cost=args.max_cost)) if args.route else None
+
+    server = AgentServer(
+        agent_factory=lambda: Agent(system_message=system_message, backend=backend, cache=cache, router=make_router()),
+        planner_factory=lambda: Agent(system_message=planner_message, backend=backend, cache=cache, router=make_router()),
+        classifier=FileClassifier(args.rules) if args.rules else None,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        root=args.root,
+        tracer=Tracer() if args.trace else None
+    )
+
+    try:
+        if args.socket:
+            server.serve_unix(args.socket)
+        else:
+            server.serve_tcp(args.host, args.port)
+    except KeyboardInterrupt:
+        logger.info("Server stopped")
+
+
+if __name__ == "__main__":
+    main()
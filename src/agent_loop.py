@@ -0,0 +1,588 @@
+"""
+Agent Loop
+
+This module implements the ReAct loop that drives an agent: send the message, extract the tool calls,
+execute the tools, send the observations back and repeat until the agent stops asking for tools.
+
+A response may hold several Tool lines. Read-only calls run concurrently, a call that changes the tree
+waits for the calls before it and the calls after it wait for it, and all the results are sent back in
+one observation.
+
+Functions:
+1. run_agent_loop(agent, user_message, classifier): Runs the loop for a synchronous Agent.
+2. run_agent_loop_async(agent, user_message, classifier): Runs the loop for an AsyncAgent, tools run in a thread.
+3. run_sessions(sessions, agent_factory, max_concurrency, classifier): Runs many async sessions in one event loop.
+4. run_plan_mode(planner, agent, user_message, classifier): Organizes the tree with one plan, falling back to the loop.
+5. resume_agent_loop(agent, checkpoint, classifier): Resumes a session that stopped partway from its checkpoint.
+
+With a FileClassifier, the files its rules place confidently are moved before the agent starts, and the
+agent is skipped altogether when no ambiguous files are left.
+
+With a SessionCheckpoint (see src/checkpoint.py), the synchronous loop persists its history after every LLM
+call and journals the calls that change the tree, so a run that dies partway can be resumed.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import asyncio
+import logging
+import contextvars
+from typing import Any, Callable
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from src.utils import extract_tools
+from src.react_agent import Agent, AsyncAgent
+from src.classifier import FileClassifier, classification_message
+from src.planning import Plan, parse_plan, validate_plan, apply_plan
+from src.tracing import span, traced, tool_attributes
+from src.encoding import format_observation, format_observations
+from src.checkpoint import SessionCheckpoint
+from src.tools import (
+    get_working_directory, create_directory, move_files, find_duplicates, use_working_directory,
+    tree_version, recover_interrupted_moves, unapplied_moves, record_moves, moved_paths_var
+)
+
+logger = logging.getLogger(__name__)
+
+# Tool registry mapping tool names to their functions
+tool_registry = {
+    "get_working_directory": get_working_directory,
+    "create_directory": create_directory,
+    "move_files": move_files,
+    "find_duplicates": find_duplicates
+}
+
+# Tools that take several parameters, for the other tools a tuple of arguments is one list of paths
+MULTI_PARAMETER_TOOLS = {"get_working_directory"}
+
+# Tools that only read the tree and can run at the same time as each other
+READ_ONLY_TOOLS = {"get_working_directory", "find_duplicates"}
+
+# Default number of sessions run_sessions drives at the same time
+DEFAULT_MAX_CONCURRENCY = 50
+
+# Number of tool calls of one response running at the same time
+DEFAULT_TOOL_WORKERS = 4
+
+
+@dataclass
+class AgentSession:
+    """An organization job: the directory to organize and the user message for the agent."""
+    working_directory: str
+    user_message: str
+
+
+def execute_tool(tool_call: dict):
+    """
+    Execute a tool call returned by extract_tools.
+
+    Args:
+        tool_call: A dictionary containing the tool name and arguments.
+
+    Returns:
+        The result of the tool.
+    """
+    tool_function = tool_registry[tool_call["tool"]]
+
+    with span(tool_call["tool"], "tool") as tool_span:
+        # Execute tool with or without arguments, a tuple holds several positional arguments
+        try:
+            if isinstance(tool_call["args"], tuple) and tool_call["tool"] in MULTI_PARAMETER_TOOLS:
+                result = tool_function(*tool_call["args"])
+            elif tool_call["args"]:
+                result = tool_function(tool_call["args"])
+            else:
+                result = tool_function()
+        except TypeError as e:
+            logger.warning(f"Malformed call of {tool_call['tool']}: {e}")
+            result = {"msg": f"Failed to call {tool_call['tool']}, check its arguments: {e}"}
+
+        if tool_span is not None:
+            tool_span.set(observation_bytes=len(format_observation(result).encode()), **tool_attributes(result))
+        return result
+
+
+class ToolDispatcher:
+    """
+    Starts the tool calls of one response as they come in, keeping the calls that change the tree in order.
+
+    Read-only calls start right away, unless a mutating call before them is still running. A mutating call
+    starts once every call before it has finished, so e.g. a move_files after a create_directory sees
+    the new folders.
+    """
+    def __init__(self, start: Callable[[dict, list], Any]) -> None:
+        """
+        Initializes the dispatcher.
+
+        Args:
+            start: Starts a tool call once the given handles have finished and returns the handle of the call.
+        """
+        self.start = start
+        self.calls: list[tuple[dict, Any]] = []
+        self._barrier = None
+        self._readers = []
+
+
+    def submit(self, tool_call: dict) -> None:
+        """
+        Start a tool call after the calls it depends on.
+
+        Args:
+            tool_call: A dictionary containing the tool name and arguments.
+        """
+        if tool_call["tool"] not in tool_registry:
+            logger.error(f"Tool {tool_call['tool']} not found in tool registry.")
+            self.calls.append((tool_call, None))
+            return
+
+        after = [self._barrier] if self._barrier is not None else []
+        if tool_call["tool"] in READ_ONLY_TOOLS:
+            handle = self.start(tool_call, after)
+            self._readers.append(handle)
+        else:
+            handle = self.start(tool_call, after + self._readers)
+            self._barrier = handle
+            self._readers = []
+        self.calls.append((tool_call, handle))
+
+
+    @property
+    def runnable(self) -> bool:
+        """Check if at least one of the calls is a known tool."""
+        return any(handle is not None for _, handle in self.calls)
+
+
+def _unknown_tool(tool_call: dict) -> dict:
+    """Return the result reported for a call of a tool that does not exist."""
+    return {"msg": f"Tool {tool_call['tool']} not found"}
+
+
+def _observation(results: list) -> str:
+    """Build the observation message, the results of several calls are listed in the order of the calls."""
+    if len(results) == 1:
+        return f"Observation: {format_observation(results[0])}"
+    return f"Observation: {format_observations(results)}"
+
+
+def _execute_after(after: list[Future], tool_call: dict):
+    """Execute a tool call once the calls it depends on have finished."""
+    wait(after)
+    return execute_tool(tool_call)
+
+
+async def _execute_after_async(after: list[asyncio.Task], tool_call: dict):
+    """Execute a tool call in a worker thread once the calls it depends on have finished."""
+    if after:
+        await asyncio.wait(after)
+    return await asyncio.to_thread(execute_tool, tool_call)
+
+
+def _preclassify(classifier: FileClassifier, user_message: str) -> tuple[str | None, str]:
+    """
+    Run the classification stage before the agent.
+
+    Args:
+        classifier: The classifier to apply.
+        user_message: The initial user message to the agent.
+
+    Returns:
+        tuple: The message for the agent, or None if nothing is left for it, and a summary of the stage.
+    """
+    result = classifier.apply()
+    summary = f"{len(result.moved)} files organized by rules, {len(result.ambiguous)} left to the agent"
+    if result.error:
+        logger.warning(f"Classification failed, the agent organizes every file: {result.error}")
+        return user_message, summary
+    if result.moved and not result.ambiguous:
+        return None, f"Output: Your directory has been organized successfully. {summary}."
+    return classification_message(user_message, result), summary
+
+
+def _learn(classifier: FileClassifier, moved: set[str]) -> None:
+    """Let the classifier learn from the files the agent moved in the tree it left behind."""
+    tree = get_working_directory(limit=None)
+    if "msg" not in tree:
+        classifier.learn_from_tree(tree, moved)
+
+
+def _execute_checkpointed(after: list[Future], tool_call: dict, checkpoint: SessionCheckpoint, key: tuple[int, int]):
+    """
+    Execute a tool call after the calls it depends on and journal it if it changes the tree.
+
+    A call that is already in the journal of a resumed session is not run again, its recorded result is
+    returned instead, and moves that were applied before they could be journaled are dropped.
+    """
+    wait(after)
+    if tool_call["tool"] in READ_ONLY_TOOLS:
+        return execute_tool(tool_call)
+
+    recorded = checkpoint.result(key, tool_call)
+    if recorded is not None:
+        logger.info(f"Skipping {tool_call['tool']} of step {key[0]}, it was applied before the restart")
+        return recorded
+
+    # The call is journaled as the agent made it, so a regenerated response can be compared against it
+    call = tool_call
+    applied = {}
+    if tool_call["tool"] == "move_files" and isinstance(tool_call["args"], dict):
+        pending, applied = unapplied_moves(tool_call["args"])
+        if applied:
+            logger.info(f"{len(applied)} moves of step {key[0]} were applied before the restart")
+            call = {"tool": tool_call["tool"], "args": pending}
+
+    if applied and not call["args"]:
+        result = {"moved": applied, "version": tree_version()}
+    else:
+        result = execute_tool(call)
+        if applied and "moved" in result:
+            # Report the whole mapping, as the agent asked for it
+            result["moved"] = {**applied, **result["moved"]}
+    checkpoint.record(key, tool_call, result)
+    return result
+
+
+def _drive_loop(
+    agent: Agent,
+    user_message: str | None,
+    checkpoint: SessionCheckpoint | None = None,
+    response: str | None = None
+) -> str:
+    """
+    Run the loop from a user message, or from a response whose tool calls have not been answered yet.
+
+    Args:
+        agent: The ReAct agent instance.
+        user_message: The message to send first, None to start from the response.
+        checkpoint: Saves the history after every LLM call and journals the mutating tool calls, None to skip.
+        response: The last response of a resumed session, used when there is no user message.
+
+    Returns:
+        str: The last response of the agent.
+    """
+    with ThreadPoolExecutor(max_workers=DEFAULT_TOOL_WORKERS) as executor:
+        def start(tool_call: dict, after: list[Future]) -> Future:
+            # Run the tool in a copy of this context to keep the session's working directory
+            if checkpoint is None:
+                return executor.submit(contextvars.copy_context().run, _execute_after, after, tool_call)
+            key = checkpoint.next_key()
+            return executor.submit(contextvars.copy_context().run, _execute_checkpointed, after, tool_call, checkpoint, key)
+
+        def send(text: str) -> tuple[str, ToolDispatcher]:
+            dispatcher = ToolDispatcher(start)
+            if checkpoint:
+                checkpoint.begin_step(sum(message["role"] == "assistant" for message in agent.messages))
+            reply = agent(text, on_tool_call=dispatcher.submit)
+            if checkpoint:
+                checkpoint.save(agent.messages, tree_version())
+            print("=" * 40, "AI Message", "=" * 40)
+            print(reply)
+            print()
+            return reply, dispatcher
+
+        if user_message is not None:
+            response, dispatcher = send(user_message)
+        else:
+            # The tool calls of the resumed response are submitted again below, with the keys they had
+            dispatcher = ToolDispatcher(start)
+            if checkpoint:
+                checkpoint.begin_step(sum(message["role"] == "assistant" for message in agent.messages) - 1)
+
+        # Continue loop while agent requests tool execution
+        while response.endswith("PAUSE"):
+            if not dispatcher.calls:
+                for tool_call in extract_tools(response):
+                    dispatcher.submit(tool_call)
+
+            if not dispatcher.runnable:
+                break
+
+            tool_results = [
+                handle.result() if handle is not None else _unknown_tool(tool_call)
+                for tool_call, handle in dispatcher.calls
+            ]
+            print("=" * 40, "Tool Result", "=" * 40)
+            for tool_result in tool_results:
+                print(tool_result)
+            print()
+
+            # Send tool results back to the agent
+            response, dispatcher = send(_observation(tool_results))
+
+    # The session is complete, nothing is left to resume
+    if checkpoint:
+        checkpoint.clear()
+    return response
+
+
+@traced("agent_loop")
+def run_agent_loop(
+    agent: Agent,
+    user_message: str,
+    classifier: FileClassifier | None = None,
+    checkpoint: SessionCheckpoint | None = None
+) -> str:
+    """
+    Run the agent loop: send message, extract tool calls, execute tools, repeat.
+
+    A streaming agent hands over each tool call as soon as it is parsed, so the tools already run
+    on the executor while the rest of the response is still being generated.
+
+    Args:
+        agent: The ReAct agent instance.
+        user_message: The initial user message to the agent.
+        classifier: Places the obvious files before the agent runs and learns from the result, None to skip.
+        checkpoint: Persists the progress after every step so resume_agent_loop can pick it up, None to skip.
+            A checkpoint left by an earlier run is discarded.
+
+    Returns:
+        str: The last response of the agent.
+    """
+    if checkpoint:
+        checkpoint.clear()
+
+    if classifier:
+        user_message, summary = _preclassify(classifier, user_message)
+        print("=" * 40, "Classifier", "=" * 40)
+        print(summary)
+        print()
+        if user_message is None:
+            return summary
+
+    # The rules' own moves are not recorded, the classifier only learns from the agent's
+    with record_moves() as moved:
+        response = _drive_loop(agent, user_message, checkpoint)
+
+    if classifier:
+        _learn(classifier, moved)
+
+    return response
+
+
+@traced("agent_loop")
+def resume_agent_loop(agent: Agent, checkpoint: SessionCheckpoint, classifier: FileClassifier | None = None) -> str | None:
+    """
+    Resume a session that stopped partway from its checkpoint.
+
+    The agent gets the saved history back, move batches that were interrupted midway are rolled back, and
+    the loop goes on from the last step: a pending observation is sent again, the tool calls of a pending
+    response are run again except the ones that were already applied.
+
+    Args:
+        agent: A fresh ReAct agent with the same system message as the stopped one.
+        checkpoint: The checkpoint of the stopped session.
+        classifier: Learns from the organized tree at the end, None to skip.
+
+    Returns:
+        str | None: The last response of the agent, None if there is no checkpoint to resume.
+    """
+    state = checkpoint.load()
+    if state is None:
+        logger.info(f"No checkpoint to resume in {checkpoint.directory}")
+        return None
+
+    rolled_back = recover_interrupted_moves()
+    version = tree_version()
+    if version != state["version"]:
+        logger.warning(f"Tree changed since the checkpoint ({state['version']} -> {version}, {rolled_back} moves rolled back)")
+    logger.info(f"Resuming from step {sum(message['role'] == 'assistant' for message in state['messages'])}, {len(checkpoint.operations)} operations applied")
+
+    agent.messages = state["messages"]
+    last = agent.messages[-1]
+    with record_moves() as moved:
+        # The moves applied before the process died belong to the session as well
+        for key in sorted(checkpoint.operations):
+            operation = checkpoint.operations[key]
+            if operation["tool"] == "move_files" and isinstance(operation["result"], dict):
+                moved.difference_update(operation["result"].get("moved", {}))
+                moved.update(operation["result"].get("moved", {}).values())
+
+        if last["role"] == "user":
+            # The process died while waiting for the response to this message
+            agent.messages.pop()
+            response = _drive_loop(agent, last["content"], checkpoint)
+        else:
+            response = _drive_loop(agent, None, checkpoint, response=last["content"])
+
+    if classifier:
+        _learn(classifier, moved)
+
+    return response
+
+
+@traced("agent_loop")
+async def run_agent_loop_async(agent: AsyncAgent, user_message: str, classifier: FileClassifier | None = None) -> str:
+    """
+    Run the agent loop for an AsyncAgent.
+
+    The filesystem tools block, so they run in a worker thread. asyncio.to_thread copies the current
+    context, which keeps the working directory of the session visible to the tools.
+
+    Args:
+        agent: The async ReAct agent instance.
+        user_message: The initial user message to the agent.
+        classifier: Places the obvious files before the agent runs and learns from the result, None to skip.
+
+    Returns:
+        str: The last response of the agent.
+    """
+    if classifier:
+        user_message, summary = await asyncio.to_thread(_preclassify, classifier, user_message)
+        logger.debug(f"Classifier: {summary}")
+        if user_message is None:
+            return summary
+
+    def start(tool_call: dict, after: list[asyncio.Task]) -> asyncio.Task:
+        return asyncio.ensure_future(_execute_after_async(after, tool_call))
+
+    # Set in the context of the session, the tool threads get a copy that holds the same set
+    moved_token = moved_paths_var.set(set())
+    dispatcher = ToolDispatcher(start)
+    response = await agent(user_message, on_tool_call=dispatcher.submit)
+    logger.debug(f"AI Message: {response}")
+
+    # Continue loop while agent requests tool execution
+    while response.endswith("PAUSE"):
+        if not dispatcher.calls:
+            for tool_call in extract_tools(response):
+                dispatcher.submit(tool_call)
+
+        if not dispatcher.runnable:
+            break
+
+        tool_results = [
+            await handle if handle is not None else _unknown_tool(tool_call)
+            for tool_call, handle in dispatcher.calls
+        ]
+        logger.debug(f"Tool Results: {tool_results}")
+
+        # Send tool results back to the agent
+        dispatcher = ToolDispatcher(start)
+        response = await agent(_observation(tool_results), on_tool_call=dispatcher.submit)
+        logger.debug(f"AI Message: {response}")
+
+    moved = moved_paths_var.get()
+    moved_paths_var.reset(moved_token)
+    if classifier:
+        await asyncio.to_thread(_learn, classifier, moved)
+
+    return response
+
+
+async def run_sessions(
+    sessions: list[AgentSession],
+    agent_factory: Callable[[], AsyncAgent],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    classifier: FileClassifier | None = None
+) -> list:
+    """
+    Run many organization sessions in one event loop, at most max_concurrency at a time.
+
+    Args:
+        sessions: The sessions to run.
+        agent_factory: Creates a fresh AsyncAgent for each session, usually sharing one client.
+        max_concurrency: Maximum number of sessions running at the same time.
+        classifier: Shared by every session to place the obvious files before its agent runs, None to skip.
+
+    Returns:
+        list: The last response of each session, or the exception it failed with, in input order.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_session(session: AgentSession) -> str:
+        async with semaphore:
+            # Each task runs in its own context, so this only changes the directory of this session
+            with use_working_directory(session.working_directory):
+                return await run_agent_loop_async(agent_factory(), session.user_message, classifier)
+
+    results = await asyncio.gather(*(run_session(session) for session in sessions), return_exceptions=True)
+
+    failed = sum(isinstance(result, BaseException) for result in results)
+    logger.info(f"{len(sessions) - failed} of {len(sessions)} sessions completed successfully")
+    for session, result in zip(sessions, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Session on {session.working_directory} failed: {result}")
+
+    return results
+
+
+def _checked_plan(response: str, tree: dict) -> Plan | None:
+    """Parse the plan of a planner response and validate it, None if it is malformed or would not apply cleanly."""
+    try:
+        plan = parse_plan(response)
+    except ValueError as e:
+        logger.warning(f"Planner returned no valid plan: {e}")
+        return None
+
+    checked, errors = validate_plan(plan, tree)
+    if errors:
+        logger.warning(f"Plan rejected, {len(errors)} entries would not apply: {errors}")
+        return None
+    return checked
+
+
+@traced("plan_mode")
+def run_plan_mode(planner: Agent, agent: Agent, user_message: str, classifier: FileClassifier | None = None) -> str:
+    """
+    Organize the working directory with a single plan instead of a step by step loop.
+
+    The planner gets the whole tree in one message and answers with the complete plan, which is validated
+    against the tree and applied in one batch, so the common case takes a single LLM call. If the tree
+    does not fit on one page, or the plan is malformed, would not apply cleanly or fails, the ReAct loop
+    takes over with the agent.
+
+    Args:
+        planner: An agent with the plan prompt as its system message.
+        agent: The ReAct agent to fall back to.
+        user_message: The initial user message to the agent.
+        classifier: Places the obvious files before planning and learns from the result, None to skip.
+
+    Returns:
+        str: The summary of the applied plan, or the last response of the fallback loop.
+    """
+    if classifier:
+        user_message, summary = _preclassify(classifier, user_message)
+        print("=" * 40, "Classifier", "=" * 40)
+        print(summary)
+        print()
+        if user_message is None:
+            return summary
+
+    def fall_back() -> str:
+        # The classifier has placed its files already, it only learns from the moves of the loop and the plan
+        with record_moves() as moved:
+            response = run_agent_loop(agent, user_message)
+        if classifier:
+            _learn(classifier, moved)
+        return response
+
+    tree = get_working_directory()
+    if "msg" in tree or "next_cursor" in tree:
+        logger.info("Tree cannot be planned from one page, running the ReAct loop")
+        return fall_back()
+
+    response = planner(f"{user_message}\nObservation: {format_observation(tree)}")
+    print("=" * 40, "Plan", "=" * 40)
+    print(response)
+    print()
+
+    plan = _checked_plan(response, tree)
+    if plan is None:
+        return fall_back()
+
+    with record_moves() as moved:
+        result = apply_plan(plan)
+    print("=" * 40, "Tool Result", "=" * 40)
+    print(result)
+    print()
+    if "msg" in result:
+        return fall_back()
+
+    if classifier:
+        _learn(classifier, moved)
+
+    if not plan.moves:
+        return "Output: Your directory is already organized."
+    folders = len(set(plan.moves.values()))
+    return f"Output: Your directory has been organized successfully. {len(result['moved'])} files were moved into {folders} folders."
@@ -0,0 +1,433 @@
+"""
+LLM Backends
+
+This module implements the backends the agent talks to. A backend takes the message history and returns a
+Completion (the response text and its token usage), or streams the response text chunk by chunk.
+
+Here is the list of available backends:
+1. OpenAIBackend / AsyncOpenAIBackend: Send the messages to the OpenAI chat completions API.
+2. ScriptedBackend / AsyncScriptedBackend: Local stand-ins for offline runs and load tests. They either
+   replay the assistant messages of a recorded transcript, or generate deterministic tool calls from the
+   tree they observe, as well as plans for plan mode and sharded runs. Latency, jitter, a slow tail and
+   errors can be injected to profile the agent loop, the tools and the invocation policies of
+   src/resilience.py in isolation.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import os
+import ast
+import json
+import time
+import random
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Protocol, Iterator, AsyncIterator
+
+from src.utils import estimate_tokens
+from src.encoding import decode_tree
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Completion:
+    """The response of a backend and the token usage of the request."""
+    content: str
+    model: str
+    usage: dict = field(default_factory=dict)
+
+
+class LLMBackend(Protocol):
+    """A blocking LLM backend."""
+    def complete(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Completion:
+        """Return the completion of the messages."""
+        ...
+
+    def stream(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Iterator[str]:
+        """Yield the completion of the messages chunk by chunk, closing the generator cancels the request."""
+        ...
+
+
+class AsyncLLMBackend(Protocol):
+    """An asyncio LLM backend."""
+    async def complete(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Completion:
+        """Return the completion of the messages."""
+        ...
+
+    def stream(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> AsyncIterator[str]:
+        """Yield the completion of the messages chunk by chunk, closing the generator cancels the request."""
+        ...
+
+
+def _usage(completion) -> dict:
+    """Read the token usage of an OpenAI completion, including prompt tokens served from the prompt cache."""
+    if completion.usage is None:
+        return {}
+
+    details = getattr(completion.usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": completion.usage.prompt_tokens,
+        "completion_tokens": completion.usage.completion_tokens,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0
+    }
+
+
+def _request(model: str, temperature: float, messages: list[dict], stop: list[str] | None) -> dict:
+    """Build the keyword arguments of a chat completions request."""
+    request = {"model": model, "temperature": temperature, "messages": messages}
+    if stop:
+        request["stop"] = stop
+    return request
+
+
+def create_openai_client(asynchronous: bool = False):
+    """
+    Create an OpenAI client, importing openai and validating the API key only now so offline runs need neither.
+
+    The client keeps its HTTP connections alive, so a process that makes many requests should create it once.
+
+    Args:
+        asynchronous: Create an AsyncOpenAI client instead of an OpenAI client.
+
+    Returns:
+        The OpenAI or AsyncOpenAI client.
+    """
+    from openai import OpenAI, AsyncOpenAI
+    from src.config.config import get_config
+
+    api_key = get_config().require_openai_api_key()
+    return AsyncOpenAI(api_key=api_key) if asynchronous else OpenAI(api_key=api_key)
+
+
+class OpenAIBackend:
+    """Sends the messages to the OpenAI chat completions API."""
+    def __init__(self, openai_client) -> None:
+        """
+        Initializes the backend.
+
+        Args:
+            openai_client: The OpenAI client to send the requests with.
+        """
+        self.client = openai_client
+
+
+    def complete(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Completion:
+        """Return the completion of the messages."""
+        completion = self.client.chat.completions.create(**_request(model, temperature, messages, stop))
+        return Completion(completion.choices[0].message.content, completion.model, _usage(completion))
+
+
+    def stream(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Iterator[str]:
+        """Yield the completion of the messages chunk by chunk."""
+        stream = self.client.chat.completions.create(**_request(model, temperature, messages, stop), stream=True)
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+
+class AsyncOpenAIBackend:
+    """Sends the messages to the OpenAI chat completions API without blocking the event loop."""
+    def __init__(self, openai_client) -> None:
+        """
+        Initializes the backend.
+
+        Args:
+            openai_client: The AsyncOpenAI client to send the requests with.
+        """
+        self.client = openai_client
+
+
+    async def complete(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Completion:
+        """Return the completion of the messages."""
+        completion = await self.client.chat.completions.create(**_request(model, temperature, messages, stop))
+        return Completion(completion.choices[0].message.content, completion.model, _usage(completion))
+
+
+    async def stream(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> AsyncIterator[str]:
+        """Yield the completion of the messages chunk by chunk."""
+        stream = await self.client.chat.completions.create(**_request(model, temperature, messages, stop), stream=True)
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+
+# Folder the scripted policy files each extension into
+SCRIPTED_CATEGORIES = {
+    "documents": {".pdf", ".doc", ".docx", ".txt", ".md", ".odt", ".rtf"},
+    "spreadsheets": {".xls", ".xlsx", ".csv", ".ods"},
+    "presentations": {".ppt", ".pptx", ".key", ".odp"},
+    "photos": {".jpg", ".jpeg", ".png", ".gif", ".svg", ".heic", ".bmp"},
+    "videos": {".mp4", ".mov", ".avi", ".mkv"},
+    "code": {".py", ".ipynb", ".js", ".ts", ".sql", ".json", ".sh"},
+    "archives": {".zip", ".tar", ".gz", ".rar", ".7z"},
+    "installers": {".exe", ".msi", ".dmg", ".pkg"},
+}
+
+
+def save_transcript(messages: list[dict], path: str) -> None:
+    """
+    Record the message history of an agent so a ScriptedBackend can replay it.
+
+    Args:
+        messages: The message history of the agent.
+        path: The JSON file to write.
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(messages, file, indent=2)
+
+
+class ScriptedBackend:
+    """
+    A local stand-in for the LLM.
+
+    With a transcript it replays the recorded assistant messages in order. Without one it runs a
+    deterministic policy on the observations: look at the tree, create one folder per file type, move the
+    top-level files into them and answer.
+    """
+    def __init__(
+        self,
+        transcript: str | list[dict] | None = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        seconds_per_token: float = 0.0,
+        seed: int | None = None,
+        slow_rate: float = 0.0,
+        slow_latency: float = 0.0,
+        error_rate: float = 0.0
+    ) -> None:
+        """
+        Initializes the backend.
+
+        Args:
+            transcript: A message history, or the path of one recorded with save_transcript, to replay.
+            latency: Seconds before the first token of every response.
+            jitter: Up to this many seconds are added to the latency at random.
+            seconds_per_token: Seconds between the tokens of a response.
+            seed: Seed of the jitter, the slow responses and the errors, for repeatable load tests.
+            slow_rate: Share of the responses that take slow_latency seconds longer, the tail of the latency.
+            slow_latency: Seconds added to a slow response.
+            error_rate: Share of the requests that fail with a ConnectionError after the latency.
+        """
+        if isinstance(transcript, str):
+            with open(transcript, encoding="utf-8") as file:
+                transcript = json.load(file)
+
+        self.responses = [message["content"] for message in transcript or [] if message["role"] == "assistant"]
+        self.latency = latency
+        self.jitter = jitter
+        self.seconds_per_token = seconds_per_token
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+
+    def _delay(self) -> float:
+        """Return the injected latency of the next response."""
+        delay = self.latency + self._random.uniform(0, self.jitter) if self.jitter else self.latency
+        if self.slow_rate and self._random.random() < self.slow_rate:
+            delay += self.slow_latency
+        return delay
+
+
+    def _fails(self) -> bool:
+        """Draw whether the next request fails."""
+        return bool(self.error_rate) and self._random.random() < self.error_rate
+
+
+    def _respond(self, messages: list[dict], model: str, stop: list[str] | None) -> Completion:
+        """Build the next response, cut at the first stop sequence like the API does."""
+        if self.responses:
+            content = self.responses[self.calls % len(self.responses)]
+        else:
+            content = _scripted_policy(messages)
+        self.calls += 1
+
+        for sequence in stop or []:
+            if sequence in content:
+                content = content[:content.index(sequence)]
+
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": estimate_tokens(content), "cached_tokens": 0}
+        return Completion(content, model, usage)
+
+
+    def complete(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Completion:
+        """Return the completion of the messages after the injected latency."""
+        if self._fails():
+            time.sleep(self._delay())
+            raise ConnectionError("Injected backend error")
+        completion = self._respond(messages, model, stop)
+        time.sleep(self._delay() + self.seconds_per_token * completion.usage["completion_tokens"])
+        return completion
+
+
+    def stream(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Iterator[str]:
+        """Yield the completion of the messages in token-sized chunks after the injected latency."""
+        failed = self._fails()
+        time.sleep(self._delay())
+        if failed:
+            raise ConnectionError("Injected backend error")
+        completion = self._respond(messages, model, stop)
+        for start in range(0, len(completion.content), 4):
+            if self.seconds_per_token:
+                time.sleep(self.seconds_per_token)
+            yield completion.content[start:start + 4]
+
+
+class AsyncScriptedBackend(ScriptedBackend):
+    """The asyncio counterpart of ScriptedBackend, waiting without blocking the event loop."""
+    async def complete(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Completion:
+        """Return the completion of the messages after the injected latency."""
+        if self._fails():
+            await asyncio.sleep(self._delay())
+            raise ConnectionError("Injected backend error")
+        completion = self._respond(messages, model, stop)
+        await asyncio.sleep(self._delay() + self.seconds_per_token * completion.usage["completion_tokens"])
+        return completion
+
+
+    async def stream(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> AsyncIterator[str]:
+        """Yield the completion of the messages in token-sized chunks after the injected latency."""
+        failed = self._fails()
+        await asyncio.sleep(self._delay())
+        if failed:
+            raise ConnectionError("Injected backend error")
+        completion = self._respond(messages, model, stop)
+        for start in range(0, len(completion.content), 4):
+            if self.seconds_per_token:
+                await asyncio.sleep(self.seconds_per_token)
+            yield completion.content[start:start + 4]
+
+
+def _last_observation(messages: list[dict]) -> dict | None:
+    """Return the result of the latest observation in the history, None if there is none."""
+    for message in reversed(messages):
+        if message["role"] == "user" and message["content"].startswith("Observation: "):
+            observation = message["content"][len("Observation: "):]
+            try:
+                result = ast.literal_eval(observation)
+            except (ValueError, SyntaxError):
+                # A tree in the compact encoding
+                return decode_tree(observation) if observation.startswith(("version: ", "root/")) else {}
+            if isinstance(result, list) and result:
+                # Several tool calls, the last one decides the next step
+                result = result[-1]
+            return result if isinstance(result, dict) else {}
+        if message["role"] == "user":
+            return None
+    return None
+
+
+def _category(file_name: str) -> str:
+    """Return the folder the scripted policy files a file into."""
+    extension = os.path.splitext(file_name)[1].lower()
+    for category, extensions in SCRIPTED_CATEGORIES.items():
+        if extension in extensions:
+            return category
+    return "other"
+
+
+def _shard_files(messages: list[dict]) -> list[str] | None:
+    """Return the files of the latest message if it is the shard of a sharded run, None otherwise."""
+    if not messages or messages[-1]["role"] != "user":
+        return None
+    for line in messages[-1]["content"].splitlines():
+        if line.startswith("Files: "):
+            try:
+                return json.loads(line[len("Files: "):])
+            except ValueError:
+                return None
+    return None
+
+
+def _plan_tree(messages: list[dict]) -> dict | None:
+    """Return the tree of the latest message if it is the request of plan mode, None otherwise."""
+    if not messages or messages[-1]["role"] != "user":
+        return None
+    _, separator, observation = messages[-1]["content"].partition("\nObservation: ")
+    if not separator:
+        return None
+    try:
+        tree = ast.literal_eval(observation)
+    except (ValueError, SyntaxError):
+        return decode_tree(observation) if observation.startswith(("version: ", "root/")) else None
+    return tree if isinstance(tree, dict) else None
+
+
+def _scripted_policy(messages: list[dict]) -> str:
+    """
+    Decide the next step from the latest observation, in the format of the chain of thought prompt.
+
+    Args:
+        messages: The message history of the agent.
+
+    Returns:
+        str: The next response of the agent.
+    """
+    files = _shard_files(messages)
+    if files is not None:
+        # A shard of a sharded run is answered with a plan in one response
+        moves = {}
+        for path in files:
+            destination = f"root/{_category(path.rsplit('/', 1)[1])}"
+            if path.rsplit("/", 1)[0] != destination:
+                moves.setdefault(destination, []).append(path)
+        return json.dumps({"directories": sorted(moves), "moves": moves})
+
+    tree = _plan_tree(messages)
+    if tree is not None:
+        # Plan mode is answered with the complete plan for the top-level files
+        moves = {
+            f"root/{name}": f"root/{_category(name)}"
+            for name in tree.get("root", []) if f"root/{name}" not in tree
+        }
+        directories = sorted({destination for destination in moves.values() if destination not in tree})
+        return json.dumps({"directories": directories, "moves": moves})
+
+    observation = _last_observation(messages)
+
+    if observation is None:
+        return "Think: I need to see the files in the working directory first.\nTool: get_working_directory()\nPAUSE"
+
+    if "msg" in observation:
+        return f"Output: Unfortunately, I couldn't organize your directory due to an error: {observation['msg']}"
+
+    if "root" in observation:
+        if "next_cursor" in observation:
+            # Only the first page is organized, the rest is left for the next run
+            logger.debug("Scripted policy ignores the remaining pages of the tree")
+        existing = {name for name in observation["root"] if f"root/{name}" in observation}
+        files = [name for name in observation["root"] if f"root/{name}" not in observation]
+        plan = {f"root/{name}": f"root/{_category(name)}" for name in files}
+        if not plan:
+            return "Output: Your directory is already organized."
+
+        missing = sorted({destination for destination in plan.values() if destination[len("root/"):] not in existing})
+        if missing:
+            # Both calls in one response, the folders are created before the files are moved
+            return (
+                "Think: I will create one folder per file type that does not exist yet and move each file into it.\n"
+                f"Tool: create_directory({json.dumps(missing)})\n"
+                f"Tool: move_files({json.dumps(plan)})\nPAUSE"
+            )
+        return f"Think: Now I will move each file into the folder of its type.\nTool: move_files({json.dumps(plan)})\nPAUSE"
+
+    if "created" in observation:
+        # Look at the tree again so the moves are planned against the folders that exist now
+        return "Think: The folders exist now, let me look at the tree again.\nTool: get_working_directory()\nPAUSE"
+
+    if "moved" in observation:
+        return f"Output: Your directory has been organized successfully. {len(observation['moved'])} files were sorted into folders by type."
+
+    return "Output: Your directory has been organized successfully."
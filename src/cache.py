@@ -0,0 +1,207 @@
+"""
+LLM Response Cache
+
+This module implements an optional cache of LLM responses. The agent runs with temperature 0 and a fixed
+model, so the same message history gives the same answer, and re-running a scenario from
+setup_test_directory.py repeats the same calls over and over.
+
+Responses are keyed on a hash of the model, the request parameters and the messages. They are kept in
+memory with LRU eviction and, optionally, in a directory on disk with a size cap and a time to live, so
+they survive across runs.
+
+Usage:
+    cache = ResponseCache(directory=".llm_cache")
+    agent = Agent(system_message, client, cache=cache)
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """An in-memory LRU cache of LLM responses backed by an optional disk store."""
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        directory: str | None = None,
+        max_disk_bytes: int = 100 * 1024 * 1024,
+        ttl_seconds: float = 7 * 24 * 3600
+    ) -> None:
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries: Number of responses kept in memory.
+            directory: Directory of the disk store, None to keep responses in memory only.
+            max_disk_bytes: The disk store evicts its oldest entries once it grows beyond this size.
+            ttl_seconds: Entries of the disk store older than this are ignored and removed.
+        """
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._disk_index = None
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def make_key(model: str, params: dict, messages: list[dict]) -> str:
+        """
+        Build the cache key of a request.
+
+        Args:
+            model: The model the request is sent to.
+            params: The other request parameters, such as temperature and stop sequences.
+            messages: The message history of the request.
+
+        Returns:
+            str: The hex digest of the request.
+        """
+        payload = json.dumps({"model": model, "params": params, "messages": messages}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups that were answered from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+    def stats(self) -> dict:
+        """Return the hit and miss counters of the cache."""
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hit_rate, 4), "entries": len(self._entries)}
+
+
+    def get(self, key: str) -> str | None:
+        """
+        Look up a response, first in memory and then on disk.
+
+        Args:
+            key: The cache key built with make_key.
+
+        Returns:
+            str: The cached response, or None if there is none.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            response = self._read_disk(key)
+            if response is None:
+                self.misses += 1
+                return None
+
+            self._remember(key, response)
+            self.hits += 1
+            return response
+
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Store a response in memory and on disk.
+
+        Args:
+            key: The cache key built with make_key.
+            response: The response of the LLM.
+        """
+        with self._lock:
+            self._remember(key, response)
+            self._write_disk(key, response)
+
+
+    def _remember(self, key: str, response: str) -> None:
+        """Add a response to the in-memory LRU, evicting the least recently used one if it is full."""
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+    def _load_disk_index(self) -> dict:
+        """Index the disk store once, mapping each key to the size and write time of its file."""
+        if self._disk_index is None:
+            self._disk_index = {}
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                with os.scandir(self.directory) as iterator:
+                    for entry in iterator:
+                        if entry.name.endswith(".json"):
+                            stat = entry.stat()
+                            self._disk_index[entry.name[:-len(".json")]] = (stat.st_size, stat.st_mtime)
+        return self._disk_index
+
+
+    def _read_disk(self, key: str) -> str | None:
+        """Read a response from the disk store, dropping it if it has expired."""
+        if not self.directory:
+            return None
+
+        index = self._load_disk_index()
+        if key not in index:
+            return None
+
+        path = os.path.join(self.directory, f"{key}.json")
+        _, written = index[key]
+        if time.time() - written > self.ttl_seconds:
+            self._remove_disk(key)
+            return None
+
+        try:
+            with open(path, encoding="utf-8") as file:
+                return json.load(file)["response"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Dropping unreadable cache entry {path}: {e}")
+            self._remove_disk(key)
+            return None
+
+
+    def _write_disk(self, key: str, response: str) -> None:
+        """Write a response to the disk store and evict the oldest entries beyond the size cap."""
+        if not self.directory:
+            return
+
+        index = self._load_disk_index()
+        path = os.path.join(self.directory, f"{key}.json")
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            # Write to a temporary file first so readers never see a partial entry
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump({"response": response}, file)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {path}: {e}")
+            return
+        index[key] = (os.path.getsize(path), time.time())
+
+        total = sum(size for size, _ in index.values())
+        if total > self.max_disk_bytes:
+            for old_key, (size, _) in sorted(index.items(), key=lambda item: item[1][1]):
+                if total <= self.max_disk_bytes:
+                    break
+                self._remove_disk(old_key)
+                total -= size
+
+
+    def _remove_disk(self, key: str) -> None:
+        """Remove an entry from the disk store."""
+        self._disk_index.pop(key, None)
+        try:
+            os.remove(os.path.join(self.directory, f"{key}.json"))
+        except OSError:
+            pass
@@ -0,0 +1,213 @@
+"""
+Session Checkpoints
+
+This module persists the progress of an agent session, so a run that dies partway can be resumed instead
+of paying for every LLM call and scan again. A checkpoint lives next to the working directory, like the
+journals of the move engine, and holds:
+
+- session.json: the message history, compacted, and the version of the tree, rewritten atomically after
+  every LLM call.
+- operations.jsonl: an append-only journal of the calls of the mutating tools and their results, keyed by
+  the step and the position of the call in the response, flushed to disk before the loop goes on.
+
+On resume (see resume_agent_loop in src/agent_loop.py) the agent gets its history back and the loop goes on
+where it stopped. A tool call that is already in the journal is not run again, its recorded result is sent
+instead, and the moves of a call that was applied but not yet journaled when the process died are dropped.
+The checkpoint is removed when the session finishes.
+
+Usage:
+    checkpoint = SessionCheckpoint("working_directory")
+    run_agent_loop(agent, user_message, checkpoint=checkpoint)
+    # after a crash
+    resume_agent_loop(agent, SessionCheckpoint("working_directory"))
+
+Functions:
+1. default_checkpoint_directory(directory): Returns the checkpoint directory of a working directory.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import os
+import json
+import shutil
+import logging
+import threading
+
+from src.memory import ConversationMemory
+
+logger = logging.getLogger(__name__)
+
+# The history in a checkpoint is compacted to this many tokens
+CHECKPOINT_TOKEN_BUDGET = 32000
+
+SESSION_FILE = "session.json"
+OPERATIONS_FILE = "operations.jsonl"
+
+
+def _as_json(value):
+    """Return a value as it is read back from the journal, tuples and sets become lists."""
+    return json.loads(json.dumps(value, default=list))
+
+
+def default_checkpoint_directory(directory: str) -> str:
+    """
+    Return the checkpoint directory of a working directory, a hidden sibling of it.
+
+    Args:
+        directory: The working directory.
+
+    Returns:
+        str: The path of the checkpoint directory.
+    """
+    parent, name = os.path.split(os.path.normpath(directory))
+    return os.path.join(parent, f".{name}.checkpoint")
+
+
+class SessionCheckpoint:
+    """The persisted progress of one agent session: its history, the tree version and the applied operations."""
+    def __init__(self, working_directory: str, directory: str | None = None) -> None:
+        """
+        Initializes the checkpoint, loading the operations journaled by an earlier run.
+
+        Args:
+            working_directory: The working directory of the session.
+            directory: The directory the checkpoint is stored in, next to the working directory if None.
+        """
+        self.working_directory = working_directory
+        self.directory = directory or default_checkpoint_directory(working_directory)
+        self.operations: dict[tuple[int, int], dict] = {}
+        self.step = 0
+        self._next_call = 0
+        self._lock = threading.Lock()
+
+        for operation in self._read_operations():
+            self.operations[(operation["step"], operation["call"])] = operation
+
+
+    @property
+    def exists(self) -> bool:
+        """Check if an earlier run left a session to resume."""
+        return os.path.isfile(os.path.join(self.directory, SESSION_FILE))
+
+
+    def _read_operations(self) -> list[dict]:
+        """Read the journal, a line cut off by a crash is ignored."""
+        path = os.path.join(self.directory, OPERATIONS_FILE)
+        if not os.path.isfile(path):
+            return []
+
+        operations = []
+        with open(path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    operations.append(json.loads(line))
+                except ValueError:
+                    logger.warning(f"Ignoring a partial line at the end of {path}")
+        return operations
+
+
+    def begin_step(self, step: int) -> None:
+        """
+        Start numbering the tool calls of a response.
+
+        Args:
+            step: The index of the response among the assistant messages of the history.
+        """
+        with self._lock:
+            self.step = step
+            self._next_call = 0
+
+
+    def next_key(self) -> tuple[int, int]:
+        """Return the key of the next tool call of the current response, calls are numbered in the order they are submitted."""
+        with self._lock:
+            key = (self.step, self._next_call)
+            self._next_call += 1
+            return key
+
+
+    def result(self, key: tuple[int, int], tool_call: dict):
+        """
+        Return the recorded result of a tool call.
+
+        A regenerated response may make another call at the same position, so the result is only reused if
+        the recorded call had the same tool and arguments.
+
+        Args:
+            key: The step and position of the call.
+            tool_call: The tool name and arguments of the call.
+
+        Returns:
+            The recorded result, None if the call was not applied yet.
+        """
+        operation = self.operations.get(tuple(key))
+        if operation is None:
+            return None
+        if operation["tool"] != tool_call["tool"] or operation["args"] != _as_json(tool_call["args"]):
+            logger.warning(f"The call recorded at step {key[0]} was a different {operation['tool']} call, running the new one")
+            return None
+        return operation["result"]
+
+
+    def record(self, key: tuple[int, int], tool_call: dict, result) -> None:
+        """
+        Append an applied tool call and its result to the journal and flush it to disk.
+
+        Args:
+            key: The step and position of the call.
+            tool_call: The tool name and arguments as the agent made the call.
+            result: The result of the tool.
+        """
+        operation = {"step": key[0], "call": key[1], "tool": tool_call["tool"], "args": tool_call["args"], "result": result}
+        line = json.dumps(operation, default=list)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, OPERATIONS_FILE), "a", encoding="utf-8") as journal:
+                journal.write(line + "\n")
+                journal.flush()
+                os.fsync(journal.fileno())
+            # Kept as it is read back after a restart, so calls compare the same either way
+            self.operations[tuple(key)] = json.loads(line)
+
+
+    def save(self, messages: list[dict], version: str | None) -> None:
+        """
+        Write the history and the tree version, replacing the previous state atomically.
+
+        Args:
+            messages: The message history of the agent, it is compacted in a copy.
+            version: The version of the tree after the step.
+        """
+        compacted = [dict(message) for message in messages]
+        ConversationMemory(token_budget=CHECKPOINT_TOKEN_BUDGET).compact(compacted)
+        state = {"messages": compacted, "version": version, "operations": len(self.operations)}
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, SESSION_FILE)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+
+    def load(self) -> dict | None:
+        """
+        Read the saved state of the session.
+
+        Returns:
+            dict | None: The messages and the tree version, None if there is no checkpoint.
+        """
+        try:
+            with open(os.path.join(self.directory, SESSION_FILE), encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+
+    def clear(self) -> None:
+        """Remove the checkpoint once the session has finished."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.operations = {}
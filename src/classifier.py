@@ -0,0 +1,292 @@
+"""
+Rule-Based File Classifier
+
+This module implements a deterministic classification stage that runs before the agent. Most files of a
+messy directory are placed by their extension alone, e.g. a .pdf goes to documents and a .jpg to photos,
+so they don't need an LLM round trip. The classifier files those directly in one bulk move and leaves only
+the ambiguous remainder to the agent.
+
+A file is placed by the first of these rules that applies:
+1. Filename patterns, e.g. requirements.txt belongs with the code even though .txt is a document.
+2. Extensions learned from past runs: the files moved by every run are counted as folder votes per
+   extension. An extension is only trusted once it has enough votes and most of them agree on one folder.
+3. Built-in extension rules for unambiguous types.
+
+Files no rule places with enough confidence, e.g. notes, configs or credentials, are left to the agent.
+The learned votes and custom patterns are persisted as JSON, so the rules improve from run to run.
+
+Usage:
+    classifier = FileClassifier("rules.json")
+    result = classifier.apply()
+    with record_moves() as moved:
+        ...  # run the agent on result.ambiguous
+    classifier.learn_from_tree(get_working_directory(limit=None), moved)
+    classifier.save()
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import os
+import re
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+
+from src.tools import get_working_directory, create_directory, move_files
+
+logger = logging.getLogger(__name__)
+
+# Folder of each extension whose type is clear from the extension alone
+DEFAULT_EXTENSION_RULES = {
+    "documents": {".pdf", ".doc", ".docx", ".odt", ".rtf"},
+    "spreadsheets": {".xls", ".xlsx", ".ods"},
+    "presentations": {".ppt", ".pptx", ".key", ".odp"},
+    "photos": {".jpg", ".jpeg", ".png", ".gif", ".heic", ".bmp", ".webp"},
+    "videos": {".mp4", ".mov", ".avi", ".mkv"},
+    "music": {".mp3", ".wav", ".flac", ".m4a"},
+    "code": {".py", ".ipynb", ".js", ".ts", ".sql", ".sh", ".java", ".go", ".rs"},
+    "archives": {".zip", ".tar", ".gz", ".rar", ".7z"},
+    "installers": {".exe", ".msi", ".dmg", ".pkg"},
+}
+
+# Filename patterns that decide over the extension, checked in order against the lower-cased name
+DEFAULT_PATTERN_RULES = [
+    (r"^(requirements.*\.txt|setup\.py|pyproject\.toml|setup\.cfg|makefile|dockerfile)$", "code"),
+    (r"^(img|dsc|pxl)_\d+\.(jpe?g|png|heic)$", "photos"),
+]
+
+# Confidence of the built-in rules, patterns are more specific than extensions
+PATTERN_CONFIDENCE = 0.95
+EXTENSION_CONFIDENCE = 0.9
+
+RULES_FORMAT_VERSION = 1
+
+
+@dataclass
+class ClassificationResult:
+    """The outcome of the classification stage on one directory."""
+    moved: dict[str, str] = field(default_factory=dict)
+    ambiguous: list[str] = field(default_factory=list)
+    created: list[str] = field(default_factory=list)
+    error: str | None = None
+
+
+class FileClassifier:
+    """Places files by filename patterns and extension rules, learned from past runs and built in."""
+    def __init__(self, rules_path: str | None = None, min_confidence: float = 0.8, min_support: int = 3) -> None:
+        """
+        Initializes the classifier and loads the learned rules.
+
+        Args:
+            rules_path: JSON file of the learned rules, None to use the built-in rules only.
+            min_confidence: Files are only placed by a rule with at least this confidence.
+            min_support: Number of files a learned extension needs before it is trusted.
+        """
+        self.rules_path = rules_path
+        self.min_confidence = min_confidence
+        self.min_support = min_support
+        self.extension_votes: dict[str, dict[str, int]] = {}
+        self.patterns = [(re.compile(pattern), folder) for pattern, folder in DEFAULT_PATTERN_RULES]
+        self._custom_patterns: list[tuple[str, str]] = []
+        self._default_extensions = {
+            extension: folder for folder, extensions in DEFAULT_EXTENSION_RULES.items() for extension in extensions
+        }
+        self._lock = threading.Lock()
+
+        if rules_path and os.path.exists(rules_path):
+            self.load(rules_path)
+
+
+    def load(self, path: str) -> None:
+        """
+        Load learned extension votes and custom patterns from a JSON file written by save().
+
+        Args:
+            path: The JSON file to read.
+        """
+        try:
+            with open(path, encoding="utf-8") as file:
+                rules = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable rules file {path}: {e}")
+            return
+
+        if rules.get("version") != RULES_FORMAT_VERSION:
+            logger.warning(f"Ignoring rules file {path} of unknown version {rules.get('version')}")
+            return
+
+        self.extension_votes = {extension: dict(votes) for extension, votes in rules.get("extensions", {}).items()}
+        self._custom_patterns = [tuple(rule) for rule in rules.get("patterns", [])]
+        # Custom patterns come first, so a user rule can override a built-in one
+        self.patterns = [(re.compile(pattern), folder) for pattern, folder in self._custom_patterns] + self.patterns
+        logger.info(f"Loaded rules for {len(self.extension_votes)} extensions from {path}")
+
+
+    def save(self, path: str | None = None) -> None:
+        """
+        Persist the learned extension votes and custom patterns as JSON.
+
+        Args:
+            path: The JSON file to write, defaults to the file the rules were loaded from.
+        """
+        path = path or self.rules_path
+        if not path:
+            return
+
+        with self._lock:
+            rules = {
+                "version": RULES_FORMAT_VERSION,
+                "extensions": self.extension_votes,
+                "patterns": [list(rule) for rule in self._custom_patterns]
+            }
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(rules, file, indent=2, sort_keys=True)
+        os.replace(temporary_path, path)
+
+
+    def classify(self, file_name: str) -> tuple[str | None, float]:
+        """
+        Decide the folder of a file from its name.
+
+        Args:
+            file_name: The name of the file, without its directory.
+
+        Returns:
+            tuple: The folder relative to root and the confidence of the rule, (None, 0.0) if no rule applies.
+        """
+        name = file_name.lower()
+        for pattern, folder in self.patterns:
+            if pattern.match(name):
+                return folder, PATTERN_CONFIDENCE
+
+        extension = os.path.splitext(name)[1]
+        if not extension:
+            return None, 0.0
+
+        with self._lock:
+            votes = self.extension_votes.get(extension)
+            if votes and sum(votes.values()) >= self.min_support:
+                # Past runs decide over the built-in rules, a split vote leaves the file to the agent
+                folder = max(votes, key=votes.get)
+                return folder, votes[folder] / sum(votes.values())
+
+        if extension in self._default_extensions:
+            return self._default_extensions[extension], EXTENSION_CONFIDENCE
+        return None, 0.0
+
+
+    def plan(self, tree: dict) -> tuple[dict[str, str], list[str]]:
+        """
+        Plan the moves of the top-level files of a tree.
+
+        Args:
+            tree: A get_working_directory result that lists root and its subdirectories.
+
+        Returns:
+            tuple: The moves of the confidently placed files and the paths of the ambiguous ones.
+        """
+        moves = {}
+        ambiguous = []
+        for name in tree.get("root", []):
+            path = f"root/{name}"
+            if path in tree:
+                # Folders are the agent's business
+                continue
+            folder, confidence = self.classify(name)
+            if folder is not None and confidence >= self.min_confidence and f"root/{folder}" != path:
+                moves[path] = f"root/{folder}"
+            else:
+                ambiguous.append(path)
+        return moves, ambiguous
+
+
+    def apply(self) -> ClassificationResult:
+        """
+        Move the confidently placed top-level files of the working directory into their folders in one batch.
+
+        Returns:
+            ClassificationResult: The applied moves, the created folders and the files left to the agent.
+        """
+        # Two levels are enough to tell the files of root from its folders
+        tree = get_working_directory(depth=2, limit=None)
+        if "msg" in tree:
+            return ClassificationResult(error=tree["msg"])
+
+        moves, ambiguous = self.plan(tree)
+        result = ClassificationResult(ambiguous=ambiguous)
+        if not moves:
+            return result
+
+        missing = sorted({folder for folder in moves.values() if folder not in tree})
+        if missing:
+            created = create_directory(missing)
+            if "msg" in created:
+                return ClassificationResult(ambiguous=sorted(ambiguous + list(moves)), error=created["msg"])
+            result.created = created.get("created", missing)
+
+        moved = move_files(moves)
+        if "msg" in moved:
+            # The move is one transaction, so nothing was moved and the agent gets every file
+            return ClassificationResult(ambiguous=sorted(ambiguous + list(moves)), created=result.created, error=moved["msg"])
+
+        result.moved = moved.get("moved", moves)
+        logger.info(f"Classified {len(result.moved)} files by rules, {len(ambiguous)} left to the agent")
+        return result
+
+
+    def learn_from_tree(self, tree: dict, moved: set[str] | None = None) -> int:
+        """
+        Count the folder of every file in an organized tree as a vote for its extension.
+
+        Files that were not moved in the session already voted when they were placed, so counting them again
+        would only grow the votes and reinforce earlier placements, the rules' own ones included.
+
+        Args:
+            tree: A get_working_directory result, usually of the whole tree after the agent finished.
+            moved: The paths of the files moved in the session (see record_moves), None to count every file.
+
+        Returns:
+            int: The number of files counted.
+        """
+        counted = 0
+        with self._lock:
+            for directory, contents in tree.items():
+                if directory == "root" or not directory.startswith("root/"):
+                    continue
+                folder = directory[len("root/"):]
+                for name in contents:
+                    extension = os.path.splitext(name.lower())[1]
+                    path = f"{directory}/{name}"
+                    if not extension or path in tree or (moved is not None and path not in moved):
+                        continue
+                    votes = self.extension_votes.setdefault(extension, {})
+                    votes[folder] = votes.get(folder, 0) + 1
+                    counted += 1
+
+        logger.info(f"Learned the folders of {counted} files")
+        return counted
+
+
+def classification_message(user_message: str, result: ClassificationResult) -> str:
+    """
+    Tell the agent which files were already placed by the rules.
+
+    Args:
+        user_message: The original user message.
+        result: The result of the classification stage.
+
+    Returns:
+        str: The user message for the agent.
+    """
+    if not result.moved:
+        return user_message
+
+    folders = sorted({destination.rsplit("/", 1)[0] for destination in result.moved.values()})
+    return (
+        f"{user_message}\n\n"
+        f"Note: {len(result.moved)} files with an obvious type were already moved into {', '.join(folders)}. "
+        f"Organize the remaining {len(result.ambiguous)} files at the root, you can use the existing folders."
+    )
@@ -4,114 +4,61 @@ Configuration Management Module
 Handles secure loading and validation of environment variables with support
 for local .env files and cloud deployment with GCP Secret Manager integration.
 
+The configuration is loaded on first use, not on import, so command line tools that never read it
+start without importing pydantic, and the OpenAI API key is only validated by the code that calls the API.
+
 Usage:
-    from config.config import config
+    from src.config.config import get_config
 
-    if config.is_production():
+    if get_config().is_production():
         # Production-specific logic
         pass
 """
 # Import libraries
 import sys
 import logging
-from enum import Enum
-from pathlib import Path
-from pydantic_settings import BaseSettings
-from pydantic import SecretStr, Field, ValidationError
+import functools
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from src.config.settings import SystemConfig, LogLevel
 
-class LogLevel(str, Enum):
-    """Standard logging levels for application logging configuration."""
-    DEBUG = "DEBUG"
-    INFO = "INFO"
-    WARNING = "WARNING"
-    ERROR = "ERROR"
-    CRITICAL = "CRITICAL"
+# Default format of the log records, also used before the configuration is loaded
+DEFAULT_LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
 
-class SystemConfig(BaseSettings):
+@functools.cache
+def get_config() -> "SystemConfig":
     """
-    Main application configuration with environment-based loading.
+    Load and validate the configuration on the first call and return the same instance afterwards.
 
-    Supports local development with .env files and cloud deployment
-    with environment variables from GCP Secret Manager.
-
-    Read .env.example for more information about Environment Variables
+    Returns:
+        SystemConfig: The configuration.
     """
-
-    # Application Settings with defaults
-    app_name: str = Field(
-        default="llm-engineering-12-week",
-        description="Application identifier"
-    )
-    app_description: str = Field(
-        default="LLM Engineering 12 Week Challenge",
-        description="Application description"
-    )
-    app_version: str = Field(
-        default="1.0.0",
-        description="Application version"
-    )
-    app_author: str = Field(
-        default="Peyman Khodabandehlouei",
-        description="Application author"
-    )
-    environment: str = Field(
-        default="development",
-        description="Deployment environment"
-    )
-    debug: bool = Field(
-        default=True,
-        description="Enable debug mode"
-    )
-
-    # Logging Configuration with defaults
-    log_level: LogLevel = Field(
-        default=LogLevel.DEBUG,
-        description="Logging level"
-    )
-    log_format: str = Field(
-        default="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        description="Log message format string"
-    )
-
-    # LLM provider settings
-    openai_api_key: SecretStr = Field(
-        ...,
-        description="OpenAI API key"
-    )
-
-    def is_production(self) -> bool:
-        """Check if running in a production environment."""
-        return self.environment.lower() == "production"
-
-    def is_development(self) -> bool:
-        """Check if running in a development environment."""
-        return self.environment.lower() == "development"
-
-    class Config:
-        """Pydantic configuration for environment variable loading."""
-        env_file = Path(__file__).parent.parent.parent / '.env'
-        env_file_encoding = 'utf-8'
-        case_sensitive = False
-        env_nested_delimiter = '__'
-
-
-# Initialize logging with basic configuration
-DEFAULT_LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-logging.basicConfig(level=logging.DEBUG, format=DEFAULT_LOG_FORMAT)
-
-# Load and validate configuration on module import
-try:
-    config = SystemConfig()
-    logging.info(f"Configuration loaded for {config.environment} environment")
-except ValidationError as e:
-    logging.error(f"Configuration validation failed: {e}")
-    sys.exit(1)
-except Exception as e:
-    logging.error(f"Failed to load configuration: {e}")
-    sys.exit(1)
+    from pydantic import ValidationError
+    from src.config.settings import SystemConfig
+
+    try:
+        config = SystemConfig()
+        logging.info(f"Configuration loaded for {config.environment} environment")
+        return config
+    except ValidationError as e:
+        logging.error(f"Configuration validation failed: {e}")
+        sys.exit(1)
+    except Exception as e:
+        logging.error(f"Failed to load configuration: {e}")
+        sys.exit(1)
+
+
+def __getattr__(name: str):
+    """Load the configuration, or import its model, when one of them is accessed the old way."""
+    if name == "config":
+        return get_config()
+    if name in ("SystemConfig", "LogLevel"):
+        from src.config import settings
+        return getattr(settings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Public API
-__all__ = ['config', 'SystemConfig']
+__all__ = ['config', 'get_config', 'SystemConfig']
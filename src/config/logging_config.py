@@ -1,17 +1,50 @@
 # Import libraries
 import logging
-from src.config.config import config
+from src.config.config import DEFAULT_LOG_FORMAT, get_config
+
+
+class _DeferredHandler(logging.StreamHandler):
+    """A stream handler that reads the log level and format from the configuration on its first record."""
+    def __init__(self, logger: logging.Logger) -> None:
+        """
+        Initializes the handler.
+
+        Args:
+            logger: The logger the handler is attached to, its level is set once the configuration is loaded.
+        """
+        super().__init__()
+        self.logger = logger
+        self.configured = False
+
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        """Configure the handler and the logger on the first record, then handle the record."""
+        if not self.configured:
+            config = get_config()
+            self.setFormatter(logging.Formatter(config.log_format))
+            self.logger.setLevel(getattr(logging, config.log_level.value))
+            self.configured = True
+            if not self.logger.isEnabledFor(record.levelno):
+                return False
+        return super().handle(record)
+
 
 def get_logger(name: str) -> logging.Logger:
     """
     Get a configured logger instance for any module.
 
+    The configuration is only loaded when the logger emits its first record, so getting a logger at
+    import time costs nothing.
+
     Args:
         name: Usually __name__ from the calling module
 
     Returns:
         Configured logger instance
     """
+    # Initialize logging with basic configuration, a no-op once the root logger has a handler
+    logging.basicConfig(level=logging.DEBUG, format=DEFAULT_LOG_FORMAT)
+
     # Suppress third-party library logs
     logging.getLogger("openai").setLevel(logging.WARNING)
     logging.getLogger("httpcore").setLevel(logging.WARNING)
@@ -21,10 +54,6 @@ def get_logger(name: str) -> logging.Logger:
 
     # Only configure if not already configured
     if not logger.handlers:
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter(config.log_format)
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        logger.setLevel(getattr(logging, config.log_level.value))
+        logger.addHandler(_DeferredHandler(logger))
 
     return logger
@@ -0,0 +1,107 @@
+"""
+Configuration Settings
+
+Defines the pydantic-settings model of the application configuration. Importing pydantic is by far the
+slowest part of starting up, so this module is only imported when the configuration is first used, see
+get_config in src/config/config.py.
+
+Read .env.example for more information about Environment Variables
+"""
+# Import libraries
+from enum import Enum
+from pathlib import Path
+from pydantic_settings import BaseSettings
+from pydantic import SecretStr, Field
+
+
+class LogLevel(str, Enum):
+    """Standard logging levels for application logging configuration."""
+    DEBUG = "DEBUG"
+    INFO = "INFO"
+    WARNING = "WARNING"
+    ERROR = "ERROR"
+    CRITICAL = "CRITICAL"
+
+
+class SystemConfig(BaseSettings):
+    """
+    Main application configuration with environment-based loading.
+
+    Supports local development with .env files and cloud deployment
+    with environment variables from GCP Secret Manager.
+
+    Read .env.example for more information about Environment Variables
+    """
+
+    # Application Settings with defaults
+    app_name: str = Field(
+        default="llm-engineering-12-week",
+        description="Application identifier"
+    )
+    app_description: str = Field(
+        default="LLM Engineering 12 Week Challenge",
+        description="Application description"
+    )
+    app_version: str = Field(
+        default="1.0.0",
+        description="Application version"
+    )
+    app_author: str = Field(
+        default="Peyman Khodabandehlouei",
+        description="Application author"
+    )
+    environment: str = Field(
+        default="development",
+        description="Deployment environment"
+    )
+    debug: bool = Field(
+        default=True,
+        description="Enable debug mode"
+    )
+
+    # Logging Configuration with defaults
+    log_level: LogLevel = Field(
+        default=LogLevel.DEBUG,
+        description="Logging level"
+    )
+    log_format: str = Field(
+        default="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        description="Log message format string"
+    )
+
+    # LLM provider settings, only needed when the OpenAI API is used
+    openai_api_key: SecretStr | None = Field(
+        default=None,
+        description="OpenAI API key"
+    )
+
+    def is_production(self) -> bool:
+        """Check if running in a production environment."""
+        return self.environment.lower() == "production"
+
+    def is_development(self) -> bool:
+        """Check if running in a development environment."""
+        return self.environment.lower() == "development"
+
+    def require_openai_api_key(self) -> str:
+        """
+        Return the OpenAI API key, validated when it is first needed rather than at startup.
+
+        Raises:
+            ValueError: If the key is not set or still the placeholder of .env.example.
+        """
+        api_key = self.openai_api_key.get_secret_value() if self.openai_api_key else ""
+        if not api_key or api_key == "YOUR_API_KEY_HERE":
+            raise ValueError("OPENAI_API_KEY is not set, add it to .env or run offline")
+        return api_key
+
+    class Config:
+        """Pydantic configuration for environment variable loading."""
+        env_file = Path(__file__).parent.parent.parent / '.env'
+        env_file_encoding = 'utf-8'
+        case_sensitive = False
+        env_nested_delimiter = '__'
+
+
+# Public API
+__all__ = ['SystemConfig', 'LogLevel']
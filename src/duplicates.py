@@ -0,0 +1,196 @@
+"""
+Duplicate Detection
+
+This module finds files with identical content, e.g. thesis_final.docx and thesis_final_FINAL_v2.docx, so
+the agent can keep one copy instead of spreading the copies across the new folders. Reading every file of
+a large share would take hours, so the files are narrowed down in three stages and each stage only reads
+the files the previous one could not tell apart:
+
+1. Files are bucketed by size, a file with a unique size has no duplicate and is never opened.
+2. Files sharing a size are hashed from their first and last block, on a thread pool.
+3. Files that still collide are hashed in full, in chunks, on a process pool.
+
+Files smaller than two blocks are read whole in the second stage, so the third stage only sees large files.
+Hard links to the same inode are one file and empty files are skipped.
+
+Functions:
+1. collect_files(directory): Returns the regular files of a directory tree with their sizes.
+2. find_duplicate_groups(files, max_workers): Returns the groups of files with identical content.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import os
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the start and from the end of a file in the second stage
+BLOCK_SIZE = 64 * 1024
+
+# Bytes read at a time in the third stage
+CHUNK_SIZE = 1024 * 1024
+
+# Below this many bytes to hash in full, starting worker processes costs more than it saves
+MIN_PROCESS_POOL_BYTES = 64 * 1024 * 1024
+
+# Number of files read at the same time in the second stage
+DEFAULT_HASH_WORKERS = 8
+
+
+@dataclass
+class DuplicateGroup:
+    """Files with identical content."""
+    size: int
+    paths: list[str]
+
+
+    @property
+    def wasted_bytes(self) -> int:
+        """Bytes taken by every copy but one."""
+        return self.size * (len(self.paths) - 1)
+
+
+@dataclass
+class DuplicateReport:
+    """The duplicate groups of a set of files and how much of the files had to be read to find them."""
+    groups: list[DuplicateGroup] = field(default_factory=list)
+    files: int = 0
+    candidates: int = 0
+    bytes_read: int = 0
+
+
+    @property
+    def wasted_bytes(self) -> int:
+        """Bytes taken by the redundant copies of all groups."""
+        return sum(group.wasted_bytes for group in self.groups)
+
+
+def collect_files(directory: str) -> list[tuple[str, int]]:
+    """
+    Return the regular files of a directory tree with their sizes, without following symbolic links.
+
+    Args:
+        directory: The directory on disk.
+
+    Returns:
+        list: The path and size of every non-empty file, one path per inode.
+    """
+    files = []
+    inodes = set()
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as iterator:
+                for entry in iterator:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        inode = (stat.st_dev, stat.st_ino)
+                        if stat.st_size > 0 and inode not in inodes:
+                            inodes.add(inode)
+                            files.append((entry.path, stat.st_size))
+        except OSError as e:
+            logger.debug(f"Skipping {current}: {e}")
+    return files
+
+
+def _edge_digest(path: str, size: int) -> bytes | None:
+    """Hash the first and last block of a file, the whole file if it is smaller than two blocks."""
+    try:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as file:
+            if size <= 2 * BLOCK_SIZE:
+                digest.update(file.read())
+            else:
+                digest.update(file.read(BLOCK_SIZE))
+                file.seek(-BLOCK_SIZE, os.SEEK_END)
+                digest.update(file.read(BLOCK_SIZE))
+        return digest.digest()
+    except OSError as e:
+        logger.debug(f"Failed to hash {path}: {e}")
+        return None
+
+
+def _full_digest(path: str) -> bytes | None:
+    """Hash a whole file in chunks, so memory stays bounded on large files."""
+    try:
+        digest = hashlib.blake2b(digest_size=32)
+        with open(path, "rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.digest()
+    except OSError as e:
+        logger.debug(f"Failed to hash {path}: {e}")
+        return None
+
+
+def _regroup(groups: list[list[str]], digests: dict[str, bytes | None]) -> list[list[str]]:
+    """Split groups of paths by digest, keeping the parts that still hold more than one file."""
+    regrouped = []
+    for paths in groups:
+        by_digest = {}
+        for path in paths:
+            if digests.get(path) is not None:
+                by_digest.setdefault(digests[path], []).append(path)
+        regrouped.extend(part for part in by_digest.values() if len(part) > 1)
+    return regrouped
+
+
+def find_duplicate_groups(files: list[tuple[str, int]], max_workers: int = DEFAULT_HASH_WORKERS) -> DuplicateReport:
+    """
+    Find the groups of files with identical content.
+
+    Args:
+        files: The path and size of every file, e.g. from collect_files.
+        max_workers: Number of threads of the second stage and at most the number of processes of the third.
+
+    Returns:
+        DuplicateReport: The duplicate groups, largest waste first, and the number of bytes read.
+    """
+    report = DuplicateReport(files=len(files))
+
+    # Stage 1: only files sharing their size can be duplicates
+    by_size = {}
+    for path, size in files:
+        by_size.setdefault(size, []).append(path)
+    by_size = {size: paths for size, paths in by_size.items() if len(paths) > 1}
+    report.candidates = sum(len(paths) for paths in by_size.values())
+    if not by_size:
+        return report
+
+    # Stage 2: the first and last block tell apart most files of the same size, e.g. different photos
+    sizes = {path: size for size, paths in by_size.items() for path in paths}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        edge_digests = dict(zip(sizes, executor.map(_edge_digest, sizes, sizes.values())))
+    report.bytes_read += sum(min(size, 2 * BLOCK_SIZE) for size in sizes.values())
+    groups = _regroup(list(by_size.values()), edge_digests)
+
+    # Stage 3: files larger than two blocks may still differ in the middle
+    complete = [paths for paths in groups if sizes[paths[0]] <= 2 * BLOCK_SIZE]
+    partial = [paths for paths in groups if sizes[paths[0]] > 2 * BLOCK_SIZE]
+    if partial:
+        paths = [path for group in partial for path in group]
+        total = sum(sizes[path] for path in paths)
+        if total >= MIN_PROCESS_POOL_BYTES and len(paths) > 1:
+            # Hashing is CPU bound once the data is cached, worker processes spread it over the cores
+            with ProcessPoolExecutor(max_workers=min(max_workers, os.cpu_count() or 1, len(paths))) as executor:
+                full_digests = dict(zip(paths, executor.map(_full_digest, paths, chunksize=4)))
+        else:
+            full_digests = {path: _full_digest(path) for path in paths}
+        report.bytes_read += total
+        complete.extend(_regroup(partial, full_digests))
+
+    report.groups = [DuplicateGroup(size=sizes[paths[0]], paths=sorted(paths)) for paths in complete]
+    report.groups.sort(key=lambda group: (-group.wasted_bytes, group.paths[0]))
+    logger.info(
+        f"Found {len(report.groups)} duplicate groups in {report.files} files "
+        f"({report.candidates} candidates, {report.bytes_read} bytes read)"
+    )
+    return report
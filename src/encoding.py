@@ -0,0 +1,356 @@
+"""
+Observation Encodings
+
+This module implements the encodings of tool results in observations. By default a result is embedded with
+its Python repr, where every directory of a tree repeats its full path and every file its full name. The
+compact encoding renders a tree as an indented listing instead:
+
+    version: 5c1d0a9e3f27b418
+    root/
+      photos/
+        IMG_{0001..0450}.jpg (450 files)
+      *.pdf: contract_signed, invoice_2024
+      random_notes.txt
+    features:
+      root/random_notes.txt: text: Grocery list for the weekend
+
+Each directory is written once at its indentation, numbered series of files are run-length encoded and the
+other files are grouped by extension. On trees with many similar files this is an order of magnitude fewer
+tokens than the repr. The content features of the files, if the tools add them, follow the tree with one
+line per file.
+
+Functions:
+1. set_observation_encoding(encoding): Selects the encoding of observations, "repr" or "compact".
+2. encode_tree(tree): Renders a get_working_directory result in the compact encoding.
+3. decode_tree(text): Turns the compact encoding back into a get_working_directory result.
+4. format_observation(result): Renders a tool result in the selected encoding.
+5. format_observations(results): Renders the results of several tool calls in the selected encoding.
+6. encoding_token_counts(result): Estimates the tokens of a tool result in every encoding.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import re
+import json
+import logging
+
+from src.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Encodings of the tool results in observations
+OBSERVATION_ENCODINGS = ("repr", "compact")
+observation_encoding = "repr"
+
+# Numbered files sharing a prefix and suffix are run-length encoded from this many files on
+MIN_SERIES_LENGTH = 3
+
+# A file name without its extension that contains a number, e.g. IMG_0001 of IMG_0001.jpg
+_NUMBERED_NAME_PATTERN = re.compile(r"^(.*?)(\d+)(\D*)$")
+
+# A run-length encoded series of files, e.g. IMG_{0001..0450}.jpg (450 files)
+_SERIES_LINE_PATTERN = re.compile(r"^(.*?)\{([0-9.,]+)\}(.*) \(\d+ files\)$")
+
+# An item of an extension group, a quoted name may contain the separator
+_LIST_ITEM_PATTERN = re.compile(r'\s*("(?:[^"\\]|\\.)*"|[^,]+)')
+
+INDENT = "  "
+
+
+def set_observation_encoding(encoding: str) -> None:
+    """
+    Select how tool results are rendered in observations.
+
+    Args:
+        encoding: "repr" for the Python repr of the result, "compact" for the indented tree listing.
+    """
+    global observation_encoding
+    if encoding not in OBSERVATION_ENCODINGS:
+        raise ValueError(f"Unknown observation encoding {encoding!r}, expected one of {OBSERVATION_ENCODINGS}")
+    observation_encoding = encoding
+
+
+def _is_tree(result) -> bool:
+    """Check if a tool result is a tree listing of get_working_directory."""
+    return isinstance(result, dict) and any(key == "root" or str(key).startswith("root/") for key in result)
+
+
+def _quote(name: str) -> str:
+    """Quote a name that could be mistaken for the syntax of the encoding."""
+    return json.dumps(name) if "," in name or "{" in name or name.startswith(("*.", '"')) or name != name.strip() else name
+
+
+def _format_ranges(numbers: list[str]) -> str:
+    """
+    Collapse a sorted list of equally formatted numbers into ranges.
+
+    Runs of at least three numbers with a constant step become a range, with the step if it is not one,
+    e.g. 0001..0450,0452 or 0003..0891..8.
+    """
+    parts = []
+    index = 0
+    while index < len(numbers):
+        end = index + 1
+        if end < len(numbers):
+            step = int(numbers[end]) - int(numbers[index])
+            while end + 1 < len(numbers) and int(numbers[end + 1]) - int(numbers[end]) == step:
+                end += 1
+            if end - index >= 2:
+                suffix = "" if step == 1 else f"..{step}"
+                parts.append(f"{numbers[index]}..{numbers[end]}{suffix}")
+                index = end + 1
+                continue
+        parts.append(numbers[index])
+        index += 1
+    return ",".join(parts)
+
+
+def _encode_files(names: list[str]) -> list[str]:
+    """
+    Encode the files of one directory, numbered series first, then files grouped by extension.
+
+    Args:
+        names: The file names of the directory.
+
+    Returns:
+        list: The lines of the files, without indentation.
+    """
+    series = {}
+    for name in names:
+        if "{" in name or "," in name:
+            continue
+        stem, dot, extension = name.rpartition(".")
+        if not dot or not stem:
+            stem, dot, extension = name, "", ""
+        match = _NUMBERED_NAME_PATTERN.match(stem)
+        if match:
+            prefix, number, suffix = match.groups()
+            series.setdefault((prefix, suffix + dot + extension), []).append(number)
+
+    lines = []
+    in_series = set()
+    for (prefix, suffix), numbers in series.items():
+        # Zero-padded numbers only form a series with numbers of the same width
+        if any(number.startswith("0") and len(number) > 1 for number in numbers):
+            groups = {}
+            for number in numbers:
+                groups.setdefault(len(number), []).append(number)
+        else:
+            groups = {0: numbers}
+
+        for group in groups.values():
+            if len(group) < MIN_SERIES_LENGTH:
+                continue
+            group.sort(key=int)
+            lines.append((prefix, f"{prefix}{{{_format_ranges(group)}}}{suffix} ({len(group)} files)"))
+            in_series.update(f"{prefix}{number}{suffix}" for number in group)
+
+    by_extension = {}
+    for name in names:
+        if name in in_series:
+            continue
+        stem, dot, extension = name.rpartition(".")
+        if dot and stem and " " not in extension:
+            by_extension.setdefault(extension, []).append(stem)
+        else:
+            lines.append((name, _quote(name)))
+
+    for extension, stems in by_extension.items():
+        if len(stems) == 1:
+            lines.append((stems[0], _quote(f"{stems[0]}.{extension}")))
+        else:
+            lines.append((f"*.{extension}", f"*.{extension}: {', '.join(_quote(stem) for stem in sorted(stems))}"))
+
+    return [line for _, line in sorted(lines)]
+
+
+def encode_tree(tree: dict) -> str:
+    """
+    Render a get_working_directory result as an indented listing.
+
+    Args:
+        tree: The result of get_working_directory, a full tree or one page of it.
+
+    Returns:
+        str: The compact encoding of the tree.
+    """
+    directories = [key for key in tree if key == "root" or str(key).startswith("root/")]
+    listed = set(directories)
+    rendered = set()
+    lines = []
+    if "version" in tree:
+        lines.append(f"version: {tree['version']}")
+
+    def render(directory: str, label: str, level: int) -> None:
+        rendered.add(directory)
+        lines.append(f"{INDENT * level}{label}/")
+        files = []
+        for name in tree[directory]:
+            path = f"{directory}/{name}"
+            if path in listed:
+                render(path, _quote(name), level + 1)
+            else:
+                files.append(name)
+        lines.extend(f"{INDENT * (level + 1)}{line}" for line in _encode_files(files))
+
+    # A page may start or end inside a directory, the directories not reached from their parent start at the margin
+    for directory in directories:
+        if directory not in rendered:
+            render(directory, _quote(directory), 0)
+
+    if tree.get("features"):
+        lines.append("features:")
+        lines.extend(f"{INDENT}{_quote_path(path)}: {description}" for path, description in tree["features"].items())
+
+    if "next_cursor" in tree:
+        lines.append(f"next_cursor: {tree['next_cursor']}")
+    return "\n".join(lines)
+
+
+def _quote_path(path: str) -> str:
+    """Quote a path that contains the separator of a feature line."""
+    return json.dumps(path) if ": " in path or path.startswith('"') or path != path.strip() else path
+
+
+def _unquote(text: str) -> str:
+    """Reverse _quote."""
+    return json.loads(text) if text.startswith('"') else text
+
+
+def _expand_ranges(ranges: str) -> list[str]:
+    """Reverse _format_ranges."""
+    width = 0
+    numbers = []
+    for part in ranges.split(","):
+        bounds = part.split("..")
+        if not numbers and bounds[0].startswith("0") and len(bounds[0]) > 1:
+            width = len(bounds[0])
+        if len(bounds) == 1:
+            numbers.append(bounds[0])
+            continue
+        step = int(bounds[2]) if len(bounds) == 3 else 1
+        numbers.extend(str(number).zfill(width) for number in range(int(bounds[0]), int(bounds[1]) + 1, step))
+    return numbers
+
+
+def _decode_files(line: str) -> list[str]:
+    """Reverse _encode_files for one line."""
+    match = _SERIES_LINE_PATTERN.match(line)
+    if match:
+        prefix, ranges, suffix = match.groups()
+        return [f"{prefix}{number}{suffix}" for number in _expand_ranges(ranges)]
+
+    if line.startswith("*.") and ": " in line:
+        extension, stems = line[len("*."):].split(": ", 1)
+        return [f"{_unquote(stem.strip())}.{extension}" for stem in _LIST_ITEM_PATTERN.findall(stems)]
+
+    return [_unquote(line)]
+
+
+def decode_tree(text: str) -> dict:
+    """
+    Turn the compact encoding of a tree back into a get_working_directory result.
+
+    Args:
+        text: The output of encode_tree.
+
+    Returns:
+        dict: The tree, with the files of each directory in the order of the encoding.
+    """
+    tree = {}
+    features = {}
+    version = next_cursor = None
+    stack = []
+    in_features = False
+    for line in text.splitlines():
+        if line == "features:":
+            in_features = True
+            continue
+        if in_features and line.startswith(INDENT):
+            item = line[len(INDENT):]
+            if item.startswith('"'):
+                path, end = json.JSONDecoder().raw_decode(item)
+                features[path] = item[end + len(": "):]
+            else:
+                path, description = item.split(": ", 1)
+                features[path] = description
+            continue
+        in_features = False
+
+        if line.startswith("version: "):
+            version = line[len("version: "):]
+            continue
+        if line.startswith("next_cursor: "):
+            next_cursor = line[len("next_cursor: "):]
+            continue
+
+        stripped = line.lstrip(" ")
+        level = (len(line) - len(stripped)) // len(INDENT)
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+
+        if stripped.endswith("/"):
+            name = _unquote(stripped[:-1])
+            if stack:
+                tree[stack[-1][1]].append(name)
+                path = f"{stack[-1][1]}/{name}"
+            else:
+                path = name
+            tree.setdefault(path, [])
+            stack.append((level, path))
+        elif stack:
+            tree[stack[-1][1]].extend(_decode_files(stripped))
+
+    result = {"version": version} if version is not None else {}
+    result.update(tree)
+    if features:
+        result["features"] = features
+    if next_cursor is not None:
+        result["next_cursor"] = next_cursor
+    return result
+
+
+def format_observation(result) -> str:
+    """
+    Render a tool result in the selected observation encoding.
+
+    Args:
+        result: The result of a tool.
+
+    Returns:
+        str: The text of the result in the observation.
+    """
+    if observation_encoding == "compact" and _is_tree(result):
+        return encode_tree(result)
+    return str(result)
+
+
+def format_observations(results: list) -> str:
+    """
+    Render the results of several tool calls of one response in the selected observation encoding.
+
+    Args:
+        results: The results in the order of the calls.
+
+    Returns:
+        str: The text of the results in the observation, a list in the repr encoding, numbered lines in the compact one.
+    """
+    if observation_encoding == "compact":
+        return "".join(f"\n[{index}] {format_observation(result)}" for index, result in enumerate(results, start=1))
+    return str(results)
+
+
+def encoding_token_counts(result) -> dict[str, int]:
+    """
+    Estimate the tokens of a tool result in every encoding, and as JSON for reference.
+
+    Args:
+        result: The result of a tool.
+
+    Returns:
+        dict: The estimated number of tokens per encoding.
+    """
+    counts = {"repr": estimate_tokens(str(result)), "json": estimate_tokens(json.dumps(result))}
+    counts["compact"] = estimate_tokens(encode_tree(result)) if _is_tree(result) else counts["repr"]
+    return counts
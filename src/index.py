@@ -0,0 +1,382 @@
+"""
+Directory Index
+
+This module implements a persistent index of a working directory in SQLite, so listing a large tree does
+not have to walk it on disk every time. Every entry is stored with its type, size and modification time,
+and the tree fingerprint is kept alongside.
+
+The index is refreshed incrementally. Adding, removing or renaming an entry changes the modification
+time of its directory, so a refresh only stats the directories and rescans the ones whose modification
+time changed; unchanged subtrees are skipped. The size and modification time of a file are as of the last
+rescan of its directory. A directory modified within RACY_SECONDS of its rescan is rescanned again on the
+next refresh, since a change in the same clock tick would not show in its modification time.
+
+The index file lives next to the working directory, like the move journals, so it never shows up in the
+tree. The tools keep it up to date in place when they create or move entries (see src/tools.py).
+
+The fingerprint is the sum of the path digests of the entries (see path_digest in src/tree_walk.py).
+
+Functions:
+1. default_index_path(directory): Returns the path of the index file of a working directory.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Iterator
+from contextlib import contextmanager
+
+from src.tree_walk import walk_tree, path_digest
+
+logger = logging.getLogger(__name__)
+
+# Version of the index schema, an index with another version is rebuilt
+INDEX_FORMAT_VERSION = 1
+
+# A directory modified this close to its rescan is rescanned on the next refresh as well
+RACY_SECONDS = 2
+
+# Number of rows inserted per statement while a subtree is indexed
+INSERT_BATCH_SIZE = 10000
+
+# Fingerprints are sums of path digests modulo 2**64
+FINGERPRINT_MASK = 0xFFFFFFFFFFFFFFFF
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    is_symlink INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_by_parent ON entries (parent, is_dir DESC, name);
+CREATE INDEX IF NOT EXISTS directories ON entries (path) WHERE is_dir = 1 AND is_symlink = 0;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def default_index_path(directory: str) -> str:
+    """Return the index file of a working directory, next to it so it is not part of the tree."""
+    parent, name = os.path.split(os.path.normpath(os.path.abspath(directory)))
+    return os.path.join(parent, f".{name}.index.sqlite")
+
+
+def _subtree_bounds(key: str) -> tuple[str, str]:
+    """Return the range of paths strictly inside a directory, "/" sorts right before "0"."""
+    return f"{key}/", f"{key}0"
+
+
+class DirectoryIndex:
+    """A persistent, incrementally refreshed index of the entries of one working directory."""
+    def __init__(self, directory: str, path: str | None = None) -> None:
+        """
+        Opens the index of a working directory, creating it if needed.
+
+        Args:
+            directory: The working directory on disk that "root" refers to.
+            path: The index file, defaults to a hidden file next to the working directory.
+        """
+        self.directory = directory
+        self.path = path or default_index_path(directory)
+        self.stats = {"directories_checked": 0, "directories_scanned": 0}
+        self._lock = threading.RLock()
+
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA busy_timeout=5000")
+
+        version = self._meta("format_version")
+        if version is not None and int(version) != INDEX_FORMAT_VERSION:
+            logger.info(f"Rebuilding the directory index {self.path} with format version {INDEX_FORMAT_VERSION}")
+            self._connection.executescript("DROP TABLE IF EXISTS entries; DROP TABLE IF EXISTS meta;")
+        self._connection.executescript(_SCHEMA)
+        self._set_meta("format_version", INDEX_FORMAT_VERSION)
+        self.fingerprint = int(self._meta("fingerprint") or 0)
+
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+    def _meta(self, key: str) -> str | None:
+        """Read a value of the meta table."""
+        try:
+            row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError:
+            # The table does not exist yet
+            return None
+        return row[0] if row else None
+
+
+    def _set_meta(self, key: str, value) -> None:
+        """Write a value of the meta table."""
+        self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+    def _to_disk_path(self, key: str) -> str:
+        """Replace the leading "root" of an agent path with the working directory."""
+        return self.directory + key[len("root"):].replace("/", os.sep)
+
+
+    def refresh(self, key: str = "root", depth: int | None = None) -> None:
+        """
+        Bring the index of a directory up to date with the disk, rescanning only the modified directories.
+
+        Args:
+            key: The agent path of the directory to refresh, "root" for the whole tree.
+            depth: Only directories this many levels deep are checked, None for the whole subtree.
+
+        Raises:
+            UnicodeEncodeError: If the tree holds a name that cannot be stored, the caller should walk the disk.
+        """
+        started = time.time()
+        with self._lock, self._transaction():
+            low, high = _subtree_bounds(key)
+            directories = self._connection.execute(
+                "SELECT path, mtime_ns FROM entries WHERE is_dir = 1 AND is_symlink = 0 AND path >= ? AND path < ? "
+                "UNION ALL SELECT path, mtime_ns FROM entries WHERE is_dir = 1 AND is_symlink = 0 AND path = ?",
+                (low, high, key)
+            ).fetchall()
+
+            if key not in dict(directories):
+                # Never indexed, or not a directory any more
+                self._remove(key)
+                if os.path.isdir(self._to_disk_path(key)) and not os.path.islink(self._to_disk_path(key)):
+                    self._insert_entry(key, os.stat(self._to_disk_path(key)), is_dir=True, is_symlink=False, racy_after=started)
+                    self._add_subtree(key, started)
+                self._set_meta("fingerprint", self.fingerprint)
+                return
+
+            base_level = key.count("/")
+            for path, mtime_ns in sorted(directories, key=lambda row: row[0].count("/")):
+                level = path.count("/") - base_level + 1
+                if depth is not None and level > depth:
+                    continue
+
+                self.stats["directories_checked"] += 1
+                try:
+                    stat = os.stat(self._to_disk_path(path))
+                except OSError:
+                    # Removed together with a parent that was rescanned already, or removed on disk
+                    self._remove(path)
+                    continue
+                if stat.st_mtime_ns != mtime_ns or mtime_ns == 0:
+                    self._rescan_directory(path, stat, started)
+
+            self._set_meta("fingerprint", self.fingerprint)
+
+
+    def update(self, paths: list[str]) -> None:
+        """
+        Apply entries the tools created, moved or removed to the index in place.
+
+        Args:
+            paths: Agent paths of the entries that changed, whether they exist now or not.
+        """
+        started = time.time()
+        with self._lock, self._transaction():
+            if self._connection.execute("SELECT 1 FROM entries WHERE path = 'root'").fetchone() is None:
+                # Not built yet, the next refresh indexes the whole tree
+                return
+            for path in paths:
+                disk_path = self._to_disk_path(path)
+                self._remove(path)
+                if not os.path.lexists(disk_path):
+                    continue
+
+                is_symlink = os.path.islink(disk_path)
+                stat = os.stat(disk_path) if not is_symlink or os.path.exists(disk_path) else os.lstat(disk_path)
+                is_dir = os.path.isdir(disk_path)
+                self._insert_entry(path, stat, is_dir, is_symlink, racy_after=started)
+                if is_dir and not is_symlink:
+                    self._add_subtree(path, started)
+            self._set_meta("fingerprint", self.fingerprint)
+
+
+    def scan(
+        self,
+        key: str = "root",
+        depth: int | None = None,
+        after: tuple[str, str, bool] | None = None
+    ) -> Iterator[tuple[str, str | None]]:
+        """
+        Walk the indexed tree in the order of the disk walk of the tools (see src/tree_walk.py).
+
+        For every directory it first yields (directory_key, None), then (directory_key, name) for each of
+        its entries, directories first and sorted by name. The children of one directory are read at a time,
+        so a walk that stops after one page only reads the directories of that page.
+
+        Args:
+            key: The agent path of the starting directory.
+            depth: Maximum number of directory levels to list, 1 lists only the starting directory.
+            after: The directory, name and type of the entry to resume after, None to walk from the start.
+
+        Yields:
+            tuple: The agent path of a directory and the name of one of its entries or None.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT is_dir, is_symlink FROM entries WHERE path = ?", (key,)).fetchone()
+        if row is None or not row[0] or row[1]:
+            return
+
+        def list_directory(directory_key: str) -> list[tuple[str, bool, bool]]:
+            with self._lock:
+                children = self._connection.execute(
+                    "SELECT name, is_dir, is_symlink FROM entries WHERE parent = ? ORDER BY is_dir DESC, name",
+                    (directory_key,)
+                ).fetchall()
+            return [(name, bool(is_dir), bool(is_dir) and not is_symlink) for name, is_dir, is_symlink in children]
+
+        yield from walk_tree(list_directory, key, depth, after)
+
+
+    @contextmanager
+    def _transaction(self):
+        """Run the block in one transaction, rolled back if it fails."""
+        self._connection.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+
+    def _insert_entry(self, path: str, stat: os.stat_result, is_dir: bool, is_symlink: bool, racy_after: float) -> None:
+        """Insert one entry and add it to the fingerprint, the root entry is not part of the fingerprint."""
+        parent, _, name = path.rpartition("/")
+        self._connection.execute(
+            "INSERT INTO entries (path, parent, name, is_dir, is_symlink, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, parent or None, name, int(is_dir), int(is_symlink), stat.st_size, _checked_mtime(stat, is_dir and not is_symlink, racy_after))
+        )
+        if parent:
+            self.fingerprint = (self.fingerprint + path_digest(path)) & FINGERPRINT_MASK
+
+
+    def _remove(self, path: str) -> None:
+        """Remove an entry and everything below it, and take them out of the fingerprint."""
+        low, high = _subtree_bounds(path)
+        removed = self._connection.execute(
+            "SELECT path, parent FROM entries WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high)
+        ).fetchall()
+        if not removed:
+            return
+
+        self.fingerprint = (self.fingerprint - sum(path_digest(row[0]) for row in removed if row[1])) & FINGERPRINT_MASK
+        self._connection.execute("DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)", (path, low, high))
+
+
+    def _add_subtree(self, key: str, racy_after: float) -> None:
+        """Index everything below a directory that is not indexed yet."""
+        stack = [key]
+        rows = []
+        digests = 0
+        while stack:
+            current_key = stack.pop()
+            self.stats["directories_scanned"] += 1
+            try:
+                with os.scandir(self._to_disk_path(current_key)) as iterator:
+                    entries = list(iterator)
+            except OSError as e:
+                logger.debug(f"Skipping {current_key}: {e}")
+                continue
+
+            for entry in entries:
+                path = f"{current_key}/{entry.name}"
+                row = _entry_row(path, current_key, entry, racy_after)
+                if row is None:
+                    continue
+                rows.append(row)
+                digests += path_digest(path)
+                if row[3] and not row[4]:
+                    stack.append(path)
+
+            if len(rows) >= INSERT_BATCH_SIZE:
+                self._insert_rows(rows)
+                rows = []
+
+        self._insert_rows(rows)
+        self.fingerprint = (self.fingerprint + digests) & FINGERPRINT_MASK
+
+
+    def _insert_rows(self, rows: list[tuple]) -> None:
+        """Insert a batch of entry rows."""
+        if rows:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries (path, parent, name, is_dir, is_symlink, size, mtime_ns) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+
+    def _rescan_directory(self, key: str, stat: os.stat_result, racy_after: float) -> None:
+        """List a modified directory and apply the entries that appeared, disappeared or changed."""
+        self.stats["directories_scanned"] += 1
+        try:
+            with os.scandir(self._to_disk_path(key)) as iterator:
+                on_disk = {entry.name: entry for entry in iterator}
+        except OSError as e:
+            logger.debug(f"Skipping {key}: {e}")
+            return
+
+        indexed = {
+            name: (is_dir, is_symlink, size, mtime_ns)
+            for name, is_dir, is_symlink, size, mtime_ns in self._connection.execute(
+                "SELECT name, is_dir, is_symlink, size, mtime_ns FROM entries WHERE parent = ?", (key,)
+            )
+        }
+
+        for name in indexed.keys() - on_disk.keys():
+            self._remove(f"{key}/{name}")
+
+        for name, entry in on_disk.items():
+            path = f"{key}/{name}"
+            row = _entry_row(path, key, entry, racy_after)
+            if row is None:
+                continue
+
+            known = indexed.get(name)
+            if known is not None and known[:2] == row[3:5]:
+                # Subdirectories are checked on their own, files only get their metadata updated
+                if not row[3] and known[2:] != row[5:]:
+                    self._connection.execute("UPDATE entries SET size = ?, mtime_ns = ? WHERE path = ?", (row[5], row[6], path))
+                continue
+
+            # A new entry, or one whose type changed
+            if known is not None:
+                self._remove(path)
+            self._insert_rows([row])
+            self.fingerprint = (self.fingerprint + path_digest(path)) & FINGERPRINT_MASK
+            if row[3] and not row[4]:
+                self._add_subtree(path, racy_after)
+
+        self._connection.execute("UPDATE entries SET mtime_ns = ? WHERE path = ?", (_checked_mtime(stat, True, racy_after), key))
+
+
+def _checked_mtime(stat: os.stat_result, is_directory: bool, racy_after: float) -> int:
+    """Return the modification time to record, 0 for a directory modified too recently to trust on the next refresh."""
+    if is_directory and stat.st_mtime >= racy_after - RACY_SECONDS:
+        return 0
+    return stat.st_mtime_ns
+
+
+def _entry_row(path: str, parent: str, entry: os.DirEntry, racy_after: float) -> tuple | None:
+    """Build the row of a directory entry, None if it vanished while it was being read."""
+    try:
+        is_symlink = entry.is_symlink()
+        is_dir = entry.is_dir()
+        stat = entry.stat(follow_symlinks=False) if is_symlink else entry.stat()
+    except OSError:
+        return None
+    mtime_ns = _checked_mtime(stat, is_dir and not is_symlink, racy_after)
+    return path, parent, entry.name, int(is_dir), int(is_symlink), stat.st_size, mtime_ns
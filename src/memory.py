@@ -0,0 +1,199 @@
+"""
+Conversation Memory
+
+This module implements a token-budgeted memory for the agent's message history. Every step of the loop
+appends the assistant response and an observation, and the whole history is sent on every call. Once
+the history is over its token budget, the memory compacts it in place:
+
+1. The system message and the most recent turns are pinned and never touched.
+2. Older observations are collapsed, oldest first, into one-line summaries. Old tree snapshots are
+   marked as superseded by the latest one.
+3. If that is not enough, long older assistant messages (e.g. large move_files calls) are truncated.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import ast
+import logging
+import re
+from dataclasses import dataclass
+
+from src.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+OBSERVATION_PREFIX = "Observation: "
+COMPACTED_MARKER = "[compacted"
+
+# Older assistant messages longer than this are truncated in the last compaction pass
+MAX_ASSISTANT_CHARS = 600
+
+# Observations longer than this are not parsed back into a tool result to summarize them
+MAX_PARSED_CHARS = 20000
+
+# The version and the directory keys of a tree snapshot in the repr encoding
+SNAPSHOT_VERSION = re.compile(r"'version': '([0-9a-f]+)'")
+SNAPSHOT_DIRECTORY = re.compile(r"'root(?:/[^']*)?': \[")
+
+
+@dataclass
+class MemoryStats:
+    """Token counts of the history sent with one LLM call."""
+    tokens_sent: int
+    tokens_saved: int
+    compacted_messages: int
+
+
+class ConversationMemory:
+    """Keeps the message history of an agent within a token budget."""
+    def __init__(self, token_budget: int = 16000, pinned_turns: int = 2) -> None:
+        """
+        Initializes the memory.
+
+        Args:
+            token_budget: The number of tokens the history should stay under.
+            pinned_turns: Number of most recent user/assistant turns that are never compacted.
+        """
+        self.token_budget = token_budget
+        self.pinned_turns = pinned_turns
+        self.calls: list[MemoryStats] = []
+        self._tokens_removed = 0
+
+
+    @property
+    def total_tokens_saved(self) -> int:
+        """Number of prompt tokens saved over all calls."""
+        return sum(stats.tokens_saved for stats in self.calls)
+
+
+    def compact(self, messages: list[dict]) -> MemoryStats:
+        """
+        Compact the history in place if it is over the token budget and record the stats of the call.
+
+        Args:
+            messages: The message history of the agent, starting with the system message.
+
+        Returns:
+            MemoryStats: The tokens sent and saved for this call.
+        """
+        tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        compacted = 0
+
+        if tokens > self.token_budget:
+            # The system message and the last turns stay as they are
+            first = 1 if messages and messages[0]["role"] == "system" else 0
+            last = max(first, len(messages) - 2 * self.pinned_turns)
+            candidates = range(first, last)
+
+            latest_snapshot = max(
+                (index for index in range(first, len(messages)) if _is_snapshot(messages[index]["content"])),
+                default=None
+            )
+
+            # Observations first, oldest first, the latest snapshot only if everything else is not enough
+            observations = [index for index in candidates if _is_observation(messages[index]) and index != latest_snapshot]
+            if latest_snapshot in candidates:
+                observations.append(latest_snapshot)
+
+            for index in observations:
+                if tokens <= self.token_budget:
+                    break
+                content = messages[index]["content"]
+                summary = OBSERVATION_PREFIX + _summarize_observation(content, superseded=index != latest_snapshot)
+                tokens -= estimate_tokens(content) - estimate_tokens(summary)
+                self._tokens_removed += estimate_tokens(content) - estimate_tokens(summary)
+                messages[index]["content"] = summary
+                compacted += 1
+
+            for index in candidates:
+                if tokens <= self.token_budget:
+                    break
+                content = messages[index]["content"]
+                if messages[index]["role"] == "assistant" and len(content) > MAX_ASSISTANT_CHARS:
+                    truncated = f"{content[:MAX_ASSISTANT_CHARS]} {COMPACTED_MARKER}: {len(content) - MAX_ASSISTANT_CHARS} characters removed]"
+                    tokens -= estimate_tokens(content) - estimate_tokens(truncated)
+                    self._tokens_removed += estimate_tokens(content) - estimate_tokens(truncated)
+                    messages[index]["content"] = truncated
+                    compacted += 1
+
+            if tokens > self.token_budget:
+                logger.warning(f"History is {tokens} tokens after compaction, over the budget of {self.token_budget}")
+
+        # Everything removed so far would have been sent again with this call
+        stats = MemoryStats(tokens_sent=tokens, tokens_saved=self._tokens_removed, compacted_messages=compacted)
+        self.calls.append(stats)
+        if compacted:
+            logger.info(f"Compacted {compacted} messages, {stats.tokens_saved} tokens saved on this call")
+        return stats
+
+
+def _is_observation(message: dict) -> bool:
+    """Check if a message is an observation that was not compacted yet."""
+    content = message["content"]
+    return (
+        message["role"] == "user"
+        and content.startswith(OBSERVATION_PREFIX)
+        and not content[len(OBSERVATION_PREFIX):].startswith(COMPACTED_MARKER)
+    )
+
+
+def _is_snapshot(content: str) -> bool:
+    """Check if an observation holds a full tree snapshot of get_working_directory, in either encoding."""
+    head = content[len(OBSERVATION_PREFIX):200]
+    return content.startswith(OBSERVATION_PREFIX) and ("'root'" in head or head.startswith("root/\n") or "\nroot/\n" in head)
+
+
+def _summarize_observation(content: str, superseded: bool) -> str:
+    """
+    Summarize an observation in one line.
+
+    Args:
+        content: The observation message.
+        superseded: True if a later snapshot of the tree is in the history.
+
+    Returns:
+        str: The summary.
+    """
+    body = content[len(OBSERVATION_PREFIX):]
+
+    if _is_snapshot(content):
+        # Snapshots are the largest observations, they are summarized from the text without parsing it
+        reason = "see the later snapshot" if superseded else "call get_working_directory() for the current tree"
+        if not body.startswith(("{", "[")):
+            # The compact encoding, its first line is the version
+            first_line = body.split("\n", 1)[0]
+            version = f" (version {first_line.removeprefix('version: ')})" if first_line.startswith("version: ") else ""
+            lines = body.count("\n")
+            return f"{COMPACTED_MARKER}: tree snapshot{version} of {lines} lines, {reason}]"
+        match = SNAPSHOT_VERSION.search(body[:200])
+        version = f" (version {match.group(1)})" if match else ""
+        directories = len(SNAPSHOT_DIRECTORY.findall(body))
+        return f"{COMPACTED_MARKER}: tree snapshot{version} of {directories} directories, {reason}]"
+
+    result = None
+    if len(body) <= MAX_PARSED_CHARS:
+        try:
+            result = ast.literal_eval(body)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            result = None
+
+    if not isinstance(result, dict):
+        return f"{COMPACTED_MARKER}: {body[:200]}]"
+
+    version = f" (version {result['version']})" if "version" in result else ""
+
+    if "created" in result:
+        created = result["created"]
+        listed = ", ".join(created[:5]) + (f" and {len(created) - 5} more" if len(created) > 5 else "")
+        return f"{COMPACTED_MARKER}: created {len(created)} directories{version}: {listed}]"
+
+    if "moved" in result and "msg" not in result:
+        destinations = sorted({path.rsplit("/", 1)[0] for path in result["moved"].values()})
+        listed = ", ".join(destinations[:5]) + (f" and {len(destinations) - 5} more" if len(destinations) > 5 else "")
+        return f"{COMPACTED_MARKER}: moved {len(result['moved'])} entries{version} into {listed}]"
+
+    if "msg" in result:
+        return f"{COMPACTED_MARKER}: {result['msg']}]"
+
+    return f"{COMPACTED_MARKER}: {body[:200]}]"
@@ -0,0 +1,345 @@
+"""
+Bulk Move Engine
+
+This module implements the transactional engine behind the move_files tool. A batch of moves is
+validated as a whole before anything is touched, then applied with an os.rename fast path for
+entries on the same device and a thread pool for the remaining (cross-device) moves. Every batch
+is recorded in an on-disk journal first, so a batch that fails halfway, or a process that dies
+halfway, can be rolled back to the state before the batch.
+
+Batches and recoveries hold an exclusive lock on the journal directory, so processes and threads
+working on the same directory wait for each other instead of rolling back a batch that is still
+being applied. Recovery is not part of a batch, run it once before the first batch (see
+recover_interrupted_moves in src/tools.py).
+
+Usage:
+    engine = MoveEngine(journal_directory=".working_directory.journal")
+    engine.recover()
+    result = engine.move({"working_directory/a.pdf": "working_directory/documents"})
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import os
+import json
+import uuid
+import shutil
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, batches are not locked against other processes there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Number of completed moves buffered before the journal is flushed
+JOURNAL_FLUSH_INTERVAL = 1000
+
+
+@dataclass
+class MoveOperation:
+    """A single validated move with its final destination path."""
+    source: str
+    destination: str
+    is_dir: bool
+    device: int = -1
+
+
+@dataclass
+class MoveResult:
+    """
+    The outcome of a batch of moves.
+
+    Attributes:
+        moved: The operations that are applied on disk once the batch has finished.
+        errors: A mapping of source paths to the reason they could not be moved.
+        rolled_back: True if the batch failed and the applied moves were undone.
+    """
+    moved: list[MoveOperation] = field(default_factory=list)
+    errors: dict[str, str] = field(default_factory=dict)
+    rolled_back: bool = False
+
+    @property
+    def ok(self) -> bool:
+        """Check if the whole batch was applied."""
+        return not self.errors
+
+
+def _is_within(path: str, directory: str) -> bool:
+    """Check if path is the directory itself or lies inside it."""
+    return path == directory or path.startswith(directory + os.sep)
+
+
+def plan_moves(file_map: dict[str, str]) -> tuple[list[MoveOperation], dict[str, str]]:
+    """
+    Validate a whole mapping of moves and resolve their final destinations.
+
+    A destination that is an existing directory receives the source under its own name, like
+    shutil.move does, any other destination is the new path of the source.
+
+    Args:
+        file_map: A dictionary of source paths as keys and destination paths as values.
+
+    Returns:
+        tuple: The planned operations and a mapping of invalid sources to the reason.
+    """
+    operations = []
+    errors = {}
+    claimed = {}
+
+    # Many moves share a destination directory, so only check each directory once
+    directory_cache = {}
+
+    def is_directory(path: str) -> bool:
+        if path not in directory_cache:
+            directory_cache[path] = os.path.isdir(path)
+        return directory_cache[path]
+
+    for source, destination in file_map.items():
+        source = os.path.normpath(source)
+        destination = os.path.normpath(destination)
+
+        try:
+            source_stat = os.lstat(source)
+        except OSError:
+            errors[source] = "source does not exist"
+            continue
+
+        if is_directory(destination):
+            final = os.path.join(destination, os.path.basename(source))
+        else:
+            final = destination
+        is_dir = os.path.isdir(source) and not os.path.islink(source)
+
+        if final == source:
+            errors[source] = "destination is the same as the source"
+        elif is_dir and _is_within(final, source):
+            errors[source] = "cannot move a directory into itself"
+        elif not is_directory(os.path.dirname(final) or "."):
+            errors[source] = "destination directory does not exist"
+        elif os.path.lexists(final):
+            errors[source] = "destination already exists"
+        elif final in claimed:
+            errors[source] = "destination collides with another move in the batch"
+        else:
+            claimed[final] = source
+            operations.append(MoveOperation(source, final, is_dir, source_stat.st_dev))
+
+    # Moves that read or write inside a directory that is moved in the same batch depend on the
+    # order they run in, which a parallel batch cannot guarantee
+    moved_directories = {operation.source for operation in operations if operation.is_dir}
+    if moved_directories:
+        for operation in operations:
+            for path in (os.path.dirname(operation.source), os.path.dirname(operation.destination)):
+                ancestor = path
+                while ancestor and ancestor != os.path.dirname(ancestor):
+                    if ancestor in moved_directories:
+                        errors[operation.source] = "depends on a directory that is moved in the same batch"
+                        break
+                    ancestor = os.path.dirname(ancestor)
+
+    return [operation for operation in operations if operation.source not in errors], errors
+
+
+class MoveEngine:
+    """Applies validated batches of moves in parallel, with a journal for rollback and recovery."""
+    def __init__(self, journal_directory: str, max_workers: int | None = None) -> None:
+        """
+        Initializes the engine.
+
+        Args:
+            journal_directory: The directory the batch journals are written to.
+            max_workers: Number of threads used for cross-device moves, None for the default.
+        """
+        self.journal_directory = journal_directory
+        self.max_workers = max_workers
+
+
+    @contextmanager
+    def _locked(self):
+        """Hold an exclusive lock on the journal directory while a batch or a recovery runs."""
+        os.makedirs(self.journal_directory, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+
+        descriptor = os.open(self.journal_directory, os.O_RDONLY)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            yield
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(descriptor)
+
+
+    def move(self, file_map: dict[str, str]) -> MoveResult:
+        """
+        Validate and apply a batch of moves as one transaction.
+
+        Args:
+            file_map: A dictionary of source paths as keys and destination paths as values.
+
+        Returns:
+            MoveResult: The applied moves, or the errors if the batch was rejected or rolled back.
+        """
+        # Validate under the lock as well, another batch may change the tree until it is taken
+        with self._locked():
+            return self._move(file_map)
+
+
+    def _move(self, file_map: dict[str, str]) -> MoveResult:
+        """Validate and apply a batch of moves, the caller holds the lock."""
+        operations, errors = plan_moves(file_map)
+        if errors:
+            logger.error(f"Rejected batch of {len(file_map)} moves: {len(errors)} invalid entries")
+            return MoveResult(errors=errors)
+        if not operations:
+            return MoveResult()
+
+        journal_path = os.path.join(self.journal_directory, f"{uuid.uuid4().hex}.jsonl")
+
+        with open(journal_path, "w", encoding="utf-8") as journal:
+            # Write ahead the whole batch, this is all recovery needs after a crash
+            json.dump({"moves": [[operation.source, operation.destination] for operation in operations]}, journal)
+            journal.write("\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+            applied, errors = self._apply(operations, journal)
+
+        if errors:
+            logger.error(f"Move batch failed on {len(errors)} entries, rolling back {len(applied)} moves")
+            remaining = self._rollback(applied)
+            if not remaining:
+                os.remove(journal_path)
+            return MoveResult(moved=remaining, errors=errors, rolled_back=not remaining)
+
+        os.remove(journal_path)
+        logger.info(f"Move batch of {len(applied)} entries committed")
+        return MoveResult(moved=applied)
+
+
+    def _apply(self, operations: list[MoveOperation], journal) -> tuple[list[MoveOperation], dict[str, str]]:
+        """
+        Apply the operations, renaming in place where possible and using the thread pool otherwise.
+
+        Returns:
+            tuple: The applied operations in the order they completed and the errors.
+        """
+        applied = []
+        errors = {}
+        pending_records = []
+
+        def record(index: int, operation: MoveOperation) -> None:
+            applied.append(operation)
+            pending_records.append(f'{{"done": {index}}}\n')
+            if len(pending_records) >= JOURNAL_FLUSH_INTERVAL:
+                journal.writelines(pending_records)
+                journal.flush()
+                pending_records.clear()
+
+        cross_device = []
+        devices = {}
+        for index, operation in enumerate(operations):
+            # Same device: a single rename syscall, no data is copied
+            destination_directory = os.path.dirname(operation.destination) or "."
+            if destination_directory not in devices:
+                devices[destination_directory] = os.stat(destination_directory).st_dev
+            if operation.device != devices[destination_directory]:
+                cross_device.append((index, operation))
+                continue
+            try:
+                os.rename(operation.source, operation.destination)
+                record(index, operation)
+            except OSError as e:
+                errors[operation.source] = str(e)
+                break
+
+        if cross_device and not errors:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    executor.submit(shutil.move, operation.source, operation.destination): (index, operation)
+                    for index, operation in cross_device
+                }
+                for future in as_completed(futures):
+                    index, operation = futures[future]
+                    try:
+                        future.result()
+                        record(index, operation)
+                    except Exception as e:
+                        errors[operation.source] = str(e)
+                        # Don't start moves that are still queued, they would only be rolled back
+                        for other in futures:
+                            other.cancel()
+
+        journal.writelines(pending_records)
+        journal.flush()
+        return applied, errors
+
+
+    @staticmethod
+    def _rollback(applied: list[MoveOperation]) -> list[MoveOperation]:
+        """
+        Undo applied operations in reverse order.
+
+        Returns:
+            list: The operations that could not be undone.
+        """
+        remaining = []
+        for operation in reversed(applied):
+            try:
+                shutil.move(operation.destination, operation.source)
+            except Exception as e:
+                logger.error(f"Failed to roll back {operation.destination}: {e}")
+                remaining.append(operation)
+        return remaining
+
+
+    def recover(self) -> int:
+        """
+        Roll back every batch left in the journal directory by an interrupted process.
+
+        A batch that another process is still applying holds the lock, so it finishes first and leaves no
+        journal behind.
+
+        Returns:
+            int: Number of moves that were rolled back.
+        """
+        if not os.path.isdir(self.journal_directory):
+            return 0
+        with self._locked():
+            return self._recover()
+
+
+    def _recover(self) -> int:
+        """Roll back the batches left in the journal directory, the caller holds the lock."""
+        rolled_back = 0
+        for name in sorted(os.listdir(self.journal_directory)):
+            journal_path = os.path.join(self.journal_directory, name)
+            try:
+                with open(journal_path, encoding="utf-8") as journal:
+                    header = json.loads(journal.readline())
+            except (OSError, ValueError) as e:
+                logger.error(f"Skipping unreadable journal {journal_path}: {e}")
+                continue
+
+            # A move is applied exactly when its destination exists and its source does not
+            applied = [
+                MoveOperation(source, destination, os.path.isdir(destination))
+                for source, destination in header["moves"]
+                if os.path.lexists(destination) and not os.path.lexists(source)
+            ]
+            remaining = self._rollback(applied)
+            rolled_back += len(applied) - len(remaining)
+            if not remaining:
+                os.remove(journal_path)
+
+        if rolled_back:
+            logger.info(f"Recovered {rolled_back} moves from interrupted batches")
+        return rolled_back
@@ -0,0 +1,265 @@
+"""
+Organization Plans
+
+This module implements plans: the complete set of directories to create and files to move, decided up front
+instead of step by step. A plan is parsed from the JSON an LLM returns, validated against a snapshot of the
+tree and applied with one create_directory and one move_files call.
+
+A plan in JSON looks like this, moves either map each file to its destination or each destination to its files:
+    {"directories": ["root/documents"], "moves": {"root/a.pdf": "root/documents"}}
+    {"directories": ["root/documents"], "moves": {"root/documents": ["root/a.pdf", "root/b.pdf"]}}
+
+Functions:
+1. parse_plan(text): Parses a plan out of an LLM response.
+2. validate_plan(plan, tree): Checks a plan against the tree and drops the moves that would fail.
+3. reconcile_taxonomies(plans): Maps folder names that only differ in spelling to one name.
+4. merge_plans(plans): Merges the plans of several shards into one.
+5. apply_plan(plan): Applies a plan with one bulk create and one bulk move.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import re
+import ast
+import json
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+
+from src.tools import create_directory, move_files
+from src.tracing import span, tool_attributes
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Plan:
+    """The directories to create and the destination directory of every file to move."""
+    directories: list[str] = field(default_factory=list)
+    moves: dict[str, str] = field(default_factory=dict)
+
+
+def parse_plan(text: str) -> Plan:
+    """
+    Parse a plan out of an LLM response.
+
+    Args:
+        text: The response, the plan is the outermost JSON object in it.
+
+    Returns:
+        Plan: The parsed plan.
+
+    Raises:
+        ValueError: If the response contains no well-formed plan.
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("response contains no JSON object")
+
+    payload = text[start:end + 1]
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        # Models sometimes answer with Python literals, e.g. single quotes
+        try:
+            data = ast.literal_eval(payload)
+        except (ValueError, SyntaxError) as e:
+            raise ValueError(f"plan is not valid JSON: {e}") from None
+
+    if not isinstance(data, dict):
+        raise ValueError("plan must be a JSON object")
+
+    directories = data.get("directories", [])
+    moves = data.get("moves", {})
+    if not isinstance(directories, list) or not all(isinstance(path, str) for path in directories):
+        raise ValueError("directories must be a list of paths")
+    if not isinstance(moves, dict):
+        raise ValueError("moves must be an object")
+
+    plan = Plan(directories=list(directories))
+    for key, value in moves.items():
+        if isinstance(value, str):
+            plan.moves[key] = value
+        elif isinstance(value, list) and all(isinstance(path, str) for path in value):
+            # Grouped form: the key is the destination of every listed file
+            for path in value:
+                plan.moves[path] = key
+        else:
+            raise ValueError(f"invalid destination for {key}")
+    return plan
+
+
+def _tree_index(tree: dict) -> tuple[set[str], set[str]]:
+    """Return the directory paths and the file paths of a get_working_directory result."""
+    directories = {key for key in tree if key == "root" or key.startswith("root/")}
+    files = {
+        f"{directory}/{name}"
+        for directory in directories for name in tree[directory]
+        if f"{directory}/{name}" not in directories
+    }
+    return directories, files
+
+
+def validate_plan(plan: Plan, tree: dict) -> tuple[Plan, dict[str, str]]:
+    """
+    Check a plan against a complete snapshot of the tree.
+
+    Moves that would not apply cleanly are dropped from the plan and reported, moves of a file into the
+    directory it is already in are dropped silently.
+
+    Args:
+        plan: The plan to check.
+        tree: A get_working_directory result listing the whole tree.
+
+    Returns:
+        tuple: The valid part of the plan and a mapping of rejected paths to the reason.
+    """
+    existing_directories, existing_files = _tree_index(tree)
+    errors = {}
+
+    directories = []
+    for path in plan.directories:
+        path = path.rstrip("/")
+        if not path.startswith("root/"):
+            errors[path] = "directory must be inside root"
+        elif path in existing_files:
+            errors[path] = "a file with this name exists"
+        elif path not in existing_directories and path not in directories:
+            directories.append(path)
+
+    # create_directory creates the missing parents as well
+    available = set(existing_directories)
+    for path in directories:
+        while path.startswith("root/"):
+            available.add(path)
+            path = path.rsplit("/", 1)[0]
+
+    moves = {}
+    targets = set()
+    for source, destination in plan.moves.items():
+        destination = destination.rstrip("/")
+        if source not in existing_files:
+            errors[source] = "file does not exist"
+            continue
+        if destination not in available:
+            errors[source] = "destination directory does not exist and is not created by the plan"
+            continue
+        if source.rsplit("/", 1)[0] == destination:
+            continue
+
+        target = f"{destination}/{source.rsplit('/', 1)[1]}"
+        if target in targets or target in existing_files or target in available:
+            errors[source] = "destination already holds an entry with this name"
+            continue
+        targets.add(target)
+        moves[source] = destination
+
+    return Plan(directories=directories, moves=moves), errors
+
+
+def _folder_key(path: str) -> str:
+    """Normalize a directory path so that spellings like "root/Photos" and "root/photo" compare equal."""
+    segments = []
+    for segment in path.split("/"):
+        segment = re.sub(r"[\s_\-]+", " ", segment.casefold()).strip()
+        segments.append(segment[:-1] if len(segment) > 3 and segment.endswith("s") else segment)
+    return "/".join(segments)
+
+
+def reconcile_taxonomies(plans: list[Plan], existing_directories: set[str] | None = None) -> dict[str, str]:
+    """
+    Map every directory of the plans to one spelling per folder.
+
+    Shards are planned independently, so they often name the same folder differently. Names that only
+    differ in case, separators or a plural s are merged; an existing directory wins, otherwise the
+    spelling that receives most files.
+
+    Args:
+        plans: The plans of the shards.
+        existing_directories: The directories that exist in the tree already.
+
+    Returns:
+        dict: A mapping of each directory spelling to the spelling to use instead.
+    """
+    usage = Counter()
+    for plan in plans:
+        usage.update(plan.directories)
+        usage.update(plan.moves.values())
+
+    groups = {}
+    for path in usage:
+        groups.setdefault(_folder_key(path), []).append(path)
+
+    renames = {}
+    for spellings in groups.values():
+        existing = [path for path in spellings if existing_directories and path in existing_directories]
+        canonical = existing[0] if existing else min(spellings, key=lambda path: (-usage[path], len(path), path))
+        for path in spellings:
+            if path != canonical:
+                renames[path] = canonical
+
+    if renames:
+        logger.info(f"Merged {len(renames)} folder names into the spelling used by most shards")
+    return renames
+
+
+def merge_plans(plans: list[Plan], renames: dict[str, str] | None = None) -> Plan:
+    """
+    Merge the plans of several shards into one, renaming directories to their reconciled spelling.
+
+    Args:
+        plans: The plans to merge.
+        renames: A mapping from reconcile_taxonomies, None to keep every spelling.
+
+    Returns:
+        Plan: The merged plan.
+    """
+    renames = renames or {}
+    merged = Plan()
+    seen = set()
+    for plan in plans:
+        for path in plan.directories:
+            path = renames.get(path, path)
+            if path not in seen:
+                seen.add(path)
+                merged.directories.append(path)
+        for source, destination in plan.moves.items():
+            merged.moves.setdefault(source, renames.get(destination, destination))
+    return merged
+
+
+def apply_plan(plan: Plan) -> dict:
+    """
+    Apply a validated plan with one bulk create_directory and one bulk move_files call.
+
+    Args:
+        plan: The plan, usually the first result of validate_plan.
+
+    Returns:
+        dict: The created directories, the applied moves and the new tree version, or the error of the failed tool.
+    """
+    result = {"created": [], "moved": {}}
+    if plan.directories:
+        with span("create_directory", "tool") as tool_span:
+            created = create_directory(plan.directories)
+            if tool_span is not None:
+                tool_span.set(**tool_attributes(created))
+        if "msg" in created:
+            return created
+        result["created"] = created.get("created", plan.directories)
+        result["version"] = created.get("version")
+
+    if plan.moves:
+        with span("move_files", "tool") as tool_span:
+            moved = move_files(plan.moves)
+            if tool_span is not None:
+                tool_span.set(**tool_attributes(moved))
+        if "msg" in moved:
+            moved["created"] = result["created"]
+            return moved
+        result["moved"] = moved.get("moved", plan.moves)
+        result["version"] = moved.get("version")
+
+    logger.info(f"Plan applied: {len(result['created'])} directories created, {len(result['moved'])} files moved")
+    return result
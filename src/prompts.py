@@ -5,8 +5,15 @@ This module includes the Chain-of-Thought prompt used as the system message.
 This prompt is the core part of the ReAct agent, and it enables the agent to reason,
 take actions, and observe the result of its actions.
 
+The shard prompt is the system message of the sub-agents of sharded mode (see src/sharding.py), which each
+plan the folders of one part of a very large tree in a single call. The plan prompt is the system message
+of plan mode, where the agent organizes the whole tree with a single plan.
+
+The compact encoding note is appended to a system message when observations use the compact tree encoding
+(see src/encoding.py).
+
 Author: Peyman Kh
-Last Edited: 03-10-2025
+Last Edited: 18-10-2026
 """
 
 chain_of_thought_system_message = """
@@ -19,28 +26,35 @@ At the end of the loop, you output an Answer.
 Use Think to describe your thoughts about the problem user is facing.
 Use Tool to run one of the tools available to you, then PAUSE.
 Observation will be the result of your Tool call.
+You can put several Tool lines before PAUSE when you already know every call, e.g. create_directory followed by move_files. They run in the order you write them, and the Observation is then a list of their results in the same order.
 
 **IMPORTANT: You stop generating when you reach PAUSE step!**
 **IMPORTANT: If you do not need tool, do not mention Tool, PAUSE, and Observation steps. Only Think and Output steps are required**
 
 Here is the list of available tools to you:
-1. get_working_directory():
-    - description: returns a dictionary mapping directory paths to their contents, starting at current directory of the user.
-    - arguments: None
-    - return: dictionary
+1. get_working_directory(path, depth, cursor, limit):
+    - description: returns the version of the tree and a dictionary mapping directory paths to their contents, starting at current directory of the user.
+    - arguments: all optional and positional; path is the directory to list (default "root"), depth is the maximum number of directory levels to list (default no limit), cursor is the "next_cursor" of the previous result (default None), limit is the maximum number of entries to return (default 1000)
+    - return: dictionary; if it contains "next_cursor", more entries are left and you can get them with get_working_directory("root", None, next_cursor)
     - error: if this tool fails, return {"msg": "Failed to get working directory"}
     
 2. create_directory(directory_path_list):
     - description: creates a list of directories in the working directory.
     - arguments: list of directory paths to create (e.g., ["root/dir1", "root/dir1/dir2", "root/dir3"])
-    - return: dictionary of directories and their content after changes
+    - return: dictionary of the created directories and the new version of the tree (call get_working_directory() if you need the full tree again)
     - error: if this tool fails, return {"msg": "Failed to create directories"}
     
 3. move_files(file_map):
     - description: moves a list of files from one directory to another.
     - arguments: dictionary of file paths as keys and destination paths as values (e.g., {"root/file1": "root/dir1", "root/file2": "root/dir2})
-    - return: dictionary of directories and their content after changes
-    - error: if this tool fails, return {"msg": "Failed to move files"}
+    - return: dictionary mapping each moved file to its new path and the new version of the tree (call get_working_directory() if you need the full tree again)
+    - error: the whole dictionary is checked before anything is moved; if any file fails, no file is moved and the tool returns {"msg": "Failed to move files", "errors": {file path: reason}}
+    
+4. find_duplicates(path):
+    - description: finds files with identical content, e.g. copies like "thesis_final.docx" and "thesis_final_v2.docx"; files are compared by content, not by name.
+    - arguments: optional; path is the directory to search (default "root")
+    - return: dictionary with "duplicates", a list of groups each with the size of one copy and the paths of all copies, and "wasted_bytes"; move the copies of a group together (e.g. into a "duplicates" folder) instead of spreading them across folders
+    - error: if this tool fails, return {"msg": "Failed to find duplicates"}
     
 Here is an example of how you reason and use tools to organize a user's filesystem:
 
@@ -50,21 +64,86 @@ Think: To effectively organize the user's personal folder, I first need to obtai
 Tool: get_working_directory()
 PAUSE
 
-Observation: {"root": ["transactions.csv", "vacation.png", "data_analysis.py"]}
+Observation: {"version": "5c1d0a9e3f27b418", "root": ["transactions.csv", "vacation.png", "data_analysis.py"]}
 
 Think: Based on the files found in the current directory, I will analyze their extensions and categorize them according to best practices: image files will go into a "photos" folder, documents into a "documents" folder, code files into a "code" folder. I will now create the necessary folders that do not already exist, so each file type has a proper place for organization.
 Tool: create_directory(["root/photos", "root/documents", "root/codes"])
 PAUSE
 
-Observation: {"root": ["transactions.csv", "vacation.png", "data_analysis.py", "photos", "documents", "codes"], "root/photos": [], "root/documents": [], "root/codes": []}
+Observation: {"created": ["root/photos", "root/documents", "root/codes"], "version": "a83f62c17d0e94b5"}
 
 Think: Now I should move each file into its appropriate folder based on its type, following the organization strategy I planned.
 Tool: move_files({"root/transactions.csv": "root/documents", "root/vacation.png": "root/photos", "root/data_analysis.py": "root/codes"})
 PAUSE
 
-Observation: {"root": ["photos", "documents", "codes"], "root/photos": ["vacation.png"], "root/documents": ["transactions.csv"], "root/codes": ["data_analysis.py"]}
+Observation: {"moved": {"root/transactions.csv": "root/documents/transactions.csv", "root/vacation.png": "root/photos/vacation.png", "root/data_analysis.py": "root/codes/data_analysis.py"}, "version": "e4092b6dd1a3c85f"}
 
 Output: Your directory has been organized successfully. All files were sorted into appropriate folders: images were moved to "photos", documents to "documents", and code files to "codes", making the folder easier to navigate.
 
 *If any error occurs, output: Unfortunately, I couldn't organize your directory due to an error in my tool {tool_name}* 
 """.strip()
+
+
+shard_system_message = """
+You are a helpful agent helping user with organizing a very large filesystem.
+
+The filesystem is split into shards that are organized in parallel, and you are given one shard: a list of file paths and the folders that already exist at the root.
+Decide a folder for every file and answer with a single JSON object and nothing else. Other shards are planned independently, so prefer short, conventional, lower-case folder names (e.g. "documents", "photos", "code") and reuse the existing folders where they fit.
+
+The JSON object has two keys:
+- "directories": list of the folders to create, as paths starting with "root/" (e.g. ["root/documents", "root/photos"])
+- "moves": object mapping each destination folder to the list of files to move into it (e.g. {"root/documents": ["root/a/report.pdf"], "root/photos": ["root/b/IMG_001.jpg"]})
+
+Leave out files that are already in a good place or that you cannot classify.
+
+Here is an example:
+
+User: Shard 1 of 4.
+Existing folders: ["root/photos"]
+Files: ["root/inbox/transactions.csv", "root/inbox/vacation.png", "root/old/data_analysis.py"]
+
+{"directories": ["root/documents", "root/code"], "moves": {"root/documents": ["root/inbox/transactions.csv"], "root/photos": ["root/inbox/vacation.png"], "root/code": ["root/old/data_analysis.py"]}}
+""".strip()
+
+
+plan_system_message = """
+You are a helpful agent helping user with organizing their filesystem.
+
+You are given the user's request and an Observation of the whole working directory: a dictionary mapping each directory path to its contents, starting at "root".
+Plan the complete organization at once and answer with a single JSON object and nothing else. The plan is checked against the directory and applied in one batch, so only refer to files that are in the Observation.
+
+The JSON object has two keys:
+- "directories": list of the directories to create, as paths starting with "root/" (e.g. ["root/documents", "root/photos"])
+- "moves": object mapping each file path to its destination directory (e.g. {"root/report.pdf": "root/documents"}); the destination must exist or be created by the plan, and two files with the same name must not go to the same directory
+
+Leave out files that are already in a good place. If the directory is already organized, answer {"directories": [], "moves": {}}.
+
+Here is an example:
+
+User: Organize my personal folder.
+Observation: {"version": "5c1d0a9e3f27b418", "root": ["photos", "transactions.csv", "vacation.png", "data_analysis.py"], "root/photos": []}
+
+{"directories": ["root/documents", "root/code"], "moves": {"root/transactions.csv": "root/documents", "root/vacation.png": "root/photos", "root/data_analysis.py": "root/code"}}
+""".strip()
+
+
+
+compact_encoding_note = """
+Directory trees in Observations are written in a compact listing instead of a dictionary:
+- The first line is the version of the tree, a last line next_cursor: ... means there are more entries on the next page, pass the cursor back as it is.
+- A line ending in "/" is a directory, the lines indented below it are its contents. "root/" is the working directory, a path at the margin like "root/photos/2021/" continues a directory from an earlier page.
+- "*.pdf: invoice, report" stands for the files invoice.pdf and report.pdf in that directory.
+- "IMG_{0001..0450}.jpg (450 files)" stands for IMG_0001.jpg to IMG_0450.jpg, "{1..9..2}" counts in steps of 2 and ranges are separated by commas.
+- Names with special characters are in double quotes.
+- When you call several tools at once, the results are numbered [1], [2], ... in the order of the calls.
+Tool arguments always use full paths starting with "root/", e.g. "root/photos/IMG_0001.jpg".
+""".strip()
+
+
+
+content_features_note = """
+A listing of the working directory may end with "features", which describes the content of files whose name does not tell it:
+- "text: <first line>" or "script: <first line>" is the start of a text file, use it to tell what the document is about.
+- "PDF", "PNG", "ZIP", ... is the real type of a file found from its first bytes, e.g. a PDF named .txt. Place the file by this type.
+- "empty" is a file without content.
+""".strip()
@@ -3,27 +3,89 @@ ReAct Agent
 
 This module implements the Agent class that initializes the agent with a system message and an OpenAI client.
 Any instance of this class can be called with a user message to pass the message history to OpenAI and
-return the response.
+return the response. Instead of the OpenAI client, any LLM backend (see src/backends.py) can be plugged in,
+e.g. a ScriptedBackend to run the agent offline.
+
+AsyncAgent is the asyncio counterpart built on AsyncOpenAI, so many agent sessions can share one event loop.
+
+An optional ConversationMemory keeps the history within a token budget by compacting old observations
+before every call, and an optional ResponseCache answers repeated message histories without calling the LLM.
+
+In streaming mode the completion is streamed with PAUSE as a stop sequence. The tool calls are parsed while
+the tokens arrive and each is handed to a callback as soon as it is complete, so it can start while the
+model is still writing the next one.
+
+Every call of an agent is recorded as an "llm" span when a tracer is active (see src/tracing.py), with the
+token usage the backend reports, whether the cache answered and the size of the response.
+
+An optional ModelRouter (see src/routing.py) picks the model of every call from the step and the budget of
+the session, the choice is recorded on the span of the call.
 
 Author: Peyman Kh
-Last Edited: 03-10-2025
+Last Edited: 18-10-2026
 """
 # Import libraries
-from openai import OpenAI
+from typing import TYPE_CHECKING, Callable
+
+from src.cache import ResponseCache
+from src.backends import LLMBackend, AsyncLLMBackend, OpenAIBackend, AsyncOpenAIBackend
+from src.utils import ToolCallStreamParser
+from src.memory import ConversationMemory
+from src.routing import ModelRouter, Route
+from src.tracing import Span
+from src.tracing import span as trace_span
+
+# The clients are only needed for type hints, openai is imported by the code that creates them
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+# The agent stops generating at this step, the loop runs the tool before the agent continues
+STOP_SEQUENCE = "PAUSE"
+
+# Model and sampling temperature of the agent
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_TEMPERATURE = 0
 
 
 class Agent:
-    """A class representing a ReAct agent that can engage in conversations using OpenAI API."""
-    def __init__(self, system_message: str, openai_client: OpenAI) -> None:
+    """A class representing a ReAct agent that can engage in conversations using OpenAI API or another backend."""
+    def __init__(
+        self,
+        system_message: str,
+        openai_client: "OpenAI | None" = None,
+        streaming: bool = False,
+        memory: ConversationMemory | None = None,
+        cache: ResponseCache | None = None,
+        backend: LLMBackend | None = None,
+        router: ModelRouter | None = None
+    ) -> None:
         """
-        Initializes the agent with a system message and an OpenAI client.
+        Initializes the agent with a system message and an OpenAI client or another backend.
 
         Args:
             system_message: The system message to pass to the agent.
-            openai_client: The OpenAI client to use for the agent.
+            openai_client: The OpenAI client to use for the agent, used when no backend is given.
+            streaming: Stream completions with PAUSE as a stop sequence and hand over tool calls as they complete.
+            memory: Keeps the message history within a token budget, None to send the full history.
+            cache: Answers repeated message histories without calling the LLM, None to always call it.
+            backend: The LLM backend to use instead of the OpenAI client, e.g. a ScriptedBackend for offline runs.
+            router: Picks the model of every call, None to send every call to DEFAULT_MODEL.
         """
+        if backend is None:
+            if openai_client is None:
+                raise ValueError("Agent needs either an OpenAI client or a backend")
+            backend = self._default_backend(openai_client)
+
         self.client = openai_client
+        self.backend = backend
+        self.last_completion = None
         self.system_message = system_message
+        self.model = DEFAULT_MODEL
+        self.temperature = DEFAULT_TEMPERATURE
+        self.streaming = streaming
+        self.memory = memory
+        self.cache = cache
+        self.router = router
         self.messages = []
         if self.system_message:
             self.messages.append({"role": "system", "content": self.system_message})
@@ -31,26 +93,204 @@ class Agent:
 
     def invoke(self) -> str:
         """
-        Invoke the LLM by sending the messages history to OpenAI and returning the response.
+        Invoke the LLM by sending the messages history to the backend and returning the response.
 
         Returns:
             str: The response from the LLM.
         """
-        completion = self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0,
-            messages=self.messages
-        )
+        completion = self.backend.complete(self.messages, model=self.model, temperature=self.temperature)
+        self.last_completion = completion
+
+        return completion.content
+
+
+    def invoke_stream(self, on_tool_call: Callable[[dict], None] | None = None) -> str:
+        """
+        Invoke the LLM with a streamed completion that ends at PAUSE.
+
+        Args:
+            on_tool_call: Called with each tool call as soon as it is complete, while the rest is still streaming.
+
+        Returns:
+            str: The response from the LLM, ending with PAUSE if it contains tool calls.
+        """
+        stream = self.backend.stream(self.messages, model=self.model, temperature=self.temperature, stop=[STOP_SEQUENCE])
+
+        parser = ToolCallStreamParser()
+        try:
+            for text in stream:
+                # Each tool call is handed over as soon as it is complete, the stream ends at PAUSE
+                for tool_call in parser.feed(text):
+                    if on_tool_call:
+                        on_tool_call(tool_call)
+        finally:
+            stream.close()
+
+        self.last_completion = None
+        return _streamed_response(parser)
+
 
-        return completion.choices[0].message.content
+    @staticmethod
+    def _default_backend(openai_client: "OpenAI") -> LLMBackend:
+        """Wrap the OpenAI client in a backend."""
+        return OpenAIBackend(openai_client)
 
 
-    def __call__(self, user_message: str) -> str:
+    def _cache_key(self) -> str | None:
+        """Return the cache key of the current request, None if the agent has no cache."""
+        if self.cache is None:
+            return None
+
+        params = {"temperature": self.temperature}
+        if self.streaming:
+            # Streamed responses end at the tool call, so they are not interchangeable with full ones
+            params["stop"] = [STOP_SEQUENCE]
+        return self.cache.make_key(self.model, params, self.messages)
+
+
+    def _route(self) -> Route | None:
+        """Choose the model of the next call with the router, if the agent has one."""
+        if self.router is None:
+            return None
+        route = self.router.route(self.messages)
+        self.model = route.model
+        return route
+
+
+    def _record_route(self, route: Route | None, llm_span: Span | None, result: str, cache_hit: bool) -> None:
+        """Account the call against the budget of the router and record the choice on the span."""
+        if route is None:
+            return
+        if cache_hit:
+            attributes = {"step": route.step, "tier": route.tier, "route": route.reason}
+        else:
+            usage = self.last_completion.usage if self.last_completion is not None else None
+            attributes = self.router.record(route, usage, result)
+        if llm_span is not None:
+            llm_span.set(**attributes)
+
+
+    def __call__(self, user_message: str, on_tool_call: Callable[[dict], None] | None = None) -> str:
         """
         This function makes the Agent instance callable.
 
         Args:
             user_message(str): The user message to pass to the agent.
+            on_tool_call: In streaming mode, called with each tool call as soon as it is complete.
+
+        Returns:
+            str: The response from the LLM.
+        """
+        # Add the user message to the messages history
+        self.messages.append({"role": "user", "content": user_message})
+
+        # Compact the history before it is sent
+        if self.memory:
+            self.memory.compact(self.messages)
+
+        # The router picks the model before the span is named after it
+        route = self._route()
+        with trace_span(self.model, "llm", streaming=self.streaming, messages=len(self.messages)) as llm_span:
+            cache_key = self._cache_key()
+            result = self.cache.get(cache_key) if cache_key else None
+            cache_hit = result is not None
+
+            if cache_hit:
+                _replay_tool_calls(result, on_tool_call if self.streaming else None)
+            else:
+                result = self.invoke_stream(on_tool_call) if self.streaming else self.invoke()
+                if cache_key:
+                    self.cache.put(cache_key, result)
+
+            if llm_span is not None:
+                _record_call(llm_span, self, result, cache_hit)
+            self._record_route(route, llm_span, result, cache_hit)
+
+        # Add the LLM response to the messages history
+        self.messages.append({"role": "assistant", "content": result})
+
+        return result
+
+
+class AsyncAgent(Agent):
+    """A ReAct agent that talks to the OpenAI API without blocking the event loop."""
+    def __init__(
+        self,
+        system_message: str,
+        openai_client: "AsyncOpenAI | None" = None,
+        streaming: bool = False,
+        memory: ConversationMemory | None = None,
+        cache: ResponseCache | None = None,
+        backend: AsyncLLMBackend | None = None,
+        router: ModelRouter | None = None
+    ) -> None:
+        """
+        Initializes the agent with a system message and an async OpenAI client or another async backend.
+
+        Args:
+            system_message: The system message to pass to the agent.
+            openai_client: The AsyncOpenAI client to use for the agent, used when no backend is given.
+            streaming: Stream completions with PAUSE as a stop sequence and hand over tool calls as they complete.
+            memory: Keeps the message history within a token budget, None to send the full history.
+            cache: Answers repeated message histories without calling the LLM, None to always call it.
+            backend: The async LLM backend to use instead of the client, e.g. an AsyncScriptedBackend.
+            router: Picks the model of every call, None to send every call to DEFAULT_MODEL.
+        """
+        super().__init__(system_message, openai_client, streaming, memory, cache, backend, router)
+
+
+    @staticmethod
+    def _default_backend(openai_client: "AsyncOpenAI") -> AsyncLLMBackend:
+        """Wrap the AsyncOpenAI client in a backend."""
+        return AsyncOpenAIBackend(openai_client)
+
+
+    async def invoke(self) -> str:
+        """
+        Invoke the LLM by sending the messages history to the backend and returning the response.
+
+        Returns:
+            str: The response from the LLM.
+        """
+        completion = await self.backend.complete(self.messages, model=self.model, temperature=self.temperature)
+        self.last_completion = completion
+
+        return completion.content
+
+
+    async def invoke_stream(self, on_tool_call: Callable[[dict], None] | None = None) -> str:
+        """
+        Invoke the LLM with a streamed completion that ends at PAUSE.
+
+        Args:
+            on_tool_call: Called with each tool call as soon as it is complete, while the rest is still streaming.
+
+        Returns:
+            str: The response from the LLM, ending with PAUSE if it contains tool calls.
+        """
+        stream = self.backend.stream(self.messages, model=self.model, temperature=self.temperature, stop=[STOP_SEQUENCE])
+
+        parser = ToolCallStreamParser()
+        try:
+            async for text in stream:
+                # Each tool call is handed over as soon as it is complete, the stream ends at PAUSE
+                for tool_call in parser.feed(text):
+                    if on_tool_call:
+                        on_tool_call(tool_call)
+        finally:
+            await stream.aclose()
+
+        self.last_completion = None
+        return _streamed_response(parser)
+
+
+    async def __call__(self, user_message: str, on_tool_call: Callable[[dict], None] | None = None) -> str:
+        """
+        This function makes the AsyncAgent instance awaitable with a user message.
+
+        Args:
+            user_message(str): The user message to pass to the agent.
+            on_tool_call: In streaming mode, called with each tool call as soon as it is complete.
 
         Returns:
             str: The response from the LLM.
@@ -58,9 +298,61 @@ class Agent:
         # Add the user message to the messages history
         self.messages.append({"role": "user", "content": user_message})
 
-        result = self.invoke()
+        # Compact the history before it is sent
+        if self.memory:
+            self.memory.compact(self.messages)
+
+        # The router picks the model before the span is named after it
+        route = self._route()
+        with trace_span(self.model, "llm", streaming=self.streaming, messages=len(self.messages)) as llm_span:
+            cache_key = self._cache_key()
+            result = self.cache.get(cache_key) if cache_key else None
+            cache_hit = result is not None
+
+            if cache_hit:
+                _replay_tool_calls(result, on_tool_call if self.streaming else None)
+            else:
+                result = await (self.invoke_stream(on_tool_call) if self.streaming else self.invoke())
+                if cache_key:
+                    self.cache.put(cache_key, result)
+
+            if llm_span is not None:
+                _record_call(llm_span, self, result, cache_hit)
+            self._record_route(route, llm_span, result, cache_hit)
 
         # Add the LLM response to the messages history
         self.messages.append({"role": "assistant", "content": result})
 
-        return result
\ No newline at end of file
+        return result
+
+
+def _record_call(llm_span: Span, agent: Agent, response: str, cache_hit: bool) -> None:
+    """
+    Record the outcome of an agent call on its span.
+
+    Streamed completions carry no usage, so only complete calls that reached the backend report tokens.
+    """
+    llm_span.set(cache_hit=cache_hit, response_bytes=len(response.encode()))
+    if not cache_hit and agent.last_completion is not None:
+        llm_span.set(**agent.last_completion.usage)
+
+
+def _streamed_response(parser: ToolCallStreamParser) -> str:
+    """
+    Build the response of a streamed completion.
+
+    The stop sequence is not part of a streamed completion, so it is added back after the last tool call
+    to keep the history in the format of the prompt and the loop checks working.
+    """
+    if not parser.tool_calls:
+        return parser.text
+    return f"{parser.text[:parser.end]}\n{STOP_SEQUENCE}"
+
+
+def _replay_tool_calls(response: str, on_tool_call: Callable[[dict], None] | None) -> None:
+    """Hand the tool calls of a cached response to the callback, like a streamed response would."""
+    if on_tool_call is None:
+        return
+
+    for tool_call in ToolCallStreamParser().feed(response):
+        on_tool_call(tool_call)
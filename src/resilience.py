@@ -0,0 +1,447 @@
+"""
+Resilient Invocation
+
+This module wraps an LLM backend in an invocation policy, so one slow or failed response does not stall or
+crash the agent loop:
+
+- Deadline: every attempt gets at most `timeout` seconds, after which it is abandoned and retried. An
+  abandoned request keeps its thread until it returns, so the requests in flight are bounded and an attempt
+  fails fast, as a retryable timeout, when every slot is held by an unanswered request.
+- Retry: retryable errors (timeouts, connection errors, rate limits and server errors) are retried with
+  exponential backoff and full jitter, so many sessions hitting the same outage do not retry in lockstep.
+- Hedging: if an attempt has not answered after the p95 of the recent latencies, a duplicate request is
+  sent and the first answer wins. This cuts the tail latency for the price of about 5% more requests.
+
+The wrapped backends implement the same protocols as the backends they wrap (see src/backends.py), so they
+plug into Agent and AsyncAgent unchanged:
+
+    backend = ResilientBackend(OpenAIBackend(client), InvocationPolicy(timeout=30, hedge=True))
+    agent = Agent(system_message, backend=backend)
+
+Hedging applies to complete. A stream gets `timeout` seconds for its first chunk and `idle_timeout` seconds
+between chunks. It is retried until it yields its first chunk, after that the tokens are already on their
+way to the tool calls and a stalled stream raises a TimeoutError. Hedging sends the same messages twice, so
+it only suits backends without per-call state; a ScriptedBackend replaying a transcript would skip responses.
+
+Functions:
+1. is_retryable(error): Checks if an error of a backend is worth retrying.
+2. backoff_delay(attempt, policy, rng): Returns the jittered delay before a retry.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import time
+import random
+import asyncio
+import queue
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterator, AsyncIterator
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
+from src.backends import Completion, LLMBackend, AsyncLLMBackend
+from src.tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+# Names of the OpenAI errors that are worth retrying, matched by name so openai is not imported
+RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError"}
+
+# HTTP statuses that are worth retrying: request timeout, conflict, rate limit and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Number of recent latencies the hedging delay is computed from
+LATENCY_WINDOW = 200
+
+
+@dataclass
+class InvocationPolicy:
+    """How a backend is invoked: deadlines, retries and hedging."""
+    timeout: float | None = 60.0
+    idle_timeout: float | None = 30.0
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 20.0
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    hedge_min_delay: float = 0.0
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Check if an error of a backend is worth retrying.
+
+    Args:
+        error: The error raised by the backend.
+
+    Returns:
+        bool: True for timeouts, connection errors, rate limits and server errors.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt: int, policy: InvocationPolicy, rng: random.Random) -> float:
+    """
+    Return the delay before a retry: exponential backoff with full jitter.
+
+    Args:
+        attempt: Number of the failed attempt, 0 for the first.
+        policy: The invocation policy.
+        rng: The random generator of the jitter.
+
+    Returns:
+        float: The seconds to wait, uniformly drawn between 0 and the capped exponential delay.
+    """
+    return rng.uniform(0, min(policy.backoff_max, policy.backoff_base * 2 ** attempt))
+
+
+class LatencyTracker:
+    """A thread-safe window of recent call latencies."""
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        """
+        Initializes an empty window.
+
+        Args:
+            window: Number of latencies kept, the oldest are dropped.
+        """
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+
+    def add(self, seconds: float) -> None:
+        """Record the latency of a successful call."""
+        with self._lock:
+            self._latencies.append(seconds)
+
+
+    def quantile(self, q: float, min_samples: int = 1) -> float | None:
+        """
+        Return a quantile of the recent latencies.
+
+        Args:
+            q: The quantile, e.g. 0.95.
+            min_samples: Number of latencies needed for a meaningful quantile.
+
+        Returns:
+            float | None: The quantile in seconds, None if fewer latencies were recorded.
+        """
+        with self._lock:
+            if len(self._latencies) < max(1, min_samples):
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+class _InvocationStats:
+    """Counts the retries and hedges of one call and records them on the current span."""
+    def __init__(self) -> None:
+        """Initializes the counts."""
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+
+    def record(self) -> None:
+        """Add the counts to the current span, if tracing is on."""
+        active_span = current_span()
+        if active_span is not None and (self.retries or self.hedges):
+            active_span.set(retries=self.retries, hedges=self.hedges, hedge_wins=self.hedge_wins)
+
+
+class ResilientBackend:
+    """Invokes a blocking backend with deadlines, retries and hedged requests."""
+    def __init__(
+        self,
+        backend: LLMBackend,
+        policy: InvocationPolicy | None = None,
+        max_workers: int = 16,
+        seed: int | None = None
+    ) -> None:
+        """
+        Initializes the wrapper.
+
+        Args:
+            backend: The backend to invoke.
+            policy: The invocation policy, the defaults if None.
+            max_workers: Number of requests in flight at the same time, including abandoned and hedged ones.
+            seed: Seed of the backoff jitter, for repeatable load tests.
+        """
+        self.backend = backend
+        self.policy = policy or InvocationPolicy()
+        self.latencies = LatencyTracker()
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-request")
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._random = random.Random(seed)
+
+
+    def close(self) -> None:
+        """Stop the request threads, requests in flight are abandoned."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+    def _hedge_delay(self) -> float | None:
+        """Return the seconds after which a duplicate request is sent, None if hedging is off."""
+        if not self.policy.hedge:
+            return None
+        quantile = self.latencies.quantile(self.policy.hedge_quantile, self.policy.hedge_min_samples)
+        return None if quantile is None else max(quantile, self.policy.hedge_min_delay)
+
+
+    def _submit(self, function, *args, **kwargs) -> Future | None:
+        """Start a request in a free slot, None if every slot is held by a request in flight."""
+        if not self._slots.acquire(blocking=False):
+            return None
+
+        def run():
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._slots.release()
+
+        try:
+            return self._executor.submit(run)
+        except RuntimeError:
+            self._slots.release()
+            raise
+
+
+    def _saturated(self) -> TimeoutError:
+        """Return the error of an attempt that found no free slot, retried like a timeout."""
+        return TimeoutError(f"All {self.max_workers} request slots are held by unanswered requests")
+
+
+    def _attempt(self, stats: _InvocationStats, messages: list[dict], **kwargs) -> Completion:
+        """Run one attempt within the deadline, with a hedged duplicate if the first request is slow."""
+        started = time.monotonic()
+        deadline = None if self.policy.timeout is None else started + self.policy.timeout
+
+        def remaining() -> float | None:
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        primary = self._submit(self.backend.complete, messages, **kwargs)
+        if primary is None:
+            raise self._saturated()
+        pending: set[Future] = {primary}
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is not None:
+            done, _ = wait(pending, timeout=hedge_delay if deadline is None else min(hedge_delay, remaining()))
+            if not done and (deadline is None or remaining() > 0):
+                # Without a free slot the attempt goes on without its hedge
+                hedge = self._submit(self.backend.complete, messages, **kwargs)
+                if hedge is not None:
+                    stats.hedges += 1
+                    pending.add(hedge)
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    # The first answer wins, the other request finishes in the background
+                    self.latencies.add(time.monotonic() - started)
+                    stats.hedge_wins += future is not primary
+                    return future.result()
+                error = future.exception()
+
+        if error is not None:
+            raise error
+        raise TimeoutError(f"No response within {self.policy.timeout} seconds")
+
+
+    def complete(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Completion:
+        """Return the completion of the messages, retrying failed and timed out attempts."""
+        stats = _InvocationStats()
+        try:
+            for attempt in range(self.policy.max_retries + 1):
+                try:
+                    return self._attempt(stats, messages, model=model, temperature=temperature, stop=stop)
+                except Exception as e:
+                    if attempt == self.policy.max_retries or not is_retryable(e):
+                        raise
+                    delay = backoff_delay(attempt, self.policy, self._random)
+                    logger.warning(f"LLM call failed ({type(e).__name__}: {e}), retrying in {delay:.2f}s")
+                    stats.retries += 1
+                    time.sleep(delay)
+        finally:
+            stats.record()
+
+
+    def _open_stream(self, messages: list[dict], **kwargs) -> tuple[queue.Queue, threading.Event]:
+        """Read a stream in a request slot, its chunks are put on a queue so they can be awaited with a deadline."""
+        chunks = queue.Queue()
+        closed = threading.Event()
+
+        def pump() -> None:
+            # Each item is a chunk or an error, (None, None) ends the stream
+            try:
+                stream = self.backend.stream(messages, **kwargs)
+                try:
+                    for chunk in stream:
+                        if closed.is_set():
+                            return
+                        chunks.put((chunk, None))
+                finally:
+                    stream.close()
+                chunks.put((None, None))
+            except Exception as e:
+                chunks.put((None, e))
+
+        if self._submit(pump) is None:
+            raise self._saturated()
+        return chunks, closed
+
+
+    def _next_chunk(self, chunks: queue.Queue, timeout: float | None, waiting_for: str) -> str | None:
+        """Return the next chunk of a stream, None at its end, or raise a TimeoutError if it stalls."""
+        try:
+            chunk, error = chunks.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No {waiting_for} of the stream within {timeout} seconds") from None
+        if error is not None:
+            raise error
+        return chunk
+
+
+    def stream(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Iterator[str]:
+        """Yield the completion of the messages chunk by chunk, retrying until the first chunk arrives."""
+        stats = _InvocationStats()
+        for attempt in range(self.policy.max_retries + 1):
+            closed = None
+            try:
+                chunks, closed = self._open_stream(messages, model=model, temperature=temperature, stop=stop)
+                first = self._next_chunk(chunks, self.policy.timeout, "first chunk")
+                break
+            except Exception as e:
+                if closed is not None:
+                    closed.set()
+                if attempt == self.policy.max_retries or not is_retryable(e):
+                    stats.record()
+                    raise
+                delay = backoff_delay(attempt, self.policy, self._random)
+                logger.warning(f"LLM stream failed ({type(e).__name__}: {e}), retrying in {delay:.2f}s")
+                stats.retries += 1
+                time.sleep(delay)
+        stats.record()
+
+        try:
+            if first is None:
+                return
+            yield first
+            while (chunk := self._next_chunk(chunks, self.policy.idle_timeout, "chunk")) is not None:
+                yield chunk
+        finally:
+            # A stalled request stops at its next chunk and frees its slot when it returns
+            closed.set()
+
+
+class AsyncResilientBackend:
+    """Invokes an asyncio backend with deadlines, retries and hedged requests."""
+    def __init__(self, backend: AsyncLLMBackend, policy: InvocationPolicy | None = None, seed: int | None = None) -> None:
+        """
+        Initializes the wrapper.
+
+        Args:
+            backend: The backend to invoke.
+            policy: The invocation policy, the defaults if None.
+            seed: Seed of the backoff jitter, for repeatable load tests.
+        """
+        self.backend = backend
+        self.policy = policy or InvocationPolicy()
+        self.latencies = LatencyTracker()
+        self._random = random.Random(seed)
+
+
+    def _hedge_delay(self) -> float | None:
+        """Return the seconds after which a duplicate request is sent, None if hedging is off."""
+        if not self.policy.hedge:
+            return None
+        quantile = self.latencies.quantile(self.policy.hedge_quantile, self.policy.hedge_min_samples)
+        return None if quantile is None else max(quantile, self.policy.hedge_min_delay)
+
+
+    async def _race(self, stats: _InvocationStats, messages: list[dict], **kwargs) -> Completion:
+        """Run the request, with a hedged duplicate if it is slow, and return the first answer."""
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self.backend.complete(messages, **kwargs))
+        pending = {primary}
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    stats.hedges += 1
+                    pending.add(asyncio.ensure_future(self.backend.complete(messages, **kwargs)))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.latencies.add(time.monotonic() - started)
+                        stats.hedge_wins += task is not primary
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Unlike threads, the losing request can be cancelled
+            for task in pending:
+                task.cancel()
+
+
+    async def complete(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> Completion:
+        """Return the completion of the messages, retrying failed and timed out attempts."""
+        stats = _InvocationStats()
+        try:
+            for attempt in range(self.policy.max_retries + 1):
+                try:
+                    request = self._race(stats, messages, model=model, temperature=temperature, stop=stop)
+                    return await asyncio.wait_for(request, timeout=self.policy.timeout)
+                except Exception as e:
+                    if attempt == self.policy.max_retries or not is_retryable(e):
+                        raise
+                    delay = backoff_delay(attempt, self.policy, self._random)
+                    logger.warning(f"LLM call failed ({type(e).__name__}: {e}), retrying in {delay:.2f}s")
+                    stats.retries += 1
+                    await asyncio.sleep(delay)
+        finally:
+            stats.record()
+
+
+    async def stream(self, messages: list[dict], *, model: str, temperature: float, stop: list[str] | None = None) -> AsyncIterator[str]:
+        """Yield the completion of the messages chunk by chunk, retrying until the first chunk arrives."""
+        stats = _InvocationStats()
+        for attempt in range(self.policy.max_retries + 1):
+            stream = self.backend.stream(messages, model=model, temperature=temperature, stop=stop)
+            try:
+                first = await asyncio.wait_for(anext(stream, None), timeout=self.policy.timeout)
+                break
+            except Exception as e:
+                await stream.aclose()
+                if attempt == self.policy.max_retries or not is_retryable(e):
+                    stats.record()
+                    raise
+                delay = backoff_delay(attempt, self.policy, self._random)
+                logger.warning(f"LLM stream failed ({type(e).__name__}: {e}), retrying in {delay:.2f}s")
+                stats.retries += 1
+                await asyncio.sleep(delay)
+        stats.record()
+
+        try:
+            if first is None:
+                return
+            yield first
+            while (chunk := await asyncio.wait_for(anext(stream, None), timeout=self.policy.idle_timeout)) is not None:
+                yield chunk
+        finally:
+            await stream.aclose()
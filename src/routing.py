@@ -0,0 +1,228 @@
+"""
+Model Routing
+
+This module picks the model of every agent step instead of sending all of them to the same model. Most
+turns of a session are easy: the first turn only asks for the tree and the turns after a change set only
+continue the plan. The turns that see a large tree decide the taxonomy, and so do the planner calls of plan
+mode, so they go to the strong model. The step is classified from the message history:
+
+- start: no observation yet, the agent is about to look at the tree.
+- decide: the last observation is a tree listing, or the message lists the files of a shard, the agent decides
+  where the files go.
+- recover: the last observation is an error, the agent has to work around it.
+- continue: any other observation, e.g. the change set of create_directory.
+
+Every session has a budget of dollars and seconds. A strong call that would not fit into what is left of the
+budget goes to the fast model instead, so a session degrades to the cheap model rather than overspending.
+The expected latency of each model is learned from its calls. Each choice is recorded on the LLM span of the
+call (see src/tracing.py) with the step, the reason and the estimated cost.
+
+Usage:
+    router = ModelRouter(budget=RoutingBudget(max_cost=0.05, max_seconds=120))
+    agent = Agent(system_message, backend=backend, router=router)
+
+Functions:
+1. classify_step(messages): Returns the type of the next step of a message history.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import time
+import logging
+import threading
+from dataclasses import dataclass, field, replace
+
+from src.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Steps of a session, see the module docstring
+STEP_TYPES = ("start", "decide", "recover", "continue")
+
+# Tier of each step, decide steps on small trees are easy enough for the fast tier
+DEFAULT_STEP_TIERS = {"start": "fast", "decide": "strong", "recover": "strong", "continue": "fast"}
+
+# Observations up to this many tokens are small trees, which the fast tier organizes as well
+SMALL_OBSERVATION_TOKENS = 500
+
+# Expected completion tokens of a step, used to estimate the cost of a call before it is made
+EXPECTED_COMPLETION_TOKENS = 400
+
+# Weight of the latest call in the learned latency of a model
+LATENCY_SMOOTHING = 0.3
+
+# Prefix of the user messages that carry tool results
+OBSERVATION_PREFIX = "Observation:"
+
+
+@dataclass
+class ModelProfile:
+    """A model the router can choose, with its price per million tokens and its expected latency per call."""
+    name: str
+    input_cost: float
+    output_cost: float
+    latency: float
+
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        """Return the price of a call in dollars."""
+        return (prompt_tokens * self.input_cost + completion_tokens * self.output_cost) / 1_000_000
+
+
+# Models of the tiers by default
+DEFAULT_MODELS = {
+    "fast": ModelProfile("gpt-4o-mini", input_cost=0.15, output_cost=0.60, latency=2.0),
+    "strong": ModelProfile("gpt-4o", input_cost=2.50, output_cost=10.00, latency=5.0),
+}
+
+
+@dataclass
+class RoutingBudget:
+    """The dollars and seconds of LLM calls one session may spend, None for no limit."""
+    max_cost: float | None = None
+    max_seconds: float | None = None
+
+
+@dataclass
+class Route:
+    """The model chosen for one step and why."""
+    model: str
+    tier: str
+    step: str
+    reason: str
+    prompt_tokens: int
+    estimated_cost: float
+    started: float = field(default_factory=time.perf_counter)
+
+
+def classify_step(messages: list[dict]) -> str:
+    """
+    Return the type of the next step of a message history.
+
+    Args:
+        messages: The message history, ending with the user message the next response answers.
+
+    Returns:
+        str: One of STEP_TYPES.
+    """
+    last = messages[-1]["content"] if messages and messages[-1]["role"] == "user" else ""
+    if OBSERVATION_PREFIX not in last:
+        # The sub-agents of sharded runs get their files in the first message
+        return "decide" if "root/" in last else "start"
+
+    observation = last[last.index(OBSERVATION_PREFIX) + len(OBSERVATION_PREFIX):]
+    if "'msg':" in observation or '"msg":' in observation:
+        return "recover"
+    # A tree is a dictionary with a root key, or a compact listing with a root/ line
+    if "'root'" in observation or '"root"' in observation or "\nroot/" in f"\n{observation.lstrip()}":
+        return "decide"
+    return "continue"
+
+
+class ModelRouter:
+    """Chooses the model of every step of a session within its budget, shared by the agents of the session."""
+    def __init__(
+        self,
+        models: dict[str, ModelProfile] | None = None,
+        budget: RoutingBudget | None = None,
+        step_tiers: dict[str, str] | None = None,
+        small_observation_tokens: int = SMALL_OBSERVATION_TOKENS
+    ) -> None:
+        """
+        Initializes the router.
+
+        Args:
+            models: The model of each tier, "fast" and "strong".
+            budget: The dollars and seconds the session may spend, no limit if None.
+            step_tiers: The tier of each step type.
+            small_observation_tokens: Decide steps on observations up to this many tokens go to the fast tier.
+        """
+        # Copies, the latencies are learned per session
+        self.models = {tier: replace(model) for tier, model in (models or DEFAULT_MODELS).items()}
+        self.budget = budget or RoutingBudget()
+        self.step_tiers = {**DEFAULT_STEP_TIERS, **(step_tiers or {})}
+        self.small_observation_tokens = small_observation_tokens
+        self.spent_cost = 0.0
+        self.spent_seconds = 0.0
+        self.calls: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+
+    def _fits(self, model: ModelProfile, prompt_tokens: int) -> str | None:
+        """Return which budget a call of the model would exceed, None if it fits."""
+        if self.budget.max_cost is not None:
+            if self.spent_cost + model.cost(prompt_tokens, EXPECTED_COMPLETION_TOKENS) > self.budget.max_cost:
+                return "cost budget"
+        if self.budget.max_seconds is not None and self.spent_seconds + model.latency > self.budget.max_seconds:
+            return "latency budget"
+        return None
+
+
+    def route(self, messages: list[dict]) -> Route:
+        """
+        Choose the model of the next step.
+
+        Args:
+            messages: The message history the next response answers.
+
+        Returns:
+            Route: The chosen model, its tier, the step type and the reason.
+        """
+        step = classify_step(messages)
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        tier = self.step_tiers.get(step, "fast")
+        reason = f"{step} step"
+
+        last_tokens = estimate_tokens(messages[-1]["content"]) if messages else 0
+        if step == "decide" and last_tokens <= self.small_observation_tokens:
+            tier, reason = "fast", "small tree"
+
+        with self._lock:
+            if tier != "fast":
+                exceeded = self._fits(self.models[tier], prompt_tokens)
+                if exceeded:
+                    tier, reason = "fast", exceeded
+            model = self.models[tier]
+            estimated_cost = model.cost(prompt_tokens, EXPECTED_COMPLETION_TOKENS)
+
+        return Route(model.name, tier, step, reason, prompt_tokens, estimated_cost)
+
+
+    def record(self, route: Route, usage: dict | None, response: str) -> dict:
+        """
+        Account a finished call against the budget and learn the latency of its model.
+
+        Args:
+            route: The route of the call.
+            usage: The token usage the backend reported, None or empty if it reported none, e.g. when streaming.
+            response: The response, its tokens are estimated if the backend reported no usage.
+
+        Returns:
+            dict: The attributes of the call for its span: step, tier, reason, cost and budget left.
+        """
+        seconds = time.perf_counter() - route.started
+        prompt_tokens = (usage or {}).get("prompt_tokens", route.prompt_tokens)
+        completion_tokens = (usage or {}).get("completion_tokens", estimate_tokens(response))
+        model = self.models[route.tier]
+        cost = model.cost(prompt_tokens, completion_tokens)
+
+        with self._lock:
+            self.spent_cost += cost
+            self.spent_seconds += seconds
+            self.calls[model.name] = self.calls.get(model.name, 0) + 1
+            model.latency += LATENCY_SMOOTHING * (seconds - model.latency)
+            attributes = {"step": route.step, "tier": route.tier, "route": route.reason, "cost_usd": cost}
+            if self.budget.max_cost is not None:
+                attributes["budget_cost_left"] = round(self.budget.max_cost - self.spent_cost, 6)
+            if self.budget.max_seconds is not None:
+                attributes["budget_seconds_left"] = round(self.budget.max_seconds - self.spent_seconds, 3)
+
+        logger.debug(f"Routed {route.step} step to {model.name} ({route.reason}), ${cost:.5f}")
+        return attributes
+
+
+    def stats(self) -> dict:
+        """Return the calls per model and what the session spent."""
+        with self._lock:
+            return {"calls": dict(self.calls), "cost_usd": round(self.spent_cost, 6), "seconds": round(self.spent_seconds, 3)}
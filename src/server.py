@@ -0,0 +1,382 @@
+"""
+Agent Server
+
+This module implements a long-running server mode. A one-off run of demo.py pays for the interpreter
+start, the imports, the configuration, a new OpenAI client and a TLS handshake before the first token.
+The server pays for them once: the backend with its pooled keep-alive connections, the response cache,
+the classifier rules and the tree fingerprints of the tools stay warm across requests.
+
+Organization jobs are accepted over a local HTTP API, on a Unix socket or a TCP port, and queued for a
+fixed number of workers. The queue is bounded: when it is full a job is refused with 503 and a
+Retry-After header instead of piling up, and jobs on the same directory never run at the same time.
+
+API:
+    POST /jobs           {"directory": "...", "message": "...", "mode": "loop" | "plan"}, answers 202 with the job
+    GET  /jobs/<id>      The job with its status and result, ?wait=<seconds> waits for it to finish
+    GET  /health         The number of queued and running jobs and the job counters
+    GET  /metrics        The metrics of the tracer in the Prometheus text format, if the server traces
+
+Usage:
+    server = AgentServer(agent_factory=lambda: Agent(chain_of_thought_system_message, backend=backend))
+    server.serve_unix("/tmp/react-agent.sock")
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import logging
+import threading
+import socketserver
+from typing import Callable
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.react_agent import Agent
+from src.classifier import FileClassifier
+from src.tools import use_working_directory
+from src.tracing import Tracer, use_tracer, span
+from src.agent_loop import run_agent_loop, run_plan_mode
+
+logger = logging.getLogger(__name__)
+
+# Default number of jobs running at the same time
+DEFAULT_WORKERS = 4
+
+# Default number of jobs waiting for a worker before new jobs are refused
+DEFAULT_QUEUE_SIZE = 64
+
+# Number of finished jobs kept for GET /jobs/<id>
+MAX_FINISHED_JOBS = 1000
+
+# Largest request body accepted
+MAX_REQUEST_BYTES = 1024 * 1024
+
+# Longest a GET /jobs/<id>?wait=... request waits for the job
+MAX_WAIT_SECONDS = 60
+
+# Organization modes of a job
+JOB_MODES = ("loop", "plan")
+
+
+@dataclass
+class Job:
+    """An organization job and its outcome."""
+    directory: str
+    message: str
+    mode: str = "loop"
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"
+    result: str | None = None
+    error: str | None = None
+    submitted: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+
+
+    def to_dict(self) -> dict:
+        """Return the job as JSON-serializable data."""
+        return {item.name: getattr(self, item.name) for item in fields(self) if item.name != "done"}
+
+
+class AgentServer:
+    """Runs organization jobs from a bounded queue on a pool of workers that share warm agent state."""
+    def __init__(
+        self,
+        agent_factory: Callable[[], Agent],
+        planner_factory: Callable[[], Agent] | None = None,
+        classifier: FileClassifier | None = None,
+        workers: int = DEFAULT_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        root: str | None = None,
+        tracer: Tracer | None = None
+    ) -> None:
+        """
+        Initializes the server and starts its workers.
+
+        Args:
+            agent_factory: Creates a fresh agent per job, usually sharing one backend and cache.
+            planner_factory: Creates the planner of jobs in plan mode, None to refuse plan mode.
+            classifier: Places the obvious files before every agent runs and learns from the results, None to skip.
+            workers: Number of jobs running at the same time.
+            queue_size: Number of jobs waiting for a worker before new jobs are refused.
+            root: Only directories inside this directory can be organized, None to allow any directory.
+            tracer: Records the spans of every job, None to run without tracing.
+        """
+        self.agent_factory = agent_factory
+        self.planner_factory = planner_factory
+        self.classifier = classifier
+        self.root = os.path.realpath(root) if root else None
+        self.tracer = tracer
+        self.counters = {"submitted": 0, "refused": 0, "completed": 0, "failed": 0}
+        self._queue: queue.Queue[Job] = queue.Queue(maxsize=queue_size)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._directory_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._running = 0
+        self._workers = [
+            threading.Thread(target=self._work, name=f"agent-worker-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._http_server = None
+
+
+    def submit(self, directory: str, message: str, mode: str = "loop") -> Job | None:
+        """
+        Queue an organization job.
+
+        Args:
+            directory: The directory to organize.
+            message: The user message of the agent.
+            mode: "loop" for the ReAct loop, "plan" for plan mode.
+
+        Returns:
+            Job | None: The queued job, None if the queue is full.
+
+        Raises:
+            ValueError: If the directory or the mode is not valid.
+        """
+        if mode not in JOB_MODES:
+            raise ValueError(f"mode must be one of {JOB_MODES}")
+        if mode == "plan" and self.planner_factory is None:
+            raise ValueError("this server does not run plan mode")
+
+        directory = os.path.realpath(directory)
+        if not os.path.isdir(directory):
+            raise ValueError(f"{directory} is not a directory")
+        if self.root and os.path.commonpath([self.root, directory]) != self.root:
+            raise ValueError(f"{directory} is outside the directories this server organizes")
+
+        job = Job(directory=directory, message=message, mode=mode)
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.counters["refused"] += 1
+                return None
+            self.counters["submitted"] += 1
+            self._jobs[job.id] = job
+            self._forget_finished_jobs()
+        return job
+
+
+    def get(self, job_id: str) -> Job | None:
+        """Return a job by its id, None if it is unknown or was forgotten."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+    def health(self) -> dict:
+        """Return the number of queued and running jobs and the job counters."""
+        with self._lock:
+            return {"queued": self._queue.qsize(), "running": self._running, "workers": len(self._workers), **self.counters}
+
+
+    def retry_after(self) -> int:
+        """Estimate the seconds until the queue has room again, from the run time of the recent jobs."""
+        with self._lock:
+            durations = [job.finished - job.started for job in self._jobs.values() if job.finished and job.started]
+        average = sum(durations[-20:]) / len(durations[-20:]) if durations else 1.0
+        return max(1, round(average * self._queue.qsize() / len(self._workers)))
+
+
+    def _forget_finished_jobs(self) -> None:
+        """Drop the oldest finished jobs once more than MAX_FINISHED_JOBS are kept, the caller holds the lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+
+    def _directory_lock(self, directory: str) -> threading.Lock:
+        """Return the lock that keeps two jobs from organizing the same directory at the same time."""
+        with self._lock:
+            return self._directory_locks.setdefault(directory, threading.Lock())
+
+
+    def _work(self) -> None:
+        """Run queued jobs until the process exits."""
+        while True:
+            job = self._queue.get()
+            try:
+                with use_tracer(self.tracer):
+                    self._run(job)
+            finally:
+                self._queue.task_done()
+
+
+    def _run(self, job: Job) -> None:
+        """Run one job and record its outcome."""
+        with self._directory_lock(job.directory):
+            with self._lock:
+                self._running += 1
+            job.status, job.started = "running", time.time()
+            try:
+                with span("job", "session", mode=job.mode), use_working_directory(job.directory):
+                    if job.mode == "plan":
+                        job.result = run_plan_mode(self.planner_factory(), self.agent_factory(), job.message, self.classifier)
+                    else:
+                        job.result = run_agent_loop(self.agent_factory(), job.message, self.classifier)
+                job.status = "done"
+            except Exception as e:
+                logger.exception(f"Job {job.id} on {job.directory} failed")
+                job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+            finally:
+                job.finished = time.time()
+                with self._lock:
+                    self._running -= 1
+                    self.counters["completed" if job.status == "done" else "failed"] += 1
+                job.done.set()
+
+        # The rules file is written through one temporary file, so the workers save one at a time
+        if self.classifier:
+            with self._save_lock:
+                self.classifier.save()
+
+
+    def serve_unix(self, path: str) -> None:
+        """
+        Serve the API on a Unix socket until shutdown is called, only the current user can connect.
+
+        Args:
+            path: The path of the socket, a stale socket file is replaced.
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        self._http_server = _UnixHTTPServer(path, _RequestHandler)
+        os.chmod(path, 0o600)
+        self._serve(f"unix:{path}")
+
+
+    def serve_tcp(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        """
+        Serve the API on a TCP port until shutdown is called.
+
+        Args:
+            host: The address to listen on, the loopback interface by default.
+            port: The port to listen on.
+        """
+        self._http_server = ThreadingHTTPServer((host, port), _RequestHandler)
+        self._serve(f"http://{host}:{self._http_server.server_address[1]}")
+
+
+    def _serve(self, address: str) -> None:
+        """Serve the API of the bound HTTP server."""
+        self._http_server.agent_server = self
+        logger.info(f"Serving organization jobs on {address} with {len(self._workers)} workers")
+        try:
+            self._http_server.serve_forever()
+        finally:
+            self._http_server.server_close()
+
+
+    def shutdown(self) -> None:
+        """Stop serving, jobs that are already queued still run while the process lives."""
+        if self._http_server:
+            self._http_server.shutdown()
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """An HTTP server on a Unix socket that handles every connection in its own thread."""
+    daemon_threads = True
+    address_family = socket.AF_UNIX
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Translates the HTTP API to calls of the AgentServer."""
+    protocol_version = "HTTP/1.1"
+
+
+    def log_message(self, format: str, *args) -> None:
+        """Log requests through logging instead of stderr, Unix sockets have no client address."""
+        logger.debug(format % args)
+
+
+    def _send(self, status: int, body, headers: dict | None = None, content_type: str = "application/json") -> None:
+        """Send a response, a JSON body unless it is already text."""
+        payload = (body if isinstance(body, str) else json.dumps(body)).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+    def do_GET(self) -> None:
+        """Answer the job, health and metrics endpoints."""
+        server: AgentServer = self.server.agent_server
+        url = urlsplit(self.path)
+
+        if url.path == "/health":
+            self._send(200, server.health())
+        elif url.path == "/metrics":
+            if server.tracer is None:
+                self._send(404, {"msg": "Tracing is off on this server"})
+            else:
+                self._send(200, server.tracer.prometheus_metrics(), content_type="text/plain; version=0.0.4")
+        elif url.path.startswith("/jobs/"):
+            job = server.get(url.path[len("/jobs/"):])
+            if job is None:
+                self._send(404, {"msg": "Job not found"})
+                return
+            try:
+                wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+            except ValueError:
+                self._send(400, {"msg": "wait must be a number of seconds"})
+                return
+            if wait > 0:
+                job.done.wait(min(wait, MAX_WAIT_SECONDS))
+            self._send(200, job.to_dict())
+        else:
+            self._send(404, {"msg": "Not found"})
+
+
+    def do_POST(self) -> None:
+        """Queue a job, refusing it with 503 while the queue is full."""
+        server: AgentServer = self.server.agent_server
+        if urlsplit(self.path).path != "/jobs":
+            self._send(404, {"msg": "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send(400, {"msg": "Content-Length must be a non-negative number of bytes"})
+            self.close_connection = True
+            return
+        if length > MAX_REQUEST_BYTES:
+            self._send(413, {"msg": f"Request body is larger than {MAX_REQUEST_BYTES} bytes"})
+            self.close_connection = True
+            return
+
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict) or not isinstance(request.get("directory"), str):
+                raise ValueError("directory is required")
+            job = server.submit(
+                request["directory"],
+                str(request.get("message", "Please organize my directory and make it more clear and professional.")),
+                str(request.get("mode", "loop"))
+            )
+        except ValueError as e:
+            self._send(400, {"msg": f"Failed to queue the job: {e}"})
+            return
+
+        if job is None:
+            self._send(503, {"msg": "The job queue is full, retry later"}, headers={"Retry-After": str(server.retry_after())})
+            return
+        self._send(202, job.to_dict(), headers={"Location": f"/jobs/{job.id}"})
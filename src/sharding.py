@@ -0,0 +1,174 @@
+"""
+Sharded Organization
+
+This module implements a map-reduce mode for directories too large to fit one agent's context. Instead of
+a single agent looking at the whole tree, the tree is organized in four steps:
+
+1. Partition: the files are split into shards of at most shard_size files, keeping directories together.
+2. Map: one sub-agent per shard proposes a plan for its files in a single call, many shards in parallel.
+3. Reduce: folder names that the shards spelled differently are reconciled and the plans are merged.
+4. Apply: the merged plan is validated against the tree and applied with one bulk create and one bulk move.
+
+Usage:
+    summary = run_sharded(lambda: Agent(shard_system_message, backend=backend), shard_size=500)
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import json
+import logging
+import contextvars
+from typing import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src.react_agent import Agent
+from src.tools import get_working_directory
+from src.tracing import traced
+from src.planning import Plan, parse_plan, validate_plan, reconcile_taxonomies, merge_plans, apply_plan
+
+logger = logging.getLogger(__name__)
+
+# Number of files each sub-agent plans
+DEFAULT_SHARD_SIZE = 500
+
+# Number of sub-agents running at the same time
+DEFAULT_MAX_WORKERS = 16
+
+
+def partition_tree(tree: dict, shard_size: int = DEFAULT_SHARD_SIZE) -> list[list[str]]:
+    """
+    Split the files of a tree into shards, packing small directories together and splitting large ones.
+
+    Args:
+        tree: A get_working_directory result listing the whole tree.
+        shard_size: Maximum number of files per shard.
+
+    Returns:
+        list: The shards, each a list of file paths.
+    """
+    if shard_size < 1:
+        raise ValueError(f"shard_size must be at least 1, got {shard_size}")
+
+    shards = []
+    current = []
+    for directory, contents in tree.items():
+        if directory != "root" and not directory.startswith("root/"):
+            continue
+        files = [f"{directory}/{name}" for name in contents if f"{directory}/{name}" not in tree]
+
+        # Start a new shard rather than splitting a directory that fits into one
+        if current and len(current) + len(files) > shard_size and len(files) <= shard_size:
+            shards.append(current)
+            current = []
+
+        for path in files:
+            current.append(path)
+            if len(current) == shard_size:
+                shards.append(current)
+                current = []
+
+    if current:
+        shards.append(current)
+    return shards
+
+
+def shard_message(files: list[str], index: int, count: int, existing_directories: list[str]) -> str:
+    """
+    Build the user message of a sub-agent.
+
+    Args:
+        files: The files of the shard.
+        index: Number of the shard, starting at 1.
+        count: Total number of shards.
+        existing_directories: The top-level folders of the tree.
+
+    Returns:
+        str: The user message.
+    """
+    return f"Shard {index} of {count}.\nExisting folders: {json.dumps(existing_directories)}\nFiles: {json.dumps(files)}"
+
+
+def propose_plan(agent: Agent, files: list[str], index: int, count: int, existing_directories: list[str]) -> Plan:
+    """
+    Let a sub-agent plan one shard in a single call.
+
+    Args:
+        agent: A fresh agent with the shard prompt as its system message.
+        files: The files of the shard.
+        index: Number of the shard, starting at 1.
+        count: Total number of shards.
+        existing_directories: The top-level folders of the tree.
+
+    Returns:
+        Plan: The plan of the shard, restricted to its own files, empty if the response is not a valid plan.
+    """
+    response = agent(shard_message(files, index, count, existing_directories))
+    try:
+        plan = parse_plan(response)
+    except ValueError as e:
+        logger.error(f"Shard {index} of {count} returned no valid plan, its files are left as they are: {e}")
+        return Plan()
+
+    # A sub-agent only decides about the files it was given
+    shard_files = set(files)
+    plan.moves = {source: destination for source, destination in plan.moves.items() if source in shard_files}
+    return plan
+
+
+@traced("sharded")
+def _shard_plan(future: Future, index: int, count: int) -> Plan:
+    """Return the plan of a shard, an empty plan if its sub-agent failed so the other shards still apply."""
+    try:
+        return future.result()
+    except Exception as e:
+        logger.error(f"Shard {index} of {count} failed, its files are left as they are: {e}")
+        return Plan()
+
+
+def run_sharded(
+    agent_factory: Callable[[], Agent],
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    max_workers: int = DEFAULT_MAX_WORKERS
+) -> dict:
+    """
+    Organize the working directory with one sub-agent per shard and apply the merged plan in one batch.
+
+    Args:
+        agent_factory: Creates a fresh sub-agent with the shard prompt as its system message.
+        shard_size: Maximum number of files per shard.
+        max_workers: Number of sub-agents running at the same time.
+
+    Returns:
+        dict: The number of shards, the created directories and applied moves, and the rejected moves.
+    """
+    tree = get_working_directory(limit=None)
+    if "msg" in tree:
+        return tree
+
+    shards = partition_tree(tree, shard_size)
+    existing_directories = [f"root/{name}" for name in tree.get("root", []) if f"root/{name}" in tree]
+    logger.info(f"Planning {sum(len(shard) for shard in shards)} files in {len(shards)} shards")
+
+    # Map: the sub-agents only call the LLM, so threads are enough to run them in parallel. Each runs in
+    # a copy of this context, so its LLM calls are traced as children of this run
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                propose_plan, agent_factory(), files, index, len(shards), existing_directories
+            )
+            for index, files in enumerate(shards, start=1)
+        ]
+        plans = [_shard_plan(future, index, len(shards)) for index, future in enumerate(futures, start=1)]
+
+    # Reduce: one spelling per folder, then one plan for the whole tree
+    renames = reconcile_taxonomies(plans, set(existing_directories))
+    plan, errors = validate_plan(merge_plans(plans, renames), tree)
+    if errors:
+        logger.warning(f"Dropped {len(errors)} entries of the merged plan that would not apply cleanly")
+
+    result = apply_plan(plan)
+    result["shards"] = len(shards)
+    result["rejected"] = errors
+    return result
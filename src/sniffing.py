@@ -0,0 +1,359 @@
+"""
+Content Sniffing
+
+This module looks inside files so the agent does not have to decide from the name alone: random_notes.txt
+may hold a shopping list or meeting minutes, backup_code.py may be a shell script. Only a bounded prefix of
+every file is read, through mmap where the file supports it, and the features are:
+
+- the file type from its magic bytes, e.g. PDF, PNG or ZIP, and the MIME type
+- whether the content is text or binary
+- for text, a short excerpt of the first non-empty line, except for files that look like they hold secrets
+  (e.g. credentials.env or id_rsa), whose content never goes into an observation
+
+Files are sniffed on a thread pool, and the features are cached by (device, inode, mtime, size), so files
+that did not change are not read again. describe_files turns the features into the one-line descriptions
+that are attached to observations (see src/tools.py); files whose content says nothing the name does not,
+e.g. a PNG named .png, are left out to keep the observation small. Symbolic links are only followed to files
+inside the working directory.
+
+Functions:
+1. sniff_file(path): Returns the content features of one file.
+2. sniff_files(paths, max_workers): Returns the content features of many files, read in parallel.
+3. describe_files(paths, max_workers, root): Returns one-line descriptions of the files whose content adds information.
+4. is_secret(path): Checks if a file name looks like the file holds secrets.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import os
+import mmap
+import stat
+import fnmatch
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Number of bytes read from the start of every file
+SNIFF_BYTES = 4096
+
+# Length of the text excerpt of a file
+EXCERPT_CHARS = 60
+
+# Number of files sniffed at the same time, the reads mostly wait for the disk
+DEFAULT_SNIFF_WORKERS = 8
+
+# Number of files whose features are cached
+MAX_CACHED_FILES = 100_000
+
+# Magic bytes at the start of a file: the signature, its offset, the MIME type and a short label
+MAGIC_SIGNATURES = [
+    (b"%PDF-", 0, "application/pdf", "PDF"),
+    (b"\x89PNG\r\n\x1a\n", 0, "image/png", "PNG"),
+    (b"\xff\xd8\xff", 0, "image/jpeg", "JPEG"),
+    (b"GIF87a", 0, "image/gif", "GIF"),
+    (b"GIF89a", 0, "image/gif", "GIF"),
+    (b"BM", 0, "image/bmp", "BMP"),
+    (b"RIFF", 0, "application/octet-stream", "RIFF"),
+    (b"ftyp", 4, "video/mp4", "MP4"),
+    (b"\x1a\x45\xdf\xa3", 0, "video/x-matroska", "MKV"),
+    (b"ID3", 0, "audio/mpeg", "MP3"),
+    (b"OggS", 0, "audio/ogg", "OGG"),
+    (b"fLaC", 0, "audio/flac", "FLAC"),
+    (b"PK\x03\x04", 0, "application/zip", "ZIP"),
+    (b"\x1f\x8b", 0, "application/gzip", "GZIP"),
+    (b"BZh", 0, "application/x-bzip2", "BZIP2"),
+    (b"\xfd7zXZ\x00", 0, "application/x-xz", "XZ"),
+    (b"7z\xbc\xaf\x27\x1c", 0, "application/x-7z-compressed", "7Z"),
+    (b"Rar!\x1a\x07", 0, "application/vnd.rar", "RAR"),
+    (b"ustar", 257, "application/x-tar", "TAR"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", 0, "application/x-ole-storage", "OLE"),
+    (b"SQLite format 3\x00", 0, "application/vnd.sqlite3", "SQLITE"),
+    (b"\x7fELF", 0, "application/x-executable", "ELF"),
+    (b"MZ", 0, "application/x-msdownload", "EXE"),
+    (b"\xcf\xfa\xed\xfe", 0, "application/x-mach-binary", "MACHO"),
+]
+
+# Files matching these patterns, or with one of the words in their name, may hold secrets: only their type is reported
+SECRET_PATTERNS = (".env*", "*.pem", "*.key", "id_*")
+SECRET_WORDS = ("credential", "secret", "token")
+
+# Office documents are ZIP or OLE containers, their extension tells which kind of document they are
+_CONTAINER_LABELS = {"ZIP", "OLE"}
+
+# Byte order marks of text files
+_TEXT_BOMS = (b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff")
+
+
+@dataclass(frozen=True)
+class FileFeatures:
+    """The content features of a file."""
+    mime: str
+    kind: str
+    magic: str | None = None
+    excerpt: str | None = None
+
+
+class FeatureCache:
+    """A thread-safe LRU cache of content features keyed by the identity and version of a file."""
+    def __init__(self, max_entries: int = MAX_CACHED_FILES) -> None:
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries: Number of files kept, the least recently used are evicted.
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, FileFeatures] = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def make_key(stat: os.stat_result, path: str) -> tuple:
+        """
+        Return the cache key of a file, any write changes its mtime or size.
+
+        The features also depend on the MIME type guessed from the name, so hard links with different
+        extensions get their own entries.
+        """
+        return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size, mimetypes.guess_type(path)[0]
+
+
+    def get(self, key: tuple) -> FileFeatures | None:
+        """Return the cached features of a file, None if they are not cached."""
+        with self._lock:
+            features = self._entries.get(key)
+            if features is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return features
+
+
+    def put(self, key: tuple, features: FileFeatures) -> None:
+        """Cache the features of a file."""
+        with self._lock:
+            self._entries[key] = features
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Shared by every session of the process
+feature_cache = FeatureCache()
+
+
+def is_secret(path: str) -> bool:
+    """
+    Check if the name of a file looks like the file holds secrets, e.g. an API key or a private key.
+
+    Args:
+        path: The path or name of the file.
+
+    Returns:
+        bool: True if no excerpt of the file may be shown.
+    """
+    name = os.path.basename(path).lower()
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in SECRET_PATTERNS) or any(word in name for word in SECRET_WORDS)
+
+
+def _resolve(path: str, root: str | None) -> str | None:
+    """Return the path to read a file from, None for a symbolic link that leaves the root or when there is no root."""
+    if not os.path.islink(path):
+        return path
+    if root is None:
+        return None
+    target = os.path.realpath(path)
+    return target if target.startswith(os.path.realpath(root) + os.sep) else None
+
+
+def _read_prefix(path: str, size: int) -> bytes:
+    """Read at most SNIFF_BYTES from the start of a file, mapping it into memory where possible."""
+    length = min(size, SNIFF_BYTES)
+    if length == 0:
+        return b""
+
+    # The path is resolved already, a link that replaced it since is not followed
+    with os.fdopen(os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0)), "rb") as file:
+        try:
+            # Only the prefix is mapped, the rest of the file is never touched
+            with mmap.mmap(file.fileno(), length, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:length]
+        except (ValueError, OSError):
+            # Files that cannot be mapped, e.g. on some network or virtual filesystems
+            return file.read(length)
+
+
+def _magic(prefix: bytes) -> tuple[str, str] | None:
+    """Return the MIME type and label of the first matching magic signature."""
+    for signature, offset, mime, label in MAGIC_SIGNATURES:
+        if prefix.startswith(signature, offset):
+            return mime, label
+    return None
+
+
+def _decode_text(prefix: bytes, truncated: bool) -> str | None:
+    """Decode a prefix as text, None if it looks binary."""
+    if b"\x00" in prefix and not prefix.startswith(_TEXT_BOMS[1:]):
+        return None
+    try:
+        if prefix.startswith(_TEXT_BOMS[1:]):
+            return prefix.decode("utf-16", errors="strict" if not truncated else "ignore")
+        return prefix.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        # The prefix may end inside a multi-byte character
+        if truncated and e.start >= len(prefix) - 3:
+            return prefix[:e.start].decode("utf-8-sig", errors="ignore")
+        return None
+
+
+def _excerpt(text: str) -> str | None:
+    """Return the first non-empty line of a text, shortened to EXCERPT_CHARS."""
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if line:
+            return line if len(line) <= EXCERPT_CHARS else f"{line[:EXCERPT_CHARS - 3]}..."
+    return None
+
+
+def _features(path: str, prefix: bytes, size: int) -> FileFeatures:
+    """Extract the features of a file from its prefix."""
+    guessed_mime = mimetypes.guess_type(path)[0]
+    if size == 0:
+        return FileFeatures(mime=guessed_mime or "application/octet-stream", kind="empty")
+
+    magic = _magic(prefix)
+    if magic is not None:
+        mime, label = magic
+        # A ZIP or OLE container named .docx, .xlsx, .jar, ... is that kind of file
+        if label in _CONTAINER_LABELS and guessed_mime and guessed_mime != mime:
+            mime = guessed_mime
+        return FileFeatures(mime=mime, kind="binary", magic=label)
+
+    text = _decode_text(prefix, truncated=size > len(prefix))
+    if text is None:
+        return FileFeatures(mime="application/octet-stream", kind="binary")
+
+    if text.startswith("#!"):
+        mime = "text/x-script"
+    elif text.lstrip()[:1] in ("{", "["):
+        mime = guessed_mime if guessed_mime == "application/json" else "text/plain"
+    else:
+        mime = guessed_mime if guessed_mime and guessed_mime.startswith("text/") else "text/plain"
+    return FileFeatures(mime=mime, kind="text", excerpt=_excerpt(text))
+
+
+def sniff_file(path: str, cache: FeatureCache | None = feature_cache, root: str | None = None) -> FileFeatures | None:
+    """
+    Return the content features of a file, reading at most SNIFF_BYTES of it.
+
+    Args:
+        path: The file on disk.
+        cache: The cache to look the file up in and store the features in, None to always read the file.
+        root: The directory symbolic links may point into, None to not follow symbolic links.
+
+    Returns:
+        FileFeatures | None: The features, without an excerpt for secret files, None if the path is not a
+            regular file or cannot be read.
+    """
+    try:
+        resolved = _resolve(path, root)
+        if resolved is None:
+            return None
+        file_stat = os.lstat(resolved)
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+
+        key = FeatureCache.make_key(file_stat, path)
+        features = cache.get(key) if cache else None
+        if features is None:
+            features = _features(path, _read_prefix(resolved, file_stat.st_size), file_stat.st_size)
+            if cache:
+                cache.put(key, features)
+        if features.excerpt is not None and is_secret(path):
+            features = replace(features, excerpt=None)
+        return features
+
+    except OSError as e:
+        logger.debug(f"Failed to sniff {path}: {e}")
+        return None
+
+
+def sniff_files(paths: list[str], max_workers: int = DEFAULT_SNIFF_WORKERS, root: str | None = None) -> dict[str, FileFeatures]:
+    """
+    Return the content features of many files, read on a thread pool.
+
+    Args:
+        paths: The files on disk.
+        max_workers: Number of files read at the same time.
+        root: The directory symbolic links may point into, None to not follow symbolic links.
+
+    Returns:
+        dict: The features of each file that could be read.
+    """
+    if not paths:
+        return {}
+    def sniff(path: str) -> FileFeatures | None:
+        return sniff_file(path, root=root)
+
+    if len(paths) == 1 or max_workers <= 1:
+        results = map(sniff, paths)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+            results = list(executor.map(sniff, paths))
+    return {path: features for path, features in zip(paths, results) if features is not None}
+
+
+def _adds_information(path: str, features: FileFeatures) -> bool:
+    """Check if the features tell the agent more than the file name does."""
+    if features.kind == "text":
+        return features.excerpt is not None
+    guessed_mime = mimetypes.guess_type(path)[0]
+    return features.kind == "empty" or guessed_mime is None or guessed_mime != features.mime
+
+
+def describe(features: FileFeatures) -> str:
+    """
+    Describe the features of a file in one short line.
+
+    Args:
+        features: The features of the file.
+
+    Returns:
+        str: The description, e.g. "PDF" or "text: Meeting notes 12 March".
+    """
+    if features.kind == "empty":
+        return "empty"
+    if features.kind == "text":
+        prefix = "script" if features.mime == "text/x-script" else "text"
+        return f"{prefix}: {features.excerpt}" if features.excerpt else prefix
+    return features.magic or "binary"
+
+
+def describe_files(paths: dict[str, str], max_workers: int = DEFAULT_SNIFF_WORKERS, root: str | None = None) -> dict[str, str]:
+    """
+    Describe the content of the files whose content tells more than their name.
+
+    Args:
+        paths: The files to describe, agent paths mapped to their paths on disk.
+        max_workers: Number of files read at the same time.
+        root: The directory symbolic links may point into, None to not follow symbolic links.
+
+    Returns:
+        dict: The description of each informative file by its agent path, only the type for secret files.
+    """
+    features = sniff_files(list(paths.values()), max_workers, root)
+    descriptions = {}
+    for agent_path, disk_path in paths.items():
+        file_features = features.get(disk_path)
+        if file_features is not None and (is_secret(disk_path) or _adds_information(disk_path, file_features)):
+            descriptions[agent_path] = describe(file_features)
+    return descriptions
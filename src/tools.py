@@ -1,46 +1,527 @@
 """
 Agent Tools
 
-This module implements three tools needed by the agent to manipulate the filesystem.
+This module implements four tools needed by the agent to manipulate the filesystem.
 
 Here is the list of available tools:
-1. get_working_directory(): Returns a dictionary mapping directory paths to their contents.
+1. get_working_directory(path, depth, cursor, limit): Returns a page of directory paths mapped to their contents.
 2. create_directory(directory_path_list: list[str]): Creates provided directories.
 3. move_files(file_map: dict[str, str]): Moves the files from one directory to another.
+4. find_duplicates(path): Returns the groups of files with identical content (see src/duplicates.py).
+
+The mutating tools (create_directory and move_files) report only the change set they applied
+together with a short version of the tree, so the agent does not receive a full re-dump of the
+working directory after every step. Call get_working_directory() to get the full snapshot.
+
+Within record_moves() the paths the moved entries end up at are collected, e.g. to learn from the moves
+of one session only.
+
+With set_directory_index(True) the tree is listed from a persistent index (see src/index.py) that is
+refreshed incrementally instead of walking the whole tree on every call, and the mutating tools update
+the index in place.
+
+With set_content_features(True) a page of get_working_directory also carries a "features" entry that
+describes the content of its files (see src/sniffing.py), e.g. the first line of a text file or the
+real type of a file with a misleading extension.
+
+Within use_virtual_filesystem(filesystem) the tools run against an in-memory copy of the tree (see src/vfs.py)
+instead of the disk, so a whole run can be simulated. preview_changes() returns what the run would change
+and commit_changes() applies it to disk in one bulk pass.
 
 Author: Peyman Kh
-Last Edited: 03-10-2025
+Last Edited: 18-10-2026
 """
 # Import libraries
 import os
-import shutil
 import logging
+import threading
+from typing import Iterator, TYPE_CHECKING
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from src.move_engine import MoveEngine
+from src.sniffing import describe_files
+from src.tree_walk import walk_tree, path_digest
+from src.vfs import VirtualFileSystem
+
+# The index pulls in sqlite3, it is imported once the index is enabled
+if TYPE_CHECKING:
+    from src.index import DirectoryIndex
 
 logger = logging.getLogger(__name__)
 
+# Directory on disk that "root" refers to in the agent's paths. It is held in a context variable so
+# concurrent agent sessions (asyncio tasks and the threads they offload tools to) can each work on
+# their own directory.
+WORKING_DIRECTORY = "working_directory"
+working_directory_var: ContextVar[str] = ContextVar("working_directory", default=WORKING_DIRECTORY)
+
+# The in-memory tree the tools run against, None to run against the disk
+filesystem_var: ContextVar[VirtualFileSystem | None] = ContextVar("filesystem", default=None)
+
+# The current paths of the entries move_files moved within record_moves(), None outside of it
+moved_paths_var: ContextVar[set[str] | None] = ContextVar("moved_paths", default=None)
+
+# Default number of entries returned by one page of get_working_directory
+DEFAULT_PAGE_LIMIT = 1000
+
+# Observation modes of the mutating tools
+OBSERVATION_MODES = ("delta", "full")
+observation_mode = "delta"
+
+# Working directories whose interrupted move batches were recovered by this process
+_recovered_directories: set[str] = set()
+
+# Tree fingerprints per working directory and virtual filesystem, kept up to date by the mutating tools
+_tree_fingerprints: dict[str | VirtualFileSystem, int] = {}
+
+# Persistent directory indexes per working directory, used when the index is enabled
+directory_index_enabled = False
+_directory_indexes: dict[str, "DirectoryIndex"] = {}
+_directory_indexes_lock = threading.Lock()
+
+# Content features of the listed files, the number of files described per page is capped to bound the observation
+content_features_enabled = False
+MAX_DESCRIBED_FILES = 200
+
+# Number of duplicate groups reported by find_duplicates, the groups wasting the most space come first
+MAX_DUPLICATE_GROUPS = 100
+
+
+def set_observation_mode(mode: str) -> None:
+    """
+    Set what create_directory and move_files return after a change.
+
+    Args:
+        mode: "delta" to return only the applied change set, "full" to return the whole tree.
+    """
+    global observation_mode
+
+    if mode not in OBSERVATION_MODES:
+        raise ValueError(f"Unknown observation mode: {mode}")
+    observation_mode = mode
+
+
+def set_directory_index(enabled: bool) -> None:
+    """
+    Set whether the tools list the tree from a persistent, incrementally refreshed index.
+
+    Args:
+        enabled: True to use the index, False to walk the tree on disk on every call.
+    """
+    global directory_index_enabled
+    directory_index_enabled = enabled
+
+
+def set_content_features(enabled: bool) -> None:
+    """
+    Set whether get_working_directory describes the content of the files it lists.
+
+    Args:
+        enabled: True to sniff the listed files and add their features, False to list names only.
+    """
+    global content_features_enabled
+    content_features_enabled = enabled
+
+
+@contextmanager
+def use_working_directory(path: str) -> Iterator[None]:
+    """
+    Run the tools against another directory on disk within the current context.
+
+    Args:
+        path: The directory that "root" refers to.
+    """
+    token = working_directory_var.set(path)
+    try:
+        yield
+    finally:
+        working_directory_var.reset(token)
+
+
+@contextmanager
+def use_virtual_filesystem(filesystem: VirtualFileSystem | None) -> Iterator[VirtualFileSystem | None]:
+    """
+    Run the tools against an in-memory tree instead of the disk within the current context.
+
+    Args:
+        filesystem: The virtual filesystem, "root" refers to the directory it was loaded from. None to
+            run against the disk. Preview or commit its changes before leaving the context.
+    """
+    if filesystem is None:
+        yield None
+        return
+
+    token = filesystem_var.set(filesystem)
+    directory_token = working_directory_var.set(filesystem.directory)
+    try:
+        yield filesystem
+    finally:
+        working_directory_var.reset(directory_token)
+        filesystem_var.reset(token)
+        _tree_fingerprints.pop(filesystem, None)
+
+
+@contextmanager
+def record_moves() -> Iterator[set[str]]:
+    """
+    Record where the entries moved by move_files end up within the current context.
+
+    Within an enclosing record_moves() the moves are recorded in the set of the enclosing one.
+
+    Yields:
+        set: The current agent paths of the moved entries, updated as they are moved again.
+    """
+    recorded = moved_paths_var.get()
+    if recorded is not None:
+        yield recorded
+        return
+
+    recorded = set()
+    token = moved_paths_var.set(recorded)
+    try:
+        yield recorded
+    finally:
+        moved_paths_var.reset(token)
+
+
+def _to_disk_path(path: str) -> str:
+    """Replace the leading "root" of an agent path with the working directory."""
+    working_directory = working_directory_var.get()
+    if path == "root" or path.startswith("root/"):
+        return working_directory + path[len("root"):]
+    return path
+
+
+def _to_agent_path(path: str) -> str:
+    """Replace the leading working directory of a disk path with "root"."""
+    working_directory = working_directory_var.get()
+    if path.startswith(working_directory + os.sep):
+        return "root/" + path[len(working_directory) + 1:].replace(os.sep, "/")
+    rel_path = os.path.relpath(path, working_directory)
+    return "root" if rel_path == "." else f"root/{rel_path.replace(os.sep, '/')}"
+
+
+def _journal_directory() -> str:
+    """Return the directory next to the working directory that holds the move journals."""
+    parent, name = os.path.split(os.path.normpath(working_directory_var.get()))
+    return os.path.join(parent, f".{name}.journal")
+
+
+def _directory_index() -> "DirectoryIndex | None":
+    """Return the index of the working directory, None if the index is disabled or the tree is in memory."""
+    if not directory_index_enabled or filesystem_var.get() is not None:
+        return None
+    from src.index import DirectoryIndex
+
+    working_directory = working_directory_var.get()
+    with _directory_indexes_lock:
+        if working_directory not in _directory_indexes:
+            _directory_indexes[working_directory] = DirectoryIndex(working_directory)
+        return _directory_indexes[working_directory]
+
+
+def _refreshed_index(key: str = "root", depth: int | None = None) -> "DirectoryIndex | None":
+    """
+    Refresh the index of the working directory and return it.
+
+    Returns:
+        DirectoryIndex | None: The index, None if it is disabled or cannot hold this tree.
+    """
+    index = _directory_index()
+    if index is None:
+        return None
+    import sqlite3
+
+    try:
+        index.refresh(key, depth)
+    except (sqlite3.Error, UnicodeError) as e:
+        logger.warning(f"Directory index unavailable, walking the tree on disk: {e}")
+        return None
+
+    if key == "root" and depth is None:
+        _tree_fingerprints[working_directory_var.get()] = index.fingerprint
+    return index
+
+
+def _update_index(paths: list[str]) -> None:
+    """Apply entries the tools changed to the index of the working directory, if it is enabled."""
+    index = _directory_index()
+    if index is None or not paths:
+        return
+    import sqlite3
+
+    try:
+        index.update(paths)
+    except (sqlite3.Error, UnicodeError) as e:
+        logger.warning(f"Failed to update the directory index, it is refreshed on the next listing: {e}")
+
+
+def _fingerprint_key() -> str | VirtualFileSystem:
+    """Return the key of the fingerprint of the tree the tools run against, the disk and memory differ."""
+    return filesystem_var.get() or working_directory_var.get()
+
+
+def _format_version(fingerprint: int) -> str:
+    """Format a tree fingerprint as a short version string."""
+    return f"{fingerprint:016x}"
+
+
+def _current_fingerprint() -> int:
+    """Return the known fingerprint of the working directory, scanning it once if unknown."""
+    key = _fingerprint_key()
+    if key not in _tree_fingerprints and _refreshed_index() is None:
+        fingerprint = 0
+        for directory, name in _scan(working_directory_var.get(), "root"):
+            if name is not None:
+                fingerprint += path_digest(f"{directory}/{name}")
+        _tree_fingerprints[key] = fingerprint & 0xFFFFFFFFFFFFFFFF
+    return _tree_fingerprints[key]
+
+
+def _update_fingerprint(added: list[str], removed: list[str]) -> str:
+    """
+    Apply added and removed agent paths to the working directory fingerprint.
+
+    Args:
+        added: Agent paths of entries that now exist.
+        removed: Agent paths of entries that no longer exist.
+
+    Returns:
+        str: The new tree version.
+    """
+    fingerprint = _current_fingerprint()
+    fingerprint += sum(path_digest(path) for path in added)
+    fingerprint -= sum(path_digest(path) for path in removed)
+    fingerprint &= 0xFFFFFFFFFFFFFFFF
+    _tree_fingerprints[_fingerprint_key()] = fingerprint
+    return _format_version(fingerprint)
+
 
-def get_working_directory() -> dict:
+def _content_features(result: dict) -> dict[str, str]:
+    """Describe the content of the files of a page, directories are skipped by the sniffer."""
+    filesystem = filesystem_var.get()
+    paths = {}
+    for directory, names in result.items():
+        for name in names:
+            path = f"{directory}/{name}"
+            if path not in result:
+                # The content of an entry in memory is wherever it was loaded from
+                disk_path = filesystem.origin(_to_disk_path(path)) if filesystem else _to_disk_path(path)
+                if disk_path is None:
+                    continue
+                paths[path] = disk_path
+                if len(paths) >= MAX_DESCRIBED_FILES:
+                    return describe_files(paths, root=working_directory_var.get())
+    return describe_files(paths, root=working_directory_var.get())
+
+
+def tree_version() -> str:
+    """Return the version of the working directory tree, scanning it once if it is not known yet."""
+    return _format_version(_current_fingerprint())
+
+
+def recover_interrupted_moves() -> int:
+    """
+    Roll back the move batches that a process which died mid-batch left in the journal of the working directory.
+
+    Returns:
+        int: Number of moves that were rolled back.
+    """
+    _recovered_directories.add(working_directory_var.get())
+    rolled_back = MoveEngine(journal_directory=_journal_directory()).recover()
+    if rolled_back:
+        _tree_fingerprints.pop(working_directory_var.get(), None)
+    return rolled_back
+
+
+def unapplied_moves(file_map: dict[str, str]) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Split a move_files mapping into the moves still to apply and the ones already applied: their source is
+    gone and their destination exists.
+
+    Args:
+        file_map: A dictionary of file paths as keys and destination paths as values.
+
+    Returns:
+        tuple: The moves still to apply, and the applied ones mapped to the new path like move_files reports them.
+    """
+    pending = {}
+    applied = {}
+    for source, destination in file_map.items():
+        disk_source = _to_disk_path(source)
+        disk_destination = _to_disk_path(destination)
+        if os.path.isdir(disk_destination):
+            disk_destination = os.path.join(disk_destination, os.path.basename(disk_source))
+        if not os.path.lexists(disk_source) and os.path.lexists(disk_destination):
+            applied[source] = _to_agent_path(disk_destination)
+        else:
+            pending[source] = destination
+    return pending, applied
+
+
+def _list_disk_directory(disk_path: str) -> list[tuple[str, bool, bool]] | None:
+    """List a directory on disk in walk order, None if it cannot be read."""
+    try:
+        with os.scandir(disk_path) as iterator:
+            entries = [(entry.name, entry.is_dir(), entry.is_dir() and not entry.is_symlink()) for entry in iterator]
+    except OSError as e:
+        # Skip unreadable directories the same way os.walk does
+        logger.debug(f"Skipping {disk_path}: {e}")
+        return None
+    entries.sort(key=lambda entry: (not entry[1], entry[0]))
+    return entries
+
+
+def _scan_tree(
+    disk_path: str,
+    key: str,
+    depth: int | None = None,
+    after: tuple[str, str, bool] | None = None
+) -> Iterator[tuple[str, str | None]]:
+    """
+    Lazily walk a directory tree with os.scandir in a stable, depth-first order (see src/tree_walk.py).
+
+    For every directory it first yields (directory_key, None) as a marker, so empty directories are
+    reported too, and then (directory_key, name) for each of its entries, directories first and
+    sorted by name. Only one directory listing is held in memory at a time.
+
+    Args:
+        disk_path: The directory on disk to start from.
+        key: The agent path of the starting directory (e.g., "root" or "root/photos").
+        depth: Maximum number of directory levels to list, 1 lists only the starting directory.
+        after: The directory, name and type of the entry to resume after, None to walk from the start.
+
+    Yields:
+        tuple: The agent path of a directory and the name of one of its entries or None.
+    """
+    def list_directory(directory_key: str) -> list[tuple[str, bool, bool]] | None:
+        return _list_disk_directory(disk_path + directory_key[len(key):].replace("/", os.sep))
+
+    return walk_tree(list_directory, key, depth, after)
+
+
+def _scan(
+    disk_path: str,
+    key: str,
+    depth: int | None = None,
+    after: tuple[str, str, bool] | None = None
+) -> Iterator[tuple[str, str | None]]:
+    """Walk a directory tree of the virtual filesystem if one is active, of the disk otherwise, see _scan_tree."""
+    filesystem = filesystem_var.get()
+    if filesystem is not None:
+        return filesystem.scan(disk_path, key, depth, after)
+    return _scan_tree(disk_path, key, depth, after)
+
+
+def _encode_cursor(directory: str, name: str) -> str:
+    """Return the cursor of the entry a page ends with, its type and agent path, e.g. "f:root/photos/a.jpg"."""
+    path = f"{directory}/{name}"
+    disk_path = _to_disk_path(path)
+    filesystem = filesystem_var.get()
+    is_dir = filesystem.isdir(disk_path) if filesystem else os.path.isdir(disk_path)
+    return f"{'d' if is_dir else 'f'}:{path}"
+
+
+def _decode_cursor(cursor: str, key: str, depth: int | None) -> tuple[str, str, bool] | None:
+    """Return the directory, name and type of the entry of a cursor, None if it is not a cursor of this listing."""
+    kind, _, path = cursor.partition(":")
+    directory, _, name = path.rpartition("/")
+    if kind not in ("d", "f") or not name or (directory != key and not directory.startswith(f"{key}/")):
+        return None
+    if depth is not None and directory != key and directory[len(key) + 1:].count("/") + 1 >= depth:
+        return None
+    return directory, name, kind == "d"
+
+
+def get_working_directory(
+    path: str = "root",
+    depth: int | None = None,
+    cursor: str | None = None,
+    limit: int | None = DEFAULT_PAGE_LIMIT
+) -> dict:
     """
     Return a dictionary mapping each directory path to its contained files and folders at the root.
 
+    The tree is streamed from disk and cut into pages of at most `limit` entries. When more entries
+    are left, the result contains a "next_cursor" that can be passed back to get the next page. The
+    cursor is the last entry of the page, so the next page resumes the walk right after it.
+
+    Args:
+        path: The directory to list, "root" for the whole working directory.
+        depth: Maximum number of directory levels to list, None for no limit.
+        cursor: The "next_cursor" of the previous page, None for the first page.
+        limit: Maximum number of entries per page, None for no limit.
+
     Returns:
-        dict: A dictionary of directories and their contents.
+        dict: The tree version, a dictionary of directories and their contents, the content features
+            of the files if enabled, and the next cursor.
     """
-    working_directory = "working_directory"
+    fingerprint_key = _fingerprint_key()
     result = {}
+    next_cursor = None
 
     try:
-        for root, dirs, files in os.walk(working_directory):
-            # Get the relative path of the current directory
-            rel_path = os.path.relpath(root, working_directory)
-            # Create a key for the dictionary with the relative path as the key
-            key = "root" if rel_path == "." else f"root/{rel_path.replace(os.sep, '/')}"
-            # Add the directories and files to the dictionary
-            result[key] = dirs + files
+        if depth is not None and depth < 1:
+            raise ValueError(f"depth must be at least 1, got {depth}")
+        if limit is not None and limit < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}")
+
+        if path != "root" and not path.startswith("root/"):
+            raise ValueError(f"path must start with root, got {path}")
+
+        disk_path = _to_disk_path(path)
+        key = _to_agent_path(disk_path)
+
+        after = None
+        if cursor:
+            after = _decode_cursor(cursor, key, depth)
+            if after is None:
+                logger.error(f"Failed to get working directory: invalid cursor {cursor!r}")
+                return {"msg": "Invalid cursor, pass the next_cursor of the previous page with the same path and depth"}
+
+        # The index skips the unchanged subtrees and keeps the fingerprint itself
+        index = _refreshed_index(key, depth)
+        entries = index.scan(key, depth, after) if index else _scan(disk_path, key, depth, after)
+
+        # A complete scan of the whole tree also refreshes the fingerprint
+        full_scan = index is None and key == "root" and depth is None and after is None
+        fingerprint = 0
+
+        count = 0
+        last = None
+        for directory, name in entries:
+            if limit is not None and count >= limit:
+                next_cursor = _encode_cursor(*last)
+                break
+
+            # Directory markers don't count as entries, they only make empty directories visible
+            result.setdefault(directory, [])
+            if name is None:
+                continue
+
+            result[directory].append(name)
+            if full_scan:
+                fingerprint += path_digest(f"{directory}/{name}")
+            count += 1
+            last = directory, name
+
+        if full_scan and next_cursor is None:
+            _tree_fingerprints[fingerprint_key] = fingerprint & 0xFFFFFFFFFFFFFFFF
 
         # Log the result and return the working directory
-        logger.info("Working directory retrieved successfully")
-        return result
+        logger.info(f"Working directory retrieved successfully ({count} entries)")
+        response = {}
+        if fingerprint_key in _tree_fingerprints:
+            response["version"] = _format_version(_tree_fingerprints[fingerprint_key])
+        response.update(result)
+        if content_features_enabled:
+            features = _content_features(result)
+            if features:
+                response["features"] = features
+        if next_cursor is not None:
+            response["next_cursor"] = next_cursor
+        return response
 
     except Exception as e:
         logger.error(f"Failed to get working directory: {e}")
@@ -55,21 +536,41 @@ def create_directory(directory_path_list: list[str]) -> dict:
         directory_path_list: A list of directory paths.
 
     Returns:
-        dict: A dictionary of directories and their content after changes.
+        dict: The created directories and the new tree version, or the whole tree in "full" mode.
     """
+    created = []
+    filesystem = filesystem_var.get()
+
     try:
+        # Make sure the version of the tree before the change is known
+        _current_fingerprint()
+
         # Create directories
         for directory_path in directory_path_list:
-            if "root" in directory_path:
-                # Replace "root" with "working_directory"
-                directory_path = directory_path.replace("root", "working_directory")
+            if directory_path == "root" or directory_path.startswith("root/"):
+                disk_path = _to_disk_path(directory_path)
+
+                # Record every missing level, since makedirs creates the parents as well
+                missing = []
+                parent = disk_path
+                while parent and not (filesystem.exists(parent) if filesystem else os.path.exists(parent)):
+                    missing.append(parent)
+                    parent = os.path.dirname(parent)
 
                 # Create the directory if it doesn't exist
-                os.makedirs(directory_path, exist_ok=True)
+                if filesystem:
+                    filesystem.makedirs(disk_path)
+                else:
+                    os.makedirs(disk_path, exist_ok=True)
+                created.extend(_to_agent_path(path) for path in reversed(missing))
 
-        # Log the result and return the working directory after changes
-        logger.info(f"{len(directory_path_list)} directories created successfully")
-        return get_working_directory()
+        # Log the result and return the change set
+        logger.info(f"{len(created)} directories created successfully")
+        version = _update_fingerprint(added=created, removed=[])
+        _update_index(created)
+        if observation_mode == "full":
+            return get_working_directory()
+        return {"created": created, "version": version}
 
     except Exception as e:
         logger.error(f"Failed to create directory: {e}")
@@ -80,32 +581,172 @@ def move_files(file_map: dict[str, str]) -> dict:
     """
     Get a dictionary of file paths as keys and destination paths as values and moves the files.
 
+    The whole mapping is validated before anything is moved and applied as one transaction: if a
+    single entry fails, the moves that were already applied are rolled back.
+
     Args:
         file_map: A dictionary of file paths as keys and destination paths as values.
 
     Returns:
-        dict: A dictionary of directories and their content after changes.
+        dict: The applied moves and the new tree version, or the whole tree in "full" mode.
     """
-    file_counter = 0
-
     try:
-        for file_path, destination_path in file_map.items():
-            if "root" in file_path:
-                # Replace "root" with "working_directory"
-                file_path = file_path.replace("root", "working_directory")
-            if "root" in destination_path:
-                # Replace "root" with "working_directory"
-                destination_path = destination_path.replace("root", "working_directory")
-
-            # Move the file and increase the counter
-            shutil.move(file_path, destination_path)
-            file_counter += 1
-
-        # Log the result and return the working directory after changes
-        logger.info(f"{file_counter} Files moved successfully")
-        return get_working_directory()
+        # Batches that a process which died left behind are rolled back once, before the first batch
+        filesystem = filesystem_var.get()
+        if filesystem is None and working_directory_var.get() not in _recovered_directories:
+            recover_interrupted_moves()
+
+        # Make sure the version of the tree before the change is known
+        _current_fingerprint()
+
+        disk_map = {_to_disk_path(file_path): _to_disk_path(destination_path) for file_path, destination_path in file_map.items()}
+        engine = filesystem or MoveEngine(journal_directory=_journal_directory())
+        result = engine.move(disk_map)
+
+        moved = {}
+        added = []
+        removed = []
+        for operation in result.moved:
+            source_key = _to_agent_path(operation.source)
+            destination_key = _to_agent_path(operation.destination)
+            moved[source_key] = destination_key
+            added.append(destination_key)
+            removed.append(source_key)
+
+            # Every entry inside a moved directory changes its path as well
+            if operation.is_dir:
+                for directory, name in _scan(operation.destination, destination_key):
+                    if name is not None:
+                        added.append(f"{directory}/{name}")
+                        removed.append(f"{source_key}{directory[len(destination_key):]}/{name}")
+
+        version = _update_fingerprint(added=added, removed=removed)
+        _update_index([path for move in moved.items() for path in move])
+
+        recorded = moved_paths_var.get()
+        if recorded is not None:
+            # Recorded entries inside a moved directory move along with it
+            for source_key, destination_key in zip(removed, added):
+                if source_key in recorded:
+                    recorded.discard(source_key)
+                    recorded.add(destination_key)
+            recorded.update(moved.values())
+
+        if not result.ok:
+            logger.error(f"Failed to move files: {len(result.errors)} entries failed")
+            response = {"msg": "Failed to move files", "errors": {_to_agent_path(path): error for path, error in result.errors.items()}}
+            if result.rolled_back:
+                response["rolled_back"] = True
+            if moved:
+                # Only happens if rolling back the batch failed as well
+                response["moved"] = moved
+            return response
+
+        # Log the result and return the change set
+        logger.info(f"{len(moved)} Files moved successfully")
+        if observation_mode == "full":
+            return get_working_directory()
+        return {"moved": moved, "version": version}
 
     except Exception as e:
         logger.error(f"Failed to move files: {e}")
         return {"msg": "Failed to move files"}
 
+
+def find_duplicates(path: str = "root") -> dict:
+    """
+    Find the files with identical content in a directory tree.
+
+    Files are only read when another file has the same size, and then only as far as needed to tell
+    them apart, so this stays fast on large trees.
+
+    Args:
+        path: The directory to search, "root" for the whole working directory.
+
+    Returns:
+        dict: The duplicate groups, each with the size of one copy and the paths of all copies, and the
+            bytes the redundant copies take.
+    """
+    # The duplicates module pulls in multiprocessing, most runs never call this tool
+    from src.duplicates import collect_files, find_duplicate_groups
+
+    try:
+        if path != "root" and not path.startswith("root/"):
+            raise ValueError(f"path must start with root, got {path}")
+
+        filesystem = filesystem_var.get()
+        if filesystem:
+            # The files in memory are read where they were loaded from
+            locations = {origin: location for location, origin in filesystem.files(_to_disk_path(path)).items()}
+            files = [(origin, os.path.getsize(origin)) for origin in locations]
+            report = find_duplicate_groups([(origin, size) for origin, size in files if size > 0])
+        else:
+            locations = {}
+            report = find_duplicate_groups(collect_files(_to_disk_path(path)))
+        groups = [
+            {"size": group.size, "files": sorted(_to_agent_path(locations.get(file_path, file_path)) for file_path in group.paths)}
+            for group in report.groups[:MAX_DUPLICATE_GROUPS]
+        ]
+
+        # Log the result and return the groups
+        logger.info(f"{len(report.groups)} duplicate groups found")
+        response = {"duplicates": groups, "wasted_bytes": report.wasted_bytes}
+        if len(report.groups) > MAX_DUPLICATE_GROUPS:
+            response["more_groups"] = len(report.groups) - MAX_DUPLICATE_GROUPS
+        return response
+
+    except Exception as e:
+        logger.error(f"Failed to find duplicates: {e}")
+        return {"msg": "Failed to find duplicates"}
+
+
+def preview_changes() -> dict:
+    """
+    Return what the active virtual filesystem would change on disk, the preview of a dry run.
+
+    Returns:
+        dict: The directories to create and the moves to apply, the entries inside a moved directory are
+            moved with it.
+    """
+    filesystem = filesystem_var.get()
+    if filesystem is None:
+        return {"created": [], "moved": {}}
+
+    diff = filesystem.diff()
+    return {
+        "created": [_to_agent_path(path) for path in diff.created],
+        "moved": {_to_agent_path(source): _to_agent_path(destination) for source, destination in diff.moved.items()}
+    }
+
+
+def commit_changes() -> dict:
+    """
+    Apply the changes of the active virtual filesystem to disk in one bulk pass.
+
+    Returns:
+        dict: The created directories, the applied moves and the new tree version.
+    """
+    filesystem = filesystem_var.get()
+    if filesystem is None:
+        return {"created": [], "moved": {}}
+
+    try:
+        diff = filesystem.commit(_journal_directory())
+
+        # The disk is the virtual tree now, so it has the same fingerprint
+        if filesystem in _tree_fingerprints:
+            _tree_fingerprints[filesystem.directory] = _tree_fingerprints[filesystem]
+        else:
+            _tree_fingerprints.pop(filesystem.directory, None)
+
+        # Log the result and return the change set
+        logger.info(f"{len(diff.moved)} moves and {len(diff.created)} directories committed successfully")
+        return {
+            "created": [_to_agent_path(path) for path in diff.created],
+            "moved": {_to_agent_path(source): _to_agent_path(destination) for source, destination in diff.moved.items()},
+            "version": tree_version()
+        }
+
+    except Exception as e:
+        logger.error(f"Failed to commit changes: {e}")
+        return {"msg": "Failed to commit changes"}
@@ -0,0 +1,318 @@
+"""
+Tracing and Metrics
+
+This module records where a session spends its time. A Tracer collects spans: one per session, one per
+LLM call of an agent and one per tool call. Each span has its wall time and attributes such as the token
+usage of the completion, the size of the observation and the number of files a tool scanned or moved.
+
+Tracing is off unless a tracer is active. The active tracer and the current span are context variables,
+so concurrent sessions and tool calls on worker threads attach their spans to the right parent.
+
+Usage:
+    tracer = Tracer()
+    with use_tracer(tracer):
+        run_agent_loop(agent, user_message)
+    tracer.export_jsonl("trace.jsonl")
+    print(tracer.summary())
+
+Functions:
+1. use_tracer(tracer): Context manager that activates a tracer in the current context.
+2. current_tracer(): Returns the active tracer, None if tracing is off.
+3. current_span(): Returns the innermost open span of the current context, None if there is none.
+4. span(name, kind, **attributes): Context manager that records a span with the active tracer, if any.
+5. traced(name): Decorator that records a session span around every call of a function or coroutine function.
+6. tool_attributes(result): Returns the attributes of a tool span from the result of the tool.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import json
+import time
+import uuid
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the exported metric names
+METRICS_PREFIX = "react_agent"
+
+# The active tracer and the span the next span is a child of
+_tracer: contextvars.ContextVar["Tracer | None"] = contextvars.ContextVar("tracer", default=None)
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    """A timed operation of a session, e.g. an LLM call or a tool call."""
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    start: float = 0.0
+    seconds: float = 0.0
+    status: str = "ok"
+    attributes: dict = field(default_factory=dict)
+
+
+    def set(self, **attributes) -> None:
+        """Add attributes to the span, an error attribute marks the span as failed."""
+        self.attributes.update(attributes)
+        if "error" in attributes:
+            self.status = "error"
+
+
+class Tracer:
+    """Collects the finished spans of a run and exports them as JSONL, Prometheus metrics or a summary table."""
+    def __init__(self) -> None:
+        """Initializes an empty tracer."""
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attributes):
+        """
+        Record a span around a block, as a child of the current span.
+
+        Args:
+            name: Name of the operation, e.g. the tool name.
+            kind: Kind of the operation: "session", "llm" or "tool".
+            **attributes: Attributes known when the span starts.
+
+        Yields:
+            Span: The span, more attributes can be set on it inside the block.
+        """
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            kind=kind,
+            trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+            start=time.time(),
+            attributes=attributes
+        )
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.seconds = time.perf_counter() - started
+            _current_span.reset(token)
+            with self._lock:
+                self.spans.append(span)
+
+
+    def export_jsonl(self, path: str) -> None:
+        """
+        Write the spans to a JSONL file, one span per line in the order they finished.
+
+        Args:
+            path: The file to write.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        with open(path, "w", encoding="utf-8") as file:
+            for span in spans:
+                file.write(json.dumps(asdict(span), default=str) + "\n")
+        logger.info(f"Wrote {len(spans)} spans to {path}")
+
+
+    def _aggregate(self) -> dict[tuple[str, str], dict]:
+        """Sum the spans per kind and name."""
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            total = totals.setdefault((span.kind, span.name), {"count": 0, "errors": 0, "durations": []})
+            total["count"] += 1
+            total["errors"] += span.status != "ok"
+            total["durations"].append(span.seconds)
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total[key] = total.get(key, 0) + value
+        return totals
+
+
+    def prometheus_metrics(self) -> str:
+        """
+        Render the totals of the spans in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, one family per measurement labelled by kind and name.
+        """
+        totals = self._aggregate()
+        families = {
+            "spans_total": ("counter", "Number of spans", lambda total: total["count"]),
+            "span_errors_total": ("counter", "Number of spans that failed", lambda total: total["errors"]),
+            "span_seconds_total": ("counter", "Wall time of the spans in seconds", lambda total: sum(total["durations"])),
+            "prompt_tokens_total": ("counter", "Prompt tokens of the LLM calls", lambda total: total.get("prompt_tokens")),
+            "completion_tokens_total": ("counter", "Completion tokens of the LLM calls", lambda total: total.get("completion_tokens")),
+            "cached_tokens_total": ("counter", "Prompt tokens served from the prompt cache", lambda total: total.get("cached_tokens")),
+            "llm_cost_dollars_total": ("counter", "Price of the LLM calls routed by a model router", lambda total: total.get("cost_usd")),
+            "observation_bytes_total": ("counter", "Bytes of the tool results in observations", lambda total: total.get("observation_bytes")),
+            "files_scanned_total": ("counter", "Directory entries listed by the tools", lambda total: total.get("files_scanned")),
+            "files_moved_total": ("counter", "Files moved by the tools", lambda total: total.get("files_moved")),
+        }
+
+        lines = []
+        for metric, (metric_type, description, value_of) in families.items():
+            samples = [(labels, value_of(total)) for labels, total in sorted(totals.items())]
+            samples = [(labels, value) for labels, value in samples if value is not None]
+            if not samples:
+                continue
+            name = f"{METRICS_PREFIX}_{metric}"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (kind, span_name), value in samples:
+                lines.append(f'{name}{{kind="{kind}",name="{_escape_label(span_name)}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+
+    def export_prometheus(self, path: str) -> None:
+        """
+        Write the metrics in the Prometheus text format, e.g. for the textfile collector of node_exporter.
+
+        Args:
+            path: The file to write.
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.prometheus_metrics())
+
+
+    def summary(self) -> str:
+        """
+        Build a table of the time, tokens and observation bytes per kind and name of span.
+
+        Returns:
+            str: The table.
+        """
+        header = f"{'span':<32} {'count':>6} {'total s':>9} {'mean ms':>9} {'p95 ms':>9} {'tokens':>9} {'obs bytes':>10} {'files':>8}"
+        lines = [header, "-" * len(header)]
+        for (kind, name), total in sorted(self._aggregate().items(), key=lambda item: -sum(item[1]["durations"])):
+            durations = sorted(total["durations"])
+            p95 = durations[min(len(durations) - 1, int(0.95 * len(durations)))]
+            tokens = total.get("prompt_tokens", 0) + total.get("completion_tokens", 0)
+            files = total.get("files_scanned", 0) + total.get("files_moved", 0)
+            lines.append(
+                f"{f'{kind}:{name}':<32} {total['count']:>6} {sum(durations):>9.3f} "
+                f"{sum(durations) / len(durations) * 1000:>9.1f} {p95 * 1000:>9.1f} "
+                f"{tokens:>9} {total.get('observation_bytes', 0):>10} {files:>8}"
+            )
+        return "\n".join(lines)
+
+
+def _escape_label(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@contextmanager
+def use_tracer(tracer: Tracer | None):
+    """
+    Activate a tracer in the current context.
+
+    Args:
+        tracer: The tracer to record the spans with, None to turn tracing off.
+    """
+    token = _tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _tracer.reset(token)
+
+
+def current_tracer() -> Tracer | None:
+    """Return the active tracer, None if tracing is off."""
+    return _tracer.get()
+
+
+def current_span() -> Span | None:
+    """Return the innermost open span of the current context, None if there is none."""
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, kind: str, **attributes):
+    """
+    Record a span with the active tracer, a no-op if tracing is off.
+
+    Args:
+        name: Name of the operation, e.g. the tool name.
+        kind: Kind of the operation: "session", "llm" or "tool".
+        **attributes: Attributes known when the span starts.
+
+    Yields:
+        Span | None: The span, None if tracing is off.
+    """
+    tracer = _tracer.get()
+    if tracer is None:
+        yield None
+        return
+
+    with tracer.span(name, kind, **attributes) as current:
+        yield current
+
+
+def traced(name: str, kind: str = "session"):
+    """
+    Record a span around every call of the decorated function, which may be a coroutine function.
+
+    Args:
+        name: Name of the span.
+        kind: Kind of the span.
+    """
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, kind):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def tool_attributes(result) -> dict:
+    """
+    Return the span attributes of a tool result: the entries listed, files moved, directories created and duplicate groups found.
+
+    Args:
+        result: The result of a tool.
+
+    Returns:
+        dict: The attributes.
+    """
+    if not isinstance(result, dict):
+        return {}
+    if "msg" in result:
+        return {"error": result["msg"]}
+
+    attributes = {}
+    listed = [contents for key, contents in result.items() if key == "root" or str(key).startswith("root/")]
+    if listed:
+        attributes["files_scanned"] = sum(len(contents) for contents in listed)
+    if "moved" in result:
+        attributes["files_moved"] = len(result["moved"])
+    if "created" in result:
+        attributes["directories_created"] = len(result["created"])
+    if "duplicates" in result:
+        attributes["duplicate_groups"] = len(result["duplicates"])
+    return attributes
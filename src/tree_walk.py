@@ -0,0 +1,113 @@
+"""
+Tree Walk
+
+This module implements the depth-first walk behind get_working_directory, shared by the walk on disk, the
+directory index (see src/index.py) and the virtual filesystem (see src/vfs.py), which only differ in how
+they list one directory. The order is stable: for every directory a marker, then its entries, directories
+first and sorted by name, then its subdirectories in the same order.
+
+Since the order only depends on the names, a walk can resume after any entry without listing the entries
+before it: only the directories on the path to the entry are listed again, to find the subdirectories that
+come after it. The page cursors of get_working_directory are such entries, so a page costs the same wherever
+it is in the tree, and a tree that changes between pages neither repeats nor skips the entries it kept.
+
+The version of a tree is a fingerprint: the sum of the digests of its agent paths modulo 2**64, so it is
+updated by adding and subtracting the digests of the paths that change, without walking the tree again.
+
+Functions:
+1. walk_tree(list_directory, key, depth, after): Yields the entries of a tree in walk order.
+2. path_digest(path): Returns the 64-bit digest of an agent path that tree fingerprints are summed from.
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import hashlib
+from typing import Callable, Iterator
+
+# The entries of a directory: the name, whether it sorts as a directory and whether the walk descends into it
+DirectoryListing = list[tuple[str, bool, bool]]
+
+
+def _resume_stack(
+    list_directory: Callable[[str], DirectoryListing | None],
+    key: str,
+    depth: int | None,
+    after: tuple[str, str, bool]
+) -> list[tuple[str, int, tuple[bool, str] | None]]:
+    """Rebuild the stack of the walk as it was right after an entry."""
+    directory, name, is_dir = after
+    if directory != key and not directory.startswith(f"{key}/"):
+        raise ValueError(f"{directory} is not inside {key}")
+    segments = directory[len(key) + 1:].split("/") if directory != key else []
+    if depth is not None and len(segments) >= depth:
+        raise ValueError(f"{directory} is deeper than {depth} levels")
+
+    stack = []
+    current_key = key
+    for level, segment in enumerate(segments, start=1):
+        # The subdirectories after the one on the path are walked once its subtree is done
+        siblings = [
+            (f"{current_key}/{entry_name}", level + 1, None)
+            for entry_name, _, descend in list_directory(current_key) or []
+            if descend and entry_name > segment and (depth is None or level < depth)
+        ]
+        stack.extend(reversed(siblings))
+        current_key = f"{current_key}/{segment}"
+
+    stack.append((current_key, len(segments) + 1, (not is_dir, name)))
+    return stack
+
+
+def walk_tree(
+    list_directory: Callable[[str], DirectoryListing | None],
+    key: str,
+    depth: int | None = None,
+    after: tuple[str, str, bool] | None = None
+) -> Iterator[tuple[str, str | None]]:
+    """
+    Walk a directory tree depth-first in a stable order.
+
+    For every directory it first yields (directory_key, None) as a marker, so empty directories are
+    reported too, and then (directory_key, name) for each of its entries. Only one directory listing is
+    held at a time.
+
+    Args:
+        list_directory: Returns the entries of a directory by its agent path, directories first and sorted
+            by name, or None if it cannot be listed.
+        key: The agent path of the starting directory (e.g., "root" or "root/photos").
+        depth: Maximum number of directory levels to list, 1 lists only the starting directory.
+        after: The directory, name and type of the entry to resume after, None to walk from the start.
+
+    Yields:
+        tuple: The agent path of a directory and the name of one of its entries or None.
+
+    Raises:
+        ValueError: If the entry to resume after is outside of the walk.
+    """
+    stack = _resume_stack(list_directory, key, depth, after) if after else [(key, 1, None)]
+
+    while stack:
+        current_key, level, resume_after = stack.pop()
+        entries = list_directory(current_key)
+        if entries is None:
+            continue
+
+        # The marker and the entries up to the cursor were on the previous page
+        if resume_after is None:
+            yield current_key, None
+
+        subdirectories = []
+        for name, is_dir, descend in entries:
+            if resume_after is None or (not is_dir, name) > resume_after:
+                yield current_key, name
+            if descend and (depth is None or level < depth):
+                subdirectories.append((f"{current_key}/{name}", level + 1, None))
+
+        # Push in reverse so the subdirectories are visited in sorted order
+        stack.extend(reversed(subdirectories))
+
+
+def path_digest(path: str) -> int:
+    """Return a 64-bit digest of a single agent path."""
+    return int.from_bytes(hashlib.blake2b(path.encode(), digest_size=8).digest(), "big")
@@ -7,20 +7,43 @@ Functions:
 1. initialize_personal_directory(): Initializes a personal test directory for Agent to manipulate.
 2. initialize_developer_directory(): Initializes a developer test directory for Agent to manipulate.
 3. extract_tool(llm_response: str) -> dict: Parses the LLM response and returns the tool name and arguments.
+4. ToolCallStreamParser: Finds the tool calls in a streamed LLM response as soon as each is complete.
+5. estimate_tokens(text: str) -> int: Estimates the number of tokens of a text without a tokenizer.
+6. generate_directory_tree(directory, file_count, depth, fan_out): Generates a large messy tree for benchmarks.
+7. extract_tools(llm_response: str) -> list: Parses every tool call of an LLM response with several Tool lines.
 
 Author: Peyman Kh
-Last Edited: 03-10-2025
+Last Edited: 18-10-2026
 """
 # Import libraries
 import re
 import os
 import ast
+import json
 import shutil
+import reprlib
 import logging
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# Average number of characters per token of English text and paths for OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+# Tool arguments longer or nested deeper than this are rejected instead of parsed
+MAX_TOOL_ARGS_CHARS = 16 * 1024 * 1024
+MAX_TOOL_ARGS_DEPTH = 32
+
+# Precompiled patterns of the tool call parser
+TOOL_CALL_PATTERN = re.compile(r'Tool:\s*(\w+)\(')
+_ARGS_TOKEN_PATTERN = re.compile(r'[()\'"]')
+_STRING_BODY_PATTERNS = {
+    "'": re.compile(r"[^'\\]*(?:\\.[^'\\]*)*", re.DOTALL),
+    '"': re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL),
+}
+_WHITESPACE_PATTERN = re.compile(r'\s*')
+_JSON_DECODER = json.JSONDecoder()
+
 
 def initialize_personal_directory():
     """
@@ -96,39 +119,392 @@ def initialize_developer_directory():
         logger.error(f"Failed to initialize working directory: {e}")
 
 
-def extract_tool(llm_response: str) -> dict:
+# File name stems and extensions the generated benchmark trees are made of
+GENERATED_FILE_TYPES = [
+    ("IMG_{:05d}", ".jpg"),
+    ("scan_{:05d}", ".pdf"),
+    ("report_{:05d}", ".docx"),
+    ("notes_{:05d}", ".txt"),
+    ("script_{:05d}", ".py"),
+    ("data_{:05d}", ".csv"),
+    ("clip_{:05d}", ".mp4"),
+    ("backup_{:05d}", ".zip"),
+]
+
+
+def generate_directory_tree(directory: str, file_count: int, depth: int = 2, fan_out: int = 10) -> dict:
     """
-    This function parses the LLM response and returns the tool name and arguments.
+    Generate a messy test tree of empty files for benchmarks.
+
+    The directories form a tree with fan_out subdirectories per level down to the given depth, and the files
+    are spread evenly over all directories, cycling through common file types.
 
     Args:
-        llm_response (str): The LLM response string.
+        directory: The directory to create, it is removed first if it exists.
+        file_count: Total number of files to create.
+        depth: Number of directory levels below the top directory.
+        fan_out: Number of subdirectories of every directory above the last level.
 
     Returns:
-        dict: A dictionary containing the tool name and arguments.
+        dict: The number of files and directories created.
     """
-    # Regex pattern to extract tool name and arguments
-    pattern = r'Tool:\s*(\w+)\((.*?)\)'
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
 
-    # Search for the pattern in the response
-    match = re.search(pattern, llm_response, re.DOTALL)
+    # Build the directory tree level by level
+    directories = [directory]
+    level = [directory]
+    for current_depth in range(depth):
+        level = [os.path.join(parent, f"folder_{current_depth}_{index}") for parent in level for index in range(fan_out)]
+        directories.extend(level)
+    for path in directories:
+        os.makedirs(path, exist_ok=True)
+
+    # Spread the files round robin, creating them with open() is much cheaper than Path.touch()
+    for number in range(file_count):
+        stem, extension = GENERATED_FILE_TYPES[number % len(GENERATED_FILE_TYPES)]
+        with open(os.path.join(directories[number % len(directories)], stem.format(number) + extension), "w"):
+            pass
+
+    logger.info(f"Generated {file_count} files in {len(directories)} directories")
+    return {"files": file_count, "directories": len(directories)}
 
-    # Return None if no match is found
-    if not match:
-        logger.info("No tool found in the response")
-        return {"tool": None, "args": None}
 
-    tool_name = match.group(1).strip()
-    tool_args = match.group(2).strip()
+def _nesting_depth(value, limit: int) -> int:
+    """Return the nesting depth of containers in a parsed value, stopping once it exceeds the limit."""
+    depth = 0
+    level = [value]
+    while level and depth <= limit:
+        containers = [item for item in level if isinstance(item, (list, tuple, dict))]
+        if not containers:
+            break
+        depth += 1
+        level = []
+        for container in containers:
+            values = container.values() if isinstance(container, dict) else container
+            level.extend(item for item in values if isinstance(item, (list, tuple, dict)))
+    return depth
+
+
+def _parse_arguments(tool_name: str, tool_args: str) -> dict:
+    """
+    Parse the arguments of a tool call and return the tool name and arguments.
+
+    The arguments are parsed as JSON first, which is much faster and lighter than ast.literal_eval on
+    large move_files mappings. Python literals, e.g. single-quoted strings, fall back to ast.literal_eval.
+    Arguments over the size or nesting limits are rejected.
+
+    Args:
+        tool_name (str): The name of the tool.
+        tool_args (str): The text between the parentheses of the tool call.
+
+    Returns:
+        dict: A dictionary containing the tool name and arguments.
+    """
+    tool_args = tool_args.strip()
 
     # Handle empty arguments (no args case)
     if not tool_args:
         logger.info(f"Tool found in the response: {tool_name}()")
         return {"tool": tool_name, "args": None}
 
+    if len(tool_args) > MAX_TOOL_ARGS_CHARS:
+        logger.error(f"Could not parse arguments: {len(tool_args)} characters is over the limit of {MAX_TOOL_ARGS_CHARS}")
+        return {"tool": tool_name, "args": None}
+
     try:
-        parsed_args = ast.literal_eval(tool_args)
-        logger.info(f"Tool found in the response: {tool_name}({parsed_args})")
-        return {"tool": tool_name, "args": parsed_args}
-    except (ValueError, SyntaxError) as e:
-        logger.error(f"Could not parse arguments: {e}")
-        return {"tool": tool_name, "args": None}
\ No newline at end of file
+        # Wrapped in a list, several comma-separated arguments parse as well
+        values = json.loads(f"[{tool_args}]")
+        parsed_args = values[0] if len(values) == 1 else tuple(values)
+    except (ValueError, RecursionError):
+        try:
+            parsed_args = ast.literal_eval(tool_args)
+        except (ValueError, SyntaxError, RecursionError, MemoryError) as e:
+            logger.error(f"Could not parse arguments: {e}")
+            return {"tool": tool_name, "args": None}
+
+    if _nesting_depth(parsed_args, MAX_TOOL_ARGS_DEPTH) > MAX_TOOL_ARGS_DEPTH:
+        logger.error(f"Could not parse arguments: nested deeper than {MAX_TOOL_ARGS_DEPTH} levels")
+        return {"tool": tool_name, "args": None}
+
+    logger.info(f"Tool found in the response: {tool_name}({reprlib.repr(parsed_args)})")
+    return {"tool": tool_name, "args": parsed_args}
+
+
+def _find_call_end(text: str, position: int) -> int | None:
+    """
+    Find the parenthesis that closes a tool call in a single pass.
+
+    Args:
+        text: The response.
+        position: The position right after the opening parenthesis of the call.
+
+    Returns:
+        int: The position of the closing parenthesis, None if the call is not closed.
+    """
+    depth = 1
+    while True:
+        # Jump straight to the next parenthesis or quote, everything in between is irrelevant
+        match = _ARGS_TOKEN_PATTERN.search(text, position)
+        if match is None:
+            return None
+        token = match.group()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+            if depth == 0:
+                return match.start()
+        else:
+            # Skip the quoted string, parentheses inside file names don't count
+            position = _STRING_BODY_PATTERNS[token].match(text, match.end()).end()
+            if position == len(text):
+                return None
+            position += 1
+            continue
+        position = match.end()
+
+
+def _next_tool_call(text: str, position: int = 0) -> tuple[dict, int] | None:
+    """
+    Find and parse the next tool call of a response.
+
+    Args:
+        text: The response.
+        position: The position to search from.
+
+    Returns:
+        tuple: The tool call and the position after its closing parenthesis, None if there is no complete call.
+    """
+    match = TOOL_CALL_PATTERN.search(text, position)
+    if match is None:
+        return None
+    tool_name = match.group(1)
+
+    # Only a response longer than the limit can hold oversized arguments, they are measured before any decoding
+    end = None
+    if len(text) - match.end() > MAX_TOOL_ARGS_CHARS:
+        end = _find_call_end(text, match.end())
+        if end is None:
+            logger.error(f"Tool call {tool_name}( is not closed")
+            return None
+        if end - match.end() > MAX_TOOL_ARGS_CHARS:
+            logger.error(f"Could not parse arguments: {end - match.end()} characters is over the limit of {MAX_TOOL_ARGS_CHARS}")
+            return {"tool": tool_name, "args": None}, end + 1
+
+    # JSON fast path: decode the arguments in place, one value after the other
+    values = []
+    position = _WHITESPACE_PATTERN.match(text, match.end()).end()
+    try:
+        while text[position:position + 1] != ")":
+            if values:
+                if text[position:position + 1] != ",":
+                    raise ValueError("expected a comma between arguments")
+                position = _WHITESPACE_PATTERN.match(text, position + 1).end()
+            value, position = _JSON_DECODER.raw_decode(text, position)
+            values.append(value)
+            position = _WHITESPACE_PATTERN.match(text, position).end()
+        if values and _nesting_depth(values, MAX_TOOL_ARGS_DEPTH + 1) <= MAX_TOOL_ARGS_DEPTH + 1:
+            parsed_args = values[0] if len(values) == 1 else tuple(values)
+            logger.info(f"Tool found in the response: {tool_name}({reprlib.repr(parsed_args)})")
+            return {"tool": tool_name, "args": parsed_args}, position + 1
+    except (ValueError, RecursionError, IndexError):
+        pass
+
+    # Anything else, e.g. Python literals or empty arguments, is delimited first and parsed on its own
+    if end is None:
+        end = _find_call_end(text, match.end())
+    if end is None:
+        logger.error(f"Tool call {tool_name}( is not closed")
+        return None
+    return _parse_arguments(tool_name, text[match.end():end]), end + 1
+
+
+def extract_tool(llm_response: str) -> dict:
+    """
+    This function parses the LLM response and returns the tool name and arguments.
+
+    Args:
+        llm_response (str): The LLM response string.
+
+    Returns:
+        dict: A dictionary containing the tool name and arguments.
+    """
+    found = _next_tool_call(llm_response)
+
+    # Return None if no tool call is found
+    if found is None:
+        logger.info("No tool found in the response")
+        return {"tool": None, "args": None}
+
+    return found[0]
+
+
+class ToolCallStreamParser:
+    """
+    Incrementally finds the tool calls in a streamed LLM response.
+
+    Text is fed chunk by chunk as it arrives. Once a "Tool: name(" prefix is seen, the parser keeps
+    track of the parenthesis depth and of quoted strings across chunks, so parentheses inside file
+    names don't end the call early and no chunk is scanned twice. After a call is complete the parser
+    looks for the next one, so a response with several Tool lines yields each call as soon as it ends.
+    """
+    _tool_pattern = TOOL_CALL_PATTERN
+
+    def __init__(self) -> None:
+        """Initializes an empty parser."""
+        self.tool_calls = []
+        self.end = None
+        self._chunks = []
+        self._length = 0
+        self._head = ""
+        self._head_start = 0
+        self._search_from = 0
+        self._tool_name = None
+        self._args_parts = []
+        self._depth = 1
+        self._quote = None
+        self._escaped = False
+
+
+    @property
+    def text(self) -> str:
+        """The response received so far."""
+        return "".join(self._chunks)
+
+
+    @property
+    def tool_call(self) -> dict | None:
+        """The first complete tool call, None if there is none yet."""
+        return self.tool_calls[0] if self.tool_calls else None
+
+
+    def feed(self, text: str) -> list[dict]:
+        """
+        Add the next chunk of the response.
+
+        Args:
+            text: The next chunk of the response.
+
+        Returns:
+            list: The tool calls completed by this chunk, in order.
+        """
+        completed = []
+        self._chunks.append(text)
+        start = self._length
+        self._length += len(text)
+
+        while text:
+            if self._tool_name is None:
+                # Only the text after the previous call is searched, which is a short Think step
+                self._head += text
+                match = self._tool_pattern.search(self._head, self._search_from)
+                if not match:
+                    # "Tool:" may be split across chunks, so keep a short tail for the next search
+                    self._search_from = max(0, len(self._head) - 64)
+                    return completed
+                self._tool_name = match.group(1)
+                start = self._head_start + match.end()
+                text = self._head[match.end():]
+
+            end = self._scan(text)
+            if end is None:
+                self._args_parts.append(text)
+                return completed
+
+            self._args_parts.append(text[:end])
+            self.end = start + end + 1
+            tool_call = _parse_arguments(self._tool_name, "".join(self._args_parts))
+            self.tool_calls.append(tool_call)
+            completed.append(tool_call)
+
+            # Look for the next call in the rest of the chunk
+            self._tool_name = None
+            self._args_parts = []
+            self._depth = 1
+            self._head = ""
+            self._head_start = self.end
+            self._search_from = 0
+            text = text[end + 1:]
+            start = self.end
+
+        return completed
+
+
+    def _scan(self, text: str) -> int | None:
+        """
+        Scan the next piece of the arguments, jumping from one quote or parenthesis to the next.
+
+        Args:
+            text: The piece of the arguments.
+
+        Returns:
+            int: The position of the parenthesis that closes the call, None if it is not in this piece.
+        """
+        position = 0
+        if self._escaped:
+            # The previous piece ended with a backslash inside a string
+            self._escaped = False
+            position = 1
+
+        while position < len(text):
+            if self._quote is not None:
+                position = _STRING_BODY_PATTERNS[self._quote].match(text, position).end()
+                if position == len(text):
+                    return None
+                if text[position] == "\\":
+                    self._escaped = position + 1 == len(text)
+                    position += 2
+                    continue
+                self._quote = None
+                position += 1
+                continue
+
+            match = _ARGS_TOKEN_PATTERN.search(text, position)
+            if match is None:
+                return None
+            token = match.group()
+            position = match.end()
+            if token == "(":
+                self._depth += 1
+            elif token == ")":
+                self._depth -= 1
+                if self._depth == 0:
+                    return match.start()
+            else:
+                self._quote = token
+        return None
+
+
+def extract_tools(llm_response: str) -> list[dict]:
+    """
+    This function parses the LLM response and returns every tool call in it.
+
+    Args:
+        llm_response (str): The LLM response string.
+
+    Returns:
+        list: The tool calls in the order of the response, each with the tool name and arguments.
+    """
+    tool_calls = []
+    position = 0
+    while (found := _next_tool_call(llm_response, position)) is not None:
+        tool_call, position = found
+        tool_calls.append(tool_call)
+
+    if not tool_calls:
+        logger.info("No tool found in the response")
+    return tool_calls
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text without a tokenizer.
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,493 @@
+"""
+Virtual Filesystem
+
+This module holds a working directory as an in-memory tree, so the agent can explore it and simulate a whole
+plan without touching the disk. The tree is loaded from a single scan, and from then on the tools (see
+use_virtual_filesystem in src/tools.py) list, create and move entries in memory only. The nodes have
+__slots__ and their names are interned, since the same segments repeat all over a tree (e.g. "2023" or
+"invoices"), which keeps a tree of a million entries small.
+
+The paths are disk paths under the loaded directory, and scan() and move() behave like the walk and the move
+engine of the tools, including the validation and error messages of a batch, so a simulated run takes the
+same decisions as a real one. Every node remembers where it was loaded from, so the difference to the disk
+is known at any time:
+- diff() returns the directories to create and the entries to move. It is the net of all steps: a file moved
+  twice is moved once, and a directory moved with its contents is a single move. This is the dry run preview.
+- commit() applies the diff in one bulk pass: the moved entries are renamed into a staging directory next to
+  the working directory, and then to their final paths, in batches of the move engine. Staging makes swaps
+  and entries moved out of moved directories safe without ordering the moves. A failed batch rolls back the
+  whole commit.
+
+Usage:
+    with use_virtual_filesystem(VirtualFileSystem("working_directory")):
+        run_agent_loop(agent, user_message)
+        print(preview_changes())
+        commit_changes()
+
+Author: Peyman Kh
+Last Edited: 18-10-2026
+"""
+# Import libraries
+import os
+import sys
+import logging
+import threading
+from typing import Iterator
+from dataclasses import dataclass, field
+
+from src.tree_walk import walk_tree
+from src.move_engine import MoveEngine, MoveOperation, MoveResult
+
+logger = logging.getLogger(__name__)
+
+
+class VirtualNode:
+    """A file or directory of the virtual tree, children is None for anything that is not a directory."""
+    __slots__ = ("name", "parent", "children", "origin_parent", "origin_name")
+
+    def __init__(self, name: str, parent: "VirtualNode | None", children: dict | None, loaded: bool = True) -> None:
+        """
+        Initializes the node.
+
+        Args:
+            name: The interned name of the entry.
+            parent: The directory the entry is in, None for the root.
+            children: The entries of a directory by name, None for a file.
+            loaded: True if the entry exists on disk, False for a directory created in memory.
+        """
+        self.name = name
+        self.parent = parent
+        self.children = children
+        # Where the entry is on disk, None for directories created in memory
+        self.origin_parent = parent if loaded else None
+        self.origin_name = name if loaded else None
+
+
+    @property
+    def moved(self) -> bool:
+        """Check if the entry exists on disk and was moved away from its parent or renamed."""
+        return self.origin_name is not None and (self.parent is not self.origin_parent or self.name != self.origin_name)
+
+
+@dataclass
+class VirtualDiff:
+    """The changes between the disk and the virtual tree, as disk paths."""
+    created: list[str] = field(default_factory=list)
+    moved: dict[str, str] = field(default_factory=dict)
+
+
+    @property
+    def empty(self) -> bool:
+        """Check if the virtual tree is the same as the disk."""
+        return not self.created and not self.moved
+
+
+class VirtualFileSystem:
+    """An in-memory model of a directory tree that keeps track of the changes to apply to disk."""
+    def __init__(self, directory: str) -> None:
+        """
+        Initializes the virtual filesystem with one scan of the directory.
+
+        Args:
+            directory: The directory on disk to load.
+        """
+        self.directory = os.path.normpath(directory)
+        self.entries = 0
+        self.root = self._load()
+        self._lock = threading.RLock()
+        logger.info(f"Loaded {self.entries} entries of {self.directory} into memory")
+
+
+    def _load(self) -> VirtualNode:
+        """Build the tree of the directory, symbolic links are leaves like files."""
+        root = VirtualNode(self.directory, None, {})
+        stack = [(self.directory, root)]
+        while stack:
+            path, node = stack.pop()
+            try:
+                with os.scandir(path) as iterator:
+                    for entry in iterator:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        child = VirtualNode(sys.intern(entry.name), node, {} if is_dir else None)
+                        node.children[child.name] = child
+                        self.entries += 1
+                        if is_dir:
+                            stack.append((entry.path, child))
+            except OSError as e:
+                logger.debug(f"Skipping {path}: {e}")
+        return root
+
+
+    def _segments(self, path: str) -> list[str] | None:
+        """Split a disk path into the names below the root, None if it is outside of the tree."""
+        path = os.path.normpath(path)
+        if path == self.directory:
+            return []
+        if path.startswith(self.directory + os.sep):
+            return path[len(self.directory) + 1:].split(os.sep)
+        return None
+
+
+    def _lookup(self, path: str) -> VirtualNode | None:
+        """Return the node of a disk path, None if there is no such entry."""
+        segments = self._segments(path)
+        if segments is None:
+            return None
+        node = self.root
+        for segment in segments:
+            if node.children is None:
+                return None
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+
+    def _path(self, node: VirtualNode) -> str:
+        """Return the path of a node in the virtual tree."""
+        names = []
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+        return os.path.join(self.directory, *reversed(names))
+
+
+    def _origin_path(self, node: VirtualNode) -> str | None:
+        """Return the path of a node on disk, None for directories created in memory."""
+        if node.origin_name is None:
+            return None
+        names = []
+        while node.origin_parent is not None:
+            names.append(node.origin_name)
+            node = node.origin_parent
+        return os.path.join(self.directory, *reversed(names))
+
+
+    def exists(self, path: str) -> bool:
+        """Check if an entry exists in the virtual tree."""
+        with self._lock:
+            return self._lookup(path) is not None
+
+
+    def isdir(self, path: str) -> bool:
+        """Check if an entry of the virtual tree is a directory."""
+        with self._lock:
+            node = self._lookup(path)
+            return node is not None and node.children is not None
+
+
+    def origin(self, path: str) -> str | None:
+        """
+        Return where an entry of the virtual tree is on disk, to read its content.
+
+        Args:
+            path: The path of the entry in the virtual tree.
+
+        Returns:
+            str | None: The path on disk, None if there is no such entry or it was created in memory.
+        """
+        with self._lock:
+            node = self._lookup(path)
+            return None if node is None else self._origin_path(node)
+
+
+    def files(self, path: str) -> dict[str, str]:
+        """
+        Return the files below a directory of the virtual tree with where they are on disk.
+
+        Args:
+            path: The directory in the virtual tree.
+
+        Returns:
+            dict: The path on disk of every file by its path in the virtual tree.
+        """
+        files = {}
+        with self._lock:
+            node = self._lookup(path)
+            if node is None or node.children is None:
+                return files
+            stack = [(node, os.path.normpath(path))]
+            while stack:
+                directory, directory_path = stack.pop()
+                for child in directory.children.values():
+                    child_path = os.path.join(directory_path, child.name)
+                    if child.children is not None:
+                        stack.append((child, child_path))
+                    else:
+                        files[child_path] = self._origin_path(child)
+        return files
+
+
+    def makedirs(self, path: str) -> None:
+        """
+        Create a directory and its missing parents in memory, like os.makedirs with exist_ok.
+
+        Args:
+            path: The directory to create.
+        """
+        segments = self._segments(path)
+        if segments is None:
+            raise ValueError(f"{path} is outside of {self.directory}")
+
+        with self._lock:
+            node = self.root
+            for segment in segments:
+                child = node.children.get(segment)
+                if child is None:
+                    child = VirtualNode(sys.intern(segment), node, {}, loaded=False)
+                    node.children[child.name] = child
+                    self.entries += 1
+                elif child.children is None:
+                    raise FileExistsError(f"{self._path(child)} exists and is not a directory")
+                node = child
+
+
+    def scan(
+        self,
+        path: str,
+        key: str,
+        depth: int | None = None,
+        after: tuple[str, str, bool] | None = None
+    ) -> Iterator[tuple[str, str | None]]:
+        """
+        Walk a directory of the virtual tree in the same order and format as the walk of the tools on disk.
+
+        Args:
+            path: The directory to start from.
+            key: The agent path of the starting directory.
+            depth: Maximum number of directory levels to list, 1 lists only the starting directory.
+            after: The directory, name and type of the entry to resume after, None to walk from the start.
+
+        Yields:
+            tuple: The agent path of a directory and the name of one of its entries, or None as a marker.
+        """
+        with self._lock:
+            node = self._lookup(path)
+        if node is None or node.children is None:
+            return
+
+        def list_directory(directory_key: str) -> list[tuple[str, bool, bool]] | None:
+            with self._lock:
+                directory = node
+                for segment in directory_key[len(key) + 1:].split("/") if directory_key != key else []:
+                    directory = (directory.children or {}).get(segment)
+                    if directory is None or directory.children is None:
+                        return None
+                entries = [(child.name, child.children is not None) for child in directory.children.values()]
+            entries.sort(key=lambda entry: (not entry[1], entry[0]))
+            return [(name, is_dir, is_dir) for name, is_dir in entries]
+
+        yield from walk_tree(list_directory, key, depth, after)
+
+
+    def move(self, file_map: dict[str, str]) -> MoveResult:
+        """
+        Validate and apply a batch of moves in memory, with the rules of the move engine.
+
+        Args:
+            file_map: A dictionary of source paths as keys and destination paths as values.
+
+        Returns:
+            MoveResult: The applied moves, or the errors if the batch was rejected.
+        """
+        with self._lock:
+            operations = []
+            placements = []
+            errors = {}
+            claimed = {}
+
+            # Many moves share a destination directory, so only look up each directory once
+            directory_cache = {}
+
+            def lookup_directory(path: str) -> VirtualNode | None:
+                if path not in directory_cache:
+                    directory_cache[path] = self._lookup(path)
+                return directory_cache[path]
+
+            for source, destination in file_map.items():
+                source = os.path.normpath(source)
+                destination = os.path.normpath(destination)
+
+                node = self._lookup(source)
+                if node is None:
+                    errors[source] = "source does not exist"
+                    continue
+
+                target = lookup_directory(destination)
+                if target is not None and target.children is not None:
+                    final = os.path.join(destination, node.name)
+                    parent = target
+                else:
+                    final = destination
+                    parent = lookup_directory(os.path.dirname(final))
+                name = os.path.basename(final)
+                is_dir = node.children is not None
+
+                if node is self.root or self._segments(final) is None:
+                    errors[source] = "cannot move entries out of the working directory"
+                elif final == source:
+                    errors[source] = "destination is the same as the source"
+                elif is_dir and final.startswith(source + os.sep):
+                    errors[source] = "cannot move a directory into itself"
+                elif parent is None or parent.children is None:
+                    errors[source] = "destination directory does not exist"
+                elif name in parent.children:
+                    errors[source] = "destination already exists"
+                elif final in claimed:
+                    errors[source] = "destination collides with another move in the batch"
+                else:
+                    claimed[final] = source
+                    operations.append(MoveOperation(source, final, is_dir))
+                    placements.append((node, parent, sys.intern(name)))
+
+            # The same batches are rejected as on disk, so a simulated run takes the same decisions
+            moved_directories = {operation.source for operation in operations if operation.is_dir}
+            if moved_directories:
+                for operation in operations:
+                    for path in (os.path.dirname(operation.source), os.path.dirname(operation.destination)):
+                        ancestor = path
+                        while ancestor and ancestor != os.path.dirname(ancestor):
+                            if ancestor in moved_directories:
+                                errors[operation.source] = "depends on a directory that is moved in the same batch"
+                                break
+                            ancestor = os.path.dirname(ancestor)
+
+            if errors:
+                return MoveResult(errors=errors)
+
+            for node, parent, name in placements:
+                del node.parent.children[node.name]
+                node.parent, node.name = parent, name
+                parent.children[name] = node
+            return MoveResult(moved=operations)
+
+
+    def _walk(self) -> Iterator[VirtualNode]:
+        """Yield every node below the root, parents before their children."""
+        stack = list(self.root.children.values())
+        while stack:
+            node = stack.pop()
+            yield node
+            if node.children is not None:
+                stack.extend(node.children.values())
+
+
+    def diff(self) -> VirtualDiff:
+        """
+        Return the changes between the disk and the virtual tree.
+
+        Returns:
+            VirtualDiff: The directories to create and the moves to apply, the entries inside a moved
+                directory are moved with it and not listed.
+        """
+        diff = VirtualDiff()
+        with self._lock:
+            for node in self._walk():
+                if node.origin_name is None:
+                    diff.created.append(self._path(node))
+                elif node.moved:
+                    diff.moved[self._origin_path(node)] = self._path(node)
+        diff.created.sort()
+        diff.moved = dict(sorted(diff.moved.items()))
+        return diff
+
+
+    @staticmethod
+    def _moved_ancestors(node: VirtualNode, parent_slot: str) -> int:
+        """Count the moved entries above a node, following either its current or its original parents."""
+        count = 0
+        node = getattr(node, parent_slot)
+        while node is not None:
+            count += node.moved
+            node = getattr(node, parent_slot)
+        return count
+
+
+    def commit(self, journal_directory: str) -> VirtualDiff:
+        """
+        Apply the changes of the virtual tree to disk in one bulk pass.
+
+        The moved entries are detached into a staging directory, the innermost first, so every source is
+        still where it was loaded from. They are then attached at their final paths, the outermost first,
+        after the new directories they go into. Each round is one batch of the move engine.
+
+        Args:
+            journal_directory: The directory the move engine writes its journals to.
+
+        Returns:
+            VirtualDiff: The applied changes.
+
+        Raises:
+            OSError: If a batch failed, the batches that were already applied are rolled back.
+        """
+        with self._lock:
+            diff = self.diff()
+            if diff.empty:
+                return diff
+
+            parent, name = os.path.split(self.directory)
+            staging = os.path.join(parent, f".{name}.staging")
+            engine = MoveEngine(journal_directory=journal_directory)
+            applied = []
+            created = []
+
+            def apply(batch: dict[str, str]) -> None:
+                if not batch:
+                    return
+                result = engine.move(batch)
+                if not result.ok:
+                    raise OSError(f"{len(result.errors)} moves failed, e.g. {next(iter(result.errors.items()))}")
+                applied.append(batch)
+
+            moved = [node for node in self._walk() if node.moved]
+            staged = {node: os.path.join(staging, str(number)) for number, node in enumerate(moved)}
+
+            try:
+                os.makedirs(staging, exist_ok=True)
+
+                # Detach: an entry is moved out before the moved directories it was loaded in
+                by_origin = {}
+                for node in moved:
+                    by_origin.setdefault(self._moved_ancestors(node, "origin_parent"), []).append(node)
+                for level in sorted(by_origin, reverse=True):
+                    apply({self._origin_path(node): staged[node] for node in by_origin[level]})
+
+                # Attach: an entry is moved in after the moved or new directories it goes into
+                rounds = {}
+                for node in self._walk():
+                    if node.origin_name is None or node.moved:
+                        rounds.setdefault(self._moved_ancestors(node, "parent"), []).append(node)
+                for level in sorted(rounds):
+                    batch = {}
+                    for node in rounds[level]:
+                        if node.origin_name is None:
+                            path = self._path(node)
+                            if not os.path.isdir(path):
+                                os.mkdir(path)
+                                created.append(path)
+                        else:
+                            batch[staged[node]] = self._path(node)
+                    apply(batch)
+
+            except Exception:
+                for batch in reversed(applied):
+                    engine.move({destination: source for source, destination in batch.items()})
+                for path in reversed(created):
+                    try:
+                        os.rmdir(path)
+                    except OSError as e:
+                        logger.error(f"Failed to remove {path} while rolling back: {e}")
+                raise
+
+            finally:
+                try:
+                    os.rmdir(staging)
+                except OSError as e:
+                    logger.error(f"Failed to remove the staging directory {staging}: {e}")
+
+            # The disk is the virtual tree now
+            for node in self._walk():
+                node.origin_parent, node.origin_name = node.parent, node.name
+
+        logger.info(f"Committed {len(diff.moved)} moves and {len(diff.created)} new directories to {self.directory}")
+        return diff